@@ -1,20 +1,189 @@
-from typing import List
-from os import environ
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import json
+import logging
+import threading
+import time
+from typing import Iterable, Iterator, List, Tuple
+from urllib.parse import urlencode
+from os import cpu_count
+import botocore.exceptions
 import requests
 
 # import local modules
+from artifact_backup import clients
+from artifact_backup import config
+from artifact_backup import counters
+from artifact_backup import download
+from artifact_backup import integrity
+from artifact_backup import maven_metadata
+from artifact_backup import metrics
+from artifact_backup import routing
+from artifact_backup import sessions
+from artifact_backup import storage
+from artifact_backup import token_cache
+from artifact_backup import transfer
 from model.aws.code_artifact import Marshaller
 from model.aws.code_artifact import AWSEvent
 from model.aws.code_artifact import CodeArtifactChangeNotification
 
-# Initialise outside of handler to avoid cold start
-ca_client = boto3.client("codeartifact")
-s3_client = boto3.client("s3")
+logger = logging.getLogger(__name__)
+
+# Clients are created on first use from botocore directly, so that importing the handler doesn't load boto3,
+# s3transfer or botocore's service models.
+# Set EAGER_CLIENTS to create them during initialisation instead, for example with provisioned concurrency.
+ca_client = None
+s3_client = None
+# S3 clients pinned to the regions of replica buckets, by region
+regional_s3_clients = {}
+_client_lock = threading.Lock()
+# Pooled keep-alive session, warm invocations and concurrent asset downloads reuse its connections
+codeartifact_session = sessions.create_session(
+    # Every asset in flight may download its ranges at once, urllib3 discards connections beyond the pool
+    pool_size=config.get_int(
+        "HTTP_POOL_SIZE", max(10, config.get_concurrent_assets() * config.get_int("RANGED_DOWNLOAD_CONCURRENCY", 4))
+    ),
+    max_retries=config.get_int("HTTP_MAX_RETRIES", 3),
+    backoff_factor=config.get_float("HTTP_BACKOFF_FACTOR", 0.5),
+)
+# Backup keys by bucket and SHA-256 recorded or looked up by this container, in front of the index in the bucket
+backed_up_copies = {}
+# Package level maven-metadata.xml backups last written or read by this container, with their ETags
+package_metadata = maven_metadata.MetadataCache(config.get_int("PACKAGE_METADATA_CACHE_SIZE", 256))
+
+
+def get_auth_token_refresh_seconds() -> int:
+    """How long before expiry a cached auth token is replaced, at most half its lifetime so the cache is never bypassed"""
+    return min(config.get_int("AUTH_TOKEN_REFRESH_SECONDS", 900), config.get_int("AUTH_TOKEN_DURATION_SECONDS", 43200) // 2)
+
+
+# CodeArtifact auth tokens per domain and owner, valid for up to 12 hours so they are reused across invocations
+authorization_tokens = token_cache.TokenCache(refresh_margin_seconds=get_auth_token_refresh_seconds())
+
+
+def get_ca_client():
+    """The CodeArtifact client, created on first use"""
+    global ca_client
+    if ca_client is None:
+        with _client_lock:
+            if ca_client is None:
+                ca_client = clients.create_client("codeartifact")
+    return ca_client
+
+
+def get_s3_client(region: str = None):
+    """The S3 client, created on first use, or the client pinned to region when one is given"""
+    global s3_client
+    if region is not None:
+        if region not in regional_s3_clients:
+            with _client_lock:
+                if region not in regional_s3_clients:
+                    regional_s3_clients[region] = clients.create_client("s3", region_name=region)
+        return regional_s3_clients[region]
+
+    if s3_client is None:
+        with _client_lock:
+            if s3_client is None:
+                s3_client = clients.create_client("s3")
+    return s3_client
+
+
+if config.get_bool("EAGER_CLIENTS", False):
+    get_ca_client()
+    get_s3_client()
 
 
 def lambda_handler(event, context):  # pylint: disable=unused-argument
     """Entrypoint into the function"""
+    return process_event(event)
+
+
+def sqs_batch_handler(event, context):  # pylint: disable=unused-argument
+    """Entrypoint for SQS delivered batches of events, the events are backed up concurrently and failed messages reported"""
+    records = event["Records"]
+    if not records:
+        return {"batchItemFailures": []}
+
+    if config.get_bool("COALESCE_EVENTS", True):
+        record_groups = coalesce_records(records)
+        if len(record_groups) < len(records):
+            logger.info("Coalesced %d events into %d backups", len(records), len(record_groups))
+    else:
+        record_groups = [[record] for record in records]
+
+    # Events take turns between their targets, so a busy repository doesn't hold up the others in the batch
+    max_workers = max(1, min(config.get_int("EVENT_WORKERS", 4), len(record_groups)))
+    futures = routing.run_fairly(
+        [
+            (get_record_target(record_group[0]), lambda record=record_group[0]: process_sqs_record(record))
+            for record_group in record_groups
+        ],
+        max_workers,
+    )
+
+    # Only the failed messages are returned to the queue, the rest of the batch is deleted. Coalesced messages
+    # share the outcome of the backup that covered them.
+    batch_item_failures = []
+    for record_group, future in zip(record_groups, futures):
+        error = future.exception()
+        if error is not None:
+            logger.error("Failed to process message %s: %r", record_group[0]["messageId"], error)
+            batch_item_failures.extend({"itemIdentifier": record["messageId"]} for record in record_group)
+
+    return {"batchItemFailures": batch_item_failures}
+
+
+def coalesce_records(records: List[dict]) -> List[List[dict]]:
+    """Group the records of a batch that change the same package version, with the latest change first in each group
+
+    A burst of updates to one version, such as assets being added one at a time by a CI pipeline, is then backed
+    up once from its final state. The latest change has the highest sequence number, and ties go to the record
+    delivered last.
+    """
+    record_groups = {}
+    for position, record in enumerate(records):
+        key, sequence_number = get_coalescing_key(record)
+        record_groups.setdefault(key, []).append((sequence_number, position, record))
+
+    return [
+        [record for _, _, record in sorted(record_group, key=lambda entry: entry[:2], reverse=True)]
+        for record_group in record_groups.values()
+    ]
+
+
+def get_coalescing_key(record: dict) -> Tuple[tuple, int]:
+    """The package version an SQS record changes and the sequence number of the change, a record that can't be read is its own group"""
+    try:
+        detail = json.loads(record["body"])["detail"]
+        key = (
+            detail["domainName"],
+            detail["repositoryName"],
+            detail["packageFormat"],
+            detail.get("packageNamespace"),
+            detail["packageName"],
+            detail["packageVersion"],
+        )
+        return key, int(detail.get("sequenceNumber") or 0)
+    except (ValueError, KeyError, TypeError):
+        return ("message", record["messageId"]), 0
+
+
+def get_record_target(record: dict) -> routing.Target:
+    """The target of the repository an SQS record changes, the default target for a record that can't be read"""
+    try:
+        detail = json.loads(record["body"])["detail"]
+        return routing.get_target(detail["domainName"], detail["repositoryName"])
+    except (ValueError, KeyError, TypeError):
+        return routing.get_routing_table().default
+
+
+def process_sqs_record(record: dict) -> dict:
+    """Back up the EventBridge event carried in the body of an SQS message"""
+    return process_event(json.loads(record["body"]))
+
+
+def process_event(event: dict) -> dict:
+    """Validate a CodeArtifact state change event and back up the package version it refers to"""
     # Deserialize event into strongly typed object
     aws_event: AWSEvent = Marshaller.unmarshall(event, AWSEvent)
     code_artifact_notification: CodeArtifactChangeNotification = aws_event.detail
@@ -28,97 +197,834 @@ def lambda_handler(event, context):  # pylint: disable=unused-argument
         raise ValueError("This function only supports maven package format. Package format used: " + code_artifact_notification.package_format, event)
 
 
+    # Back up every asset of the package version, failing the invocation if any asset could not be copied
+    bucket = routing.get_target(code_artifact_notification.domain_name, code_artifact_notification.repository_name).bucket
+    asset_results = backup_package_version(aws_event, bucket) if has_assets(code_artifact_notification) else []
+    failed_results = [result for result in asset_results if result["status"] == "FAILED"]
+
+    # Return event for further processing
+    response = Marshaller.marshall(aws_event)
+    response["assets"] = asset_results
+    # A removed version leaves the package metadata even when tagging one of its backups failed
+    removed = code_artifact_notification.package_version_state in maven_metadata.REMOVED_STATES
+    if config.get_bool("BACKUP_PACKAGE_METADATA", True) and (removed or not failed_results):
+        response["packageMetadata"] = backup_package_metadata(aws_event, bucket)
+
+    if failed_results:
+        raise ValueError("Backup failed for " + str(len(failed_results)) + " of " + str(len(asset_results)) + " assets:", failed_results)
+    return response
+
+
+def has_assets(code_artifact_notification: CodeArtifactChangeNotification) -> bool:
+    """Whether CodeArtifact still holds the assets of the version, disposed and deleted versions only leave their backups"""
+    return code_artifact_notification.package_version_state not in ("Disposed", "Deleted")
+
+
+def serves_assets(code_artifact_notification: CodeArtifactChangeNotification) -> bool:
+    """Whether the assets of the version can be downloaded, archived versions keep their assets without serving them"""
+    return code_artifact_notification.package_version_state != "Archived" and has_assets(code_artifact_notification)
+
+
+def backup_package_version(aws_event: AWSEvent, bucket: str) -> List[dict]:
+    """Copy every asset of the package version to S3 concurrently, returning one result per asset"""
+    code_artifact_notification: CodeArtifactChangeNotification = aws_event.detail
+
     # Construct the URL and headers to download the package
-    authentication_header = get_user_authentication_header(code_artifact_notification.domain_name)
-    package_locations = get_package_locations(code_artifact_notification)
+    start = time.perf_counter()
+    authentication_header = get_user_authentication_header(code_artifact_notification.domain_name, code_artifact_notification.domain_owner)
+    stats = {"authTokenSeconds": time.perf_counter() - start, "listAssetsSeconds": 0.0}
+    package_assets = []
+    futures = []
 
-    # This will be one jar file with the current implementation of CodeArtifact
-    for package_location in package_locations:
+    # Assets are submitted as each page of the listing arrives, so copies start before the listing finishes
+    with ThreadPoolExecutor(max_workers=max(1, config.get_int("ASSET_WORKERS", 4))) as executor:
+        for package_asset in metrics.timed_iter(get_package_assets(code_artifact_notification), stats, "listAssetsSeconds"):
+            package_assets.append(package_asset)
+            futures.append(
+                executor.submit(backup_asset, code_artifact_notification, aws_event, package_asset, authentication_header, bucket)
+            )
 
-        url = get_full_url(code_artifact_notification, aws_event, package_location)
+    asset_results = []
+    for package_asset, future in zip(package_assets, futures):
+        package_location = package_asset["location"]
+        asset_result = {"location": package_location, "key": get_backup_key(code_artifact_notification, package_location)}
+        error = future.exception()
+        if error is None:
+            asset_result["status"] = "SUCCEEDED"
+            asset_result.update(future.result())
+        else:
+            asset_result["status"] = "FAILED"
+            asset_result["error"] = repr(error)
+        asset_results.append(asset_result)
 
-        # Request the archive file from CodeArtifact
-        get_archive_response = get_archive(url, authentication_header)
+    emit_backup_metrics(code_artifact_notification, stats, asset_results, time.perf_counter() - start)
+    return asset_results
+
+
+def backup_package_metadata(aws_event: AWSEvent, bucket: str, list_only: bool = False) -> dict:
+    """Merge the version of the event into the backup of the package's maven-metadata.xml
+
+    The backup is updated in place with a conditional write, so concurrent events for the same package don't
+    overwrite each other, and the container keeps the document it last wrote so the next version of a hot
+    package merges without reading it again. CodeArtifact is only asked for the document when the bucket has none.
+    With list_only the version is added or removed without the event time moving latest, release or lastUpdated.
+    """
+    code_artifact_notification: CodeArtifactChangeNotification = aws_event.detail
+    key = get_backup_key(code_artifact_notification, get_package_path(code_artifact_notification) + "/maven-metadata.xml")
+
+    for _ in range(config.get_int("PACKAGE_METADATA_ATTEMPTS", 5)):
+        cached = package_metadata.get(key)
+        etag, content = cached if cached is not None else read_package_metadata(aws_event, bucket, key)
+
+        merged = maven_metadata.merge(
+            content,
+            code_artifact_notification.package_namespace,
+            code_artifact_notification.package_name,
+            code_artifact_notification.package_version,
+            code_artifact_notification.package_version_state,
+            None if list_only else aws_event.time,
+        )
+        if merged == content:
+            package_metadata.put(key, etag, content)
+            # A redelivered event still brings replicas up to date when its earlier replication failed
+            return replicate_package_metadata(code_artifact_notification, bucket, {"key": key, "status": "UNCHANGED"})
+
+        try:
+            put_object_response = put_object_if_unchanged(merged, bucket, key, etag)
+        except botocore.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+            # Another event changed the document first, merge into its version instead
+            package_metadata.evict(key)
+            continue
+
+        package_metadata.put(key, put_object_response["ETag"], merged)
+        return replicate_package_metadata(code_artifact_notification, bucket, {"key": key, "status": "SUCCEEDED"})
+
+    raise ValueError("Gave up merging package metadata after concurrent updates:", key)
+
+
+def replicate_package_metadata(code_artifact_notification: CodeArtifactChangeNotification, bucket: str, package_metadata_result: dict) -> dict:
+    """Copy the metadata backup to the replicas of its target once the bucket holds the merged document"""
+    replicas = routing.get_target(code_artifact_notification.domain_name, code_artifact_notification.repository_name).replicas
+    if replicas:
+        # The replicas copy what the bucket holds now, which is never older than the document merged here
+        package_metadata_result["replicas"] = replicate_backup(bucket, package_metadata_result["key"], replicas)
+    return package_metadata_result
+
+
+def read_package_metadata(aws_event: AWSEvent, bucket: str, key: str) -> Tuple[str, bytes]:
+    """The ETag and content of the metadata backup, or no ETag and CodeArtifact's document when there is no backup yet"""
+    try:
+        get_object_response = get_s3_client().get_object(Bucket=bucket, Key=key)
+        return get_object_response["ETag"], get_object_response["Body"].read()
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+            raise
+
+    code_artifact_notification: CodeArtifactChangeNotification = aws_event.detail
+    url = get_full_url(code_artifact_notification, aws_event, get_package_path(code_artifact_notification) + "/maven-metadata.xml")
+    authentication_header = get_user_authentication_header(code_artifact_notification.domain_name, code_artifact_notification.domain_owner)
+    get_archive_response = get_archive(url, authentication_header)
+    try:
+        if get_archive_response.status_code == 404:
+            return None, None
         if get_archive_response.status_code != 200:
             get_archive_response.raise_for_status()
+        return None, get_archive_response.content
+    finally:
+        get_archive_response.close()
 
-        # Archive object to S3
-        key = code_artifact_notification.domain_name + "/" + package_location
-        put_object_response = put_object(get_archive_response.content, environ["DESTINATION_BUCKET"], key)
 
-        status_code = put_object_response["ResponseMetadata"]["HTTPStatusCode"]
-        if status_code != 200:
-            raise ValueError("Message Failed with " + str(status_code) + " status code:", put_object_response)
+def emit_backup_metrics(
+    code_artifact_notification: CodeArtifactChangeNotification, stats: dict, asset_results: List[dict], backup_seconds: float
+) -> None:
+    """Emit the stage timings of a package version backup, and the transfer of each asset that was downloaded"""
+    dimensions = {"Repository": code_artifact_notification.repository_name}
+    properties = {
+        "domain": code_artifact_notification.domain_name,
+        "package": code_artifact_notification.package_namespace + "/" + code_artifact_notification.package_name,
+        "version": code_artifact_notification.package_version,
+    }
+    metrics.emit(dimensions, {
+        "AuthTokenTime": (stats["authTokenSeconds"] * 1000, metrics.MILLISECONDS),
+        "ListAssetsTime": (stats["listAssetsSeconds"] * 1000, metrics.MILLISECONDS),
+        "BackupTime": (backup_seconds * 1000, metrics.MILLISECONDS),
+        "Assets": (len(asset_results), metrics.COUNT),
+        "AssetsFailed": (sum(asset_result["status"] == "FAILED" for asset_result in asset_results), metrics.COUNT),
+    }, properties)
+
+    # Skipped, deduplicated and copied assets weren't downloaded, so only downloaded assets report a transfer
+    for asset_result in asset_results:
+        if "bytes" not in asset_result:
+            continue
+        transfer_seconds = asset_result["downloadSeconds"] + asset_result["uploadSeconds"]
+        throughput = asset_result["bytes"] / 1000000 / transfer_seconds if transfer_seconds else 0.0
+        metrics.emit(dimensions, {
+            "DownloadTime": (asset_result["downloadSeconds"] * 1000, metrics.MILLISECONDS),
+            "UploadTime": (asset_result["uploadSeconds"] * 1000, metrics.MILLISECONDS),
+            "HandshakeTime": (asset_result["handshakeSeconds"] * 1000, metrics.MILLISECONDS),
+            "BytesTransferred": (asset_result["bytes"], metrics.BYTES),
+            "Throughput": (throughput, metrics.MEGABYTES_PER_SECOND),
+            "AwsRetryAttempts": (asset_result["awsRetryAttempts"], metrics.COUNT),
+        }, dict(properties, key=asset_result["key"]))
+
+
+def backup_asset(
+    code_artifact_notification: CodeArtifactChangeNotification,
+    aws_event: AWSEvent,
+    package_asset: dict,
+    authentication_header: requests.auth.HTTPBasicAuth,
+    bucket: str,
+    check_existing: bool = True,
+) -> dict:
+    """Back up a single asset to the bucket and to the replicas of its target, returning the result of the backup"""
+    # Retries and connections are counted for the asset, including those of the threads uploading its parts
+    with counters.counting() as asset_counters:
+        asset_result = backup_asset_to_bucket(
+            code_artifact_notification, aws_event, package_asset, authentication_header, bucket, check_existing
+        )
+
+        replicas = routing.get_target(code_artifact_notification.domain_name, code_artifact_notification.repository_name).replicas
+        # An asset that couldn't be downloaded has no backup to replicate
+        if replicas and asset_result.get("status") != "UNAVAILABLE":
+            # A content addressed blob is replicated before the pointer that names it
+            if "blobKey" in asset_result:
+                replicate_backup(bucket, asset_result["blobKey"], replicas)
+            tags = get_backup_tags(code_artifact_notification) if asset_result.get("status") == "TAGGED" else None
+            key = get_backup_key(code_artifact_notification, package_asset["location"])
+            asset_result["replicas"] = replicate_backup(bucket, key, replicas, tags)
+
+    if "awsRetryAttempts" in asset_result:
+        asset_result["awsRetryAttempts"] = asset_counters.retry_attempts
+    return asset_result
+
+
+def backup_asset_to_bucket(
+    code_artifact_notification: CodeArtifactChangeNotification,
+    aws_event: AWSEvent,
+    package_asset: dict,
+    authentication_header: requests.auth.HTTPBasicAuth,
+    bucket: str,
+    check_existing: bool = True,
+) -> dict:
+    """Stream a single asset from CodeArtifact into S3, returning the connection handshake, download and upload timings"""
+    package_location = package_asset["location"]
+    key = get_backup_key(code_artifact_notification, package_location)
+
+    # Events that only change the status or metadata of a version update the tags of the existing backup, and nothing
+    # can be downloaded for an archived version, so its backup is tagged if there is one and left missing otherwise
+    serves = serves_assets(code_artifact_notification)
+    tag_existing = not serves or (check_existing and is_state_change_only(code_artifact_notification))
+    # Redelivered and repeated events only cost a HEAD request when the backup is already up to date
+    skip_existing = check_existing and config.get_bool("SKIP_EXISTING_ASSETS", True)
+    # Both checks read the same HEAD response
+    head_object_response = head_object(bucket, key) if tag_existing or skip_existing else None
+
+    if tag_existing and tag_backup(code_artifact_notification, package_asset, bucket, key, head_object_response):
+        return {"status": "TAGGED"}
+    if not serves:
+        return {"status": "UNAVAILABLE"}
+    if skip_existing and is_asset_backed_up(code_artifact_notification, package_asset, head_object_response):
+        return {"status": "SKIPPED"}
+
+    metadata = get_backup_metadata(code_artifact_notification, package_asset)
+    # Backups carry the state of their version from the moment they are written, blobs are shared between versions
+    tags = get_backup_tags(code_artifact_notification)
+    sha256 = package_asset["hashes"].get("SHA-256")
+    # Assets without a SHA-256 can't be addressed by their content and keep the path layout
+    blob_key = storage.get_blob_key(sha256) if sha256 and storage.is_content_addressed() else None
+    if blob_key is not None and head_object(bucket, blob_key) is not None:
+        # The same bytes are already stored for another path, only the pointer to them is written
+        put_pointer(bucket, key, blob_key, package_asset, metadata, tags)
+        return {"status": "DEDUPLICATED", "blobKey": blob_key}
+
+    # An asset promoted from another repository is copied within S3 rather than downloaded again
+    copy_existing = blob_key is None and bool(sha256) and config.get_bool("COPY_EXISTING_ASSETS", True)
+    if copy_existing:
+        source = find_backed_up_copy(bucket, sha256)
+        if source is not None and source["key"] != key:
+            copy_object_response = copy_object(bucket, source["key"], key, source["size"], metadata, tags=tags)
+            status_code = copy_object_response["ResponseMetadata"]["HTTPStatusCode"]
+            if status_code != 200:
+                raise ValueError("Message Failed with " + str(status_code) + " status code:", copy_object_response)
+            return {"status": "COPIED", "sourceKey": source["key"]}
+
+    url = get_full_url(code_artifact_notification, aws_event, package_location)
+    start = time.perf_counter()
+    start_handshake_seconds = sessions.handshake_seconds()
+    start_connections = sessions.connections_opened()
+    start_retry_attempts = clients.retry_attempts()
+
+    stats = {"downloadSeconds": 0.0, "bytes": 0}
+    size = package_asset.get("size")
+    if is_ranged_download(url, authentication_header, size):
+        # Large assets are fetched as concurrent byte ranges, one range per multipart upload part
+        get_archive_response = None
+        source_chunks = download.ranged_chunks(
+            lambda range_start, range_end: get_archive_range(code_artifact_notification, url, range_start, range_end),
+            size,
+            get_part_size(size),
+            get_ranged_download_concurrency(get_part_size(size)),
+            config.get_int("RANGED_DOWNLOAD_ATTEMPTS", 3),
+        )
+    else:
+        # Request the archive file from CodeArtifact, the body is streamed rather than held in memory
+        get_archive_response = get_archive(url, authentication_header)
+        if get_archive_response.status_code == 401:
+            # The cached auth token was rejected, evict it and retry once with a fresh token
+            get_archive_response.close()
+            evict_user_authentication_header(code_artifact_notification.domain_name, code_artifact_notification.domain_owner)
+            authentication_header = get_user_authentication_header(code_artifact_notification.domain_name, code_artifact_notification.domain_owner)
+            get_archive_response = get_archive(url, authentication_header)
+        source_chunks = get_archive_response.iter_content(chunk_size=config.get_int("STREAM_CHUNK_SIZE", transfer.DEFAULT_CHUNK_SIZE))
+    stats["downloadSeconds"] = time.perf_counter() - start
+
+    try:
+        if get_archive_response is not None and get_archive_response.status_code != 200:
+            get_archive_response.raise_for_status()
+
+        # Archive object to S3, time spent waiting on CodeArtifact for chunks counts as download time
+        target = routing.get_target(code_artifact_notification.domain_name, code_artifact_notification.repository_name)
+        chunks = metrics.timed_iter(target.throttle(source_chunks), stats, "downloadSeconds", "bytes")
+        upload_key, upload_metadata, upload_tags = (key, metadata, tags) if blob_key is None else (blob_key, {"sha256": sha256}, None)
+        if target.replicas:
+            # The download is read once and uploaded to the bucket and every replica at the same time
+            put_object_response = put_object_stream_replicated(
+                chunks, bucket, upload_key, target.replicas, upload_metadata, package_asset["hashes"], package_asset.get("size"), upload_tags
+            )
+        else:
+            put_object_response = put_object_stream(
+                chunks, bucket, upload_key, upload_metadata, package_asset["hashes"], package_asset.get("size"), tags=upload_tags
+            )
+    finally:
+        if get_archive_response is None:
+            source_chunks.close()
+        else:
+            get_archive_response.close()
+
+    status_code = put_object_response["ResponseMetadata"]["HTTPStatusCode"]
+    if status_code != 200:
+        raise ValueError("Message Failed with " + str(status_code) + " status code:", put_object_response)
+
+    asset_result = {}
+    if blob_key is not None:
+        put_pointer(bucket, key, blob_key, package_asset, metadata, tags)
+        asset_result["blobKey"] = blob_key
+    elif copy_existing:
+        record_backed_up_copy(bucket, sha256, key)
+
+    handshake_seconds = sessions.handshake_seconds() - start_handshake_seconds
+    total_seconds = time.perf_counter() - start
+    asset_result.update({
+        "bytes": stats["bytes"],
+        "connectionsOpened": sessions.connections_opened() - start_connections,
+        "handshakeSeconds": round(handshake_seconds, 6),
+        "transferSeconds": round(total_seconds - handshake_seconds, 6),
+        "downloadSeconds": round(stats["downloadSeconds"], 6),
+        "uploadSeconds": round(total_seconds - stats["downloadSeconds"], 6),
+        "awsRetryAttempts": clients.retry_attempts() - start_retry_attempts,
+    })
+    return asset_result
+
+
+def find_backed_up_copy(bucket: str, sha256: str) -> dict:
+    """The key and size of a backup with the given SHA-256, None when there is none or it has since been overwritten
+
+    A key this container remembered that no longer holds the content is dropped, and the bucket's index is asked instead.
+    """
+    cached_key = backed_up_copies.get((bucket, sha256))
+    if cached_key is not None:
+        copy = get_backed_up_copy(bucket, sha256, cached_key)
+        if copy is not None:
+            return copy
+        backed_up_copies.pop((bucket, sha256), None)
+
+    index_response = head_object(bucket, storage.get_index_key(sha256))
+    if index_response is None:
+        return None
+    key = index_response.get("Metadata", {}).get(storage.INDEXED_KEY_METADATA)
+    if key is None or key == cached_key:
+        return None
+    return get_backed_up_copy(bucket, sha256, key)
 
-        # Return event for further processing
-        return Marshaller.marshall(aws_event)
 
+def get_backed_up_copy(bucket: str, sha256: str, key: str) -> dict:
+    """The key and size of the backup at key when it still holds the content with the given SHA-256, remembering it"""
+    head_object_response = head_object(bucket, key)
+    if head_object_response is None or head_object_response.get("Metadata", {}).get("sha256") != sha256:
+        return None
 
-def get_authorization_token(domain_name: str) -> dict:
+    backed_up_copies[(bucket, sha256)] = key
+    return {"key": key, "size": head_object_response["ContentLength"]}
+
+
+def record_backed_up_copy(bucket: str, sha256: str, key: str) -> None:
+    """Add a backup to the SHA-256 index so later copies of the same asset can be made within S3"""
+    put_object_response = put_object(b"", bucket, storage.get_index_key(sha256), {storage.INDEXED_KEY_METADATA: key})
+    status_code = put_object_response["ResponseMetadata"]["HTTPStatusCode"]
+    if status_code != 200:
+        raise ValueError("Message Failed with " + str(status_code) + " status code:", put_object_response)
+    backed_up_copies[(bucket, sha256)] = key
+
+
+def put_pointer(bucket: str, key: str, blob_key: str, package_asset: dict, metadata: dict, tags: dict = None) -> None:
+    """Write the pointer object at an asset's backup key, naming the blob that holds its content"""
+    pointer = storage.get_pointer(blob_key, package_asset["hashes"]["SHA-256"], package_asset.get("size"))
+    put_object_response = put_object(pointer, bucket, key, storage.get_pointer_metadata(metadata, blob_key), tags=tags)
+
+    status_code = put_object_response["ResponseMetadata"]["HTTPStatusCode"]
+    if status_code != 200:
+        raise ValueError("Message Failed with " + str(status_code) + " status code:", put_object_response)
+
+
+def get_backup_key(code_artifact_notification: CodeArtifactChangeNotification, package_location: str) -> str:
+    """The S3 key an asset is backed up to, its CodeArtifact location prefixed with the target prefix and the domain name"""
+    target = routing.get_target(code_artifact_notification.domain_name, code_artifact_notification.repository_name)
+    return target.prefix + code_artifact_notification.domain_name + "/" + package_location
+
+
+def get_backup_metadata(code_artifact_notification: CodeArtifactChangeNotification, package_asset: dict) -> dict:
+    """S3 user metadata recording which revision of the package version a backup was taken from"""
+    metadata = {
+        "package-version-revision": code_artifact_notification.package_version_revision,
+        "event-deduplication-id": code_artifact_notification.event_deduplication_id,
+        "sequence-number": code_artifact_notification.sequence_number,
+        "sha256": package_asset["hashes"].get("SHA-256"),
+    }
+    return {name: str(value) for name, value in metadata.items() if value is not None}
+
+
+def is_asset_backed_up(code_artifact_notification: CodeArtifactChangeNotification, package_asset: dict, head_object_response: dict) -> bool:
+    """Compare the HEAD response of an existing backup with the asset checksum, or the package version revision when no checksum is known"""
+    if head_object_response is None:
+        return False
+
+    metadata = head_object_response.get("Metadata", {})
+    sha256 = package_asset["hashes"].get("SHA-256")
+    if sha256 and "sha256" in metadata:
+        return metadata["sha256"] == sha256
+
+    revision = code_artifact_notification.package_version_revision
+    return revision is not None and metadata.get("package-version-revision") == revision
+
+
+def replicate_backup(bucket: str, key: str, replicas: List[routing.Replica], tags: dict = None) -> List[dict]:
+    """Bring every replica up to date with the backup at key, copying it across regions where it is missing or differs
+
+    Replicas that already hold the same content, for example because it was uploaded to them while it streamed, only
+    get the tags, if any. Each replica is retried on its own, and a replica that is still failing fails the asset.
+    """
+    primary = head_object(bucket, key)
+    if primary is None:
+        raise ValueError("There is no backup to replicate:", bucket, key)
+
+    replica_results = [replicate_object(bucket, key, primary, replica, tags) for replica in replicas]
+    failed_results = [replica_result for replica_result in replica_results if replica_result["status"] == "FAILED"]
+    if failed_results:
+        raise ValueError("Replication failed for " + str(len(failed_results)) + " of " + str(len(replicas)) + " replicas:", failed_results)
+    return replica_results
+
+
+def replicate_object(bucket: str, key: str, primary: dict, replica: routing.Replica, tags: dict = None) -> dict:
+    """Copy the object at key to one replica unless it already matches the primary, returning the outcome and attempts
+
+    Attempts are spaced by an exponential backoff, so a replica region that is throttling or unreachable gets time to recover.
+    """
+    replica_result = {"bucket": replica.bucket, "region": replica.region}
+    attempts = max(1, config.get_int("REPLICA_ATTEMPTS", 3))
+    for attempt in range(1, attempts + 1):
+        if attempt > 1:
+            time.sleep(config.get_float("REPLICA_BACKOFF_SECONDS", 0.5) * 2 ** (attempt - 2))
+        replica_result["attempts"] = attempt
+        try:
+            head_object_response = head_object(replica.bucket, key, replica.region)
+            if head_object_response is not None and is_same_object(primary, head_object_response):
+                if tags:
+                    put_object_tagging(replica.bucket, key, tags, replica.region)
+                replica_result["status"] = "SUCCEEDED"
+                return replica_result
+
+            # Without new tags CopyObject copies those of the primary along with the object
+            copy_object(
+                replica.bucket, key, key, primary["ContentLength"], primary.get("Metadata"), source_bucket=bucket, region=replica.region, tags=tags
+            )
+            replica_result["status"] = "COPIED"
+            return replica_result
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as error:
+            # Connection errors and timeouts towards another region fail the attempt like an error response does
+            logger.warning("Attempt %d to replicate %s to %s failed: %r", attempt, key, replica, error)
+            replica_result["error"] = repr(error)
+
+    replica_result["status"] = "FAILED"
+    return replica_result
+
+
+def is_same_object(primary: dict, replica: dict) -> bool:
+    """Compare two HeadObject responses by their SHA-256 metadata, or their size and ETag when there is none"""
+    sha256 = primary.get("Metadata", {}).get("sha256")
+    if sha256:
+        return replica.get("Metadata", {}).get("sha256") == sha256
+    return (primary["ContentLength"], primary.get("ETag")) == (replica["ContentLength"], replica.get("ETag"))
+
+
+def is_state_change_only(code_artifact_notification: CodeArtifactChangeNotification) -> bool:
+    """Whether the event's changes block says no asset was added, removed or updated, only the status or metadata"""
+    changes = code_artifact_notification.changes
+    if changes is None or not config.get_bool("PARTIAL_BACKUPS", True):
+        return False
+
+    assets_changed = (changes.assets_added or 0) + (changes.assets_removed or 0) + (changes.assets_updated or 0)
+    return assets_changed == 0 and bool(changes.metadata_updated or changes.status_changed)
+
+
+def get_backup_tags(code_artifact_notification: CodeArtifactChangeNotification) -> dict:
+    """S3 object tags recording the status and revision of the package version a backup belongs to"""
+    tags = {
+        "package-version-state": code_artifact_notification.package_version_state,
+        "package-version-revision": code_artifact_notification.package_version_revision,
+    }
+    return {name: str(value) for name, value in tags.items() if value is not None}
+
+
+def tag_backup(
+    code_artifact_notification: CodeArtifactChangeNotification, package_asset: dict, bucket: str, key: str, head_object_response: dict
+) -> bool:
+    """Tag the backup at key, as described by its HEAD response, with the new status of its version
+
+    Returns False when there is no backup of this content to tag.
+    """
+    if head_object_response is None:
+        return False
+
+    sha256 = package_asset["hashes"].get("SHA-256")
+    if sha256 and head_object_response.get("Metadata", {}).get("sha256", sha256) != sha256:
+        return False
+
+    put_object_tagging_response = put_object_tagging(bucket, key, get_backup_tags(code_artifact_notification))
+    status_code = put_object_tagging_response["ResponseMetadata"]["HTTPStatusCode"]
+    if status_code != 200:
+        raise ValueError("Message Failed with " + str(status_code) + " status code:", put_object_tagging_response)
+    return True
+
+
+def get_authorization_token(domain_name: str, domain_owner: str = None, duration_seconds: int = None) -> dict:
     """Wrapper around boto3 codeartifact get_authorization_token api"""
-    return ca_client.get_authorization_token(domain=domain_name)
+    kwargs = {"domain": domain_name}
+    if domain_owner:
+        kwargs["domainOwner"] = domain_owner
+    if duration_seconds is not None:
+        kwargs["durationSeconds"] = duration_seconds
+    return get_ca_client().get_authorization_token(**kwargs)
 
 
-def put_object(content: object, bucket: str, key:str) -> dict:
-    """Wrapper around boto3 s3 client put_object api"""
-    return s3_client.put_object(
+def put_object(
+    content: object, bucket: str, key:str, metadata: dict = None, checksum_sha256: str = None, region: str = None, tags: dict = None
+) -> dict:
+    """Wrapper around boto3 s3 client put_object api, tagging the object as it is written"""
+    kwargs = {}
+    if checksum_sha256:
+        kwargs["ChecksumSHA256"] = checksum_sha256
+    if tags:
+        kwargs["Tagging"] = urlencode(tags)
+    return get_s3_client(region).put_object(
         Body=content,
         Bucket=bucket,
         Key=key,
+        Metadata=metadata or {},
+        **kwargs,
     )
 
-def get_archive(url:str, authentication_header:requests.auth.HTTPBasicAuth) -> requests.Response:
-    """Wrapper around request library get function"""
-    return requests.get(url, auth=authentication_header, timeout=10)
+def copy_object(
+    bucket: str,
+    source_key: str,
+    key: str,
+    size: int,
+    metadata: dict = None,
+    source_bucket: str = None,
+    region: str = None,
+    tags: dict = None,
+) -> dict:
+    """Copy an object within the bucket or from source_bucket, replacing its metadata, in ranges when it is too large for CopyObject
+
+    Tags replace those of the source when given, otherwise CopyObject keeps the source's tags.
+    """
+    source_bucket = source_bucket or bucket
+    tagging = urlencode(tags) if tags else None
+    if size > transfer.MAX_COPY_OBJECT_SIZE:
+        part_size = config.get_int("COPY_PART_SIZE", transfer.DEFAULT_COPY_PART_SIZE)
+        return transfer.multipart_copy(get_s3_client(region), source_bucket, source_key, bucket, key, size, part_size, metadata, tagging)
+
+    kwargs = {"Tagging": tagging, "TaggingDirective": "REPLACE"} if tagging else {}
+    return get_s3_client(region).copy_object(
+        Bucket=bucket,
+        Key=key,
+        CopySource={"Bucket": source_bucket, "Key": source_key},
+        Metadata=metadata or {},
+        MetadataDirective="REPLACE",
+        **kwargs,
+    )
 
-def get_user_authentication_header(domain_name: str) -> requests.auth.HTTPBasicAuth:
-    """Request a auth token from CodeArtifact to add to the user header"""
-    auth_token_response = get_authorization_token(domain_name)
+def put_object_if_unchanged(content: bytes, bucket: str, key: str, etag: str = None) -> dict:
+    """Wrapper around boto3 s3 client put_object api, only writing when the object still has etag or doesn't exist without one"""
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    return get_s3_client().put_object(Body=content, Bucket=bucket, Key=key, ContentType="application/xml", **condition)
 
-    if auth_token_response["ResponseMetadata"]["HTTPStatusCode"] != 200:
-        raise ValueError(auth_token_response.text)
+def put_object_tagging(bucket: str, key: str, tags: dict, region: str = None) -> dict:
+    """Wrapper around boto3 s3 client put_object_tagging api, replacing every tag of the object"""
+    tag_set = [{"Key": name, "Value": value} for name, value in tags.items()]
+    return get_s3_client(region).put_object_tagging(Bucket=bucket, Key=key, Tagging={"TagSet": tag_set})
 
-    return requests.auth.HTTPBasicAuth("aws", auth_token_response["authorizationToken"])
+def head_object(bucket: str, key: str, region: str = None) -> dict:
+    """Wrapper around boto3 s3 client head_object api, returning None when the object does not exist"""
+    try:
+        return get_s3_client(region).head_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
 
+def put_object_stream(
+    chunks: Iterable[bytes],
+    bucket: str,
+    key: str,
+    metadata: dict = None,
+    hashes: dict = None,
+    size: int = None,
+    region: str = None,
+    destinations: int = 1,
+    tags: dict = None,
+) -> dict:
+    """Stream chunks to S3, with a single PutObject for small content and a concurrent multipart upload for large content
 
-def list_package_version_assets(code_artifact_notification: CodeArtifactChangeNotification) -> requests.Response:
-    """Get the artifact file name for this version of the package"""
-    return ca_client.list_package_version_assets(
+    The size, when known, picks the upload: up to MULTIPART_THRESHOLD bytes go in one PutObject, larger content
+    is split into parts sized to stay within the S3 part limit. Without a size, content that fits in one part is
+    still sent with a single PutObject. The chunks are checked against the CodeArtifact hashes as they stream
+    past. A mismatch is raised once the last chunk is read, before the PutObject is sent or the multipart
+    upload is completed. Destinations is the number of uploads the content is streamed to at once, which share
+    the memory of its parts. The tags are written with the object.
+    """
+    verify = config.get_bool("VERIFY_ASSET_HASHES", True)
+    if verify and hashes:
+        chunks = integrity.verify_chunks(chunks, hashes)
+
+    if size is not None and size <= config.get_int("MULTIPART_THRESHOLD", transfer.DEFAULT_PART_SIZE):
+        return put_single_part(b"".join(chunks), bucket, key, metadata, hashes, verify, region, tags)
+
+    part_size = get_part_size(size)
+    parts = transfer.read_parts(chunks, part_size)
+
+    first_part = next(parts, b"")
+    second_part = next(parts, None)
+    if second_part is None:
+        return put_single_part(first_part, bucket, key, metadata, hashes, verify, region, tags)
+
+    concurrency = config.get_int("MULTIPART_CONCURRENCY", None) or get_multipart_concurrency(part_size, destinations)
+    return transfer.multipart_upload(
+        get_s3_client(region),
+        chain((first_part, second_part), parts),
+        bucket,
+        key,
+        metadata,
+        checksums=verify,
+        concurrency=concurrency,
+        tagging=urlencode(tags) if tags else None,
+    )
+
+def put_object_stream_replicated(
+    chunks: Iterable[bytes],
+    bucket: str,
+    key: str,
+    replicas: List[routing.Replica],
+    metadata: dict = None,
+    hashes: dict = None,
+    size: int = None,
+    tags: dict = None,
+) -> dict:
+    """Stream chunks to the bucket and every replica at once, returning the response of the bucket
+
+    Each destination runs its own upload with a client pinned to its region and holds its own parts in memory.
+    Replicas that fail are logged and left to replicate_backup, which retries them by copying from the bucket.
+    """
+    destinations = [(bucket, None)] + [(replica.bucket, replica.region) for replica in replicas]
+    futures = transfer.tee(
+        chunks,
+        [
+            lambda destination_chunks, bucket=bucket, region=region: put_object_stream(
+                destination_chunks, bucket, key, metadata, hashes, size, region, len(destinations), tags
+            )
+            for bucket, region in destinations
+        ],
+        max_buffered_chunks=config.get_int("REPLICA_BUFFERED_CHUNKS", 4),
+    )
+
+    for replica, future in zip(replicas, futures[1:]):
+        if future.exception() is not None:
+            logger.warning("Upload of %s to %s failed: %r", key, replica, future.exception())
+    return futures[0].result()
+
+def get_part_size(size: int = None) -> int:
+    """The multipart upload part size for content of size, which is also the range size of ranged downloads"""
+    part_size = config.get_int("MULTIPART_PART_SIZE", None) or transfer.choose_part_size(size)
+    return max(part_size, transfer.MIN_PART_SIZE)
+
+def put_single_part(
+    content: bytes, bucket: str, key: str, metadata: dict, hashes: dict, verify: bool, region: str = None, tags: dict = None
+) -> dict:
+    """Upload content with one PutObject, carrying its SHA-256 for S3 to verify"""
+    checksum_sha256 = None
+    if verify:
+        # The content already matched the CodeArtifact SHA-256, so it is sent as is rather than hashed again
+        sha256 = (hashes or {}).get("SHA-256")
+        checksum_sha256 = integrity.hex_to_base64(sha256) if sha256 else integrity.checksum_sha256(content)
+    return put_object(content, bucket, key, metadata, checksum_sha256, region, tags)
+
+def get_transfer_memory() -> int:
+    """Bytes of parts and ranges one kind of buffer may hold for one asset, a quarter of the function memory shared by the assets in flight
+
+    Uploads and the ranged download window each get a quarter, the other half is left to the runtime and the clients.
+    """
+    memory_bytes = config.get_int("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", 128) * 1024 * 1024
+    return memory_bytes // 4 // config.get_concurrent_assets()
+
+def get_multipart_concurrency(part_size: int, destinations: int = 1) -> int:
+    """Parts of one upload sent at once, the destinations an asset is streamed to share its upload memory"""
+    memory_per_upload = get_transfer_memory() // max(1, destinations)
+    return transfer.choose_concurrency(
+        part_size, memory_per_upload, cpu_count() or 1, config.get_int("MULTIPART_MAX_CONCURRENCY", 8)
+    )
+
+def get_archive(url:str, authentication_header:requests.auth.HTTPBasicAuth, headers: dict = None) -> requests.Response:
+    """Wrapper around the pooled session get function, the body is streamed and must be closed by the caller"""
+    return codeartifact_session.get(url, auth=authentication_header, headers=headers, timeout=get_http_timeout(), stream=True)
+
+def head_archive(url:str, authentication_header:requests.auth.HTTPBasicAuth) -> requests.Response:
+    """Wrapper around the pooled session head function"""
+    return codeartifact_session.head(url, auth=authentication_header, timeout=get_http_timeout())
+
+def get_http_timeout() -> Tuple[float, float]:
+    """Connect and read timeouts of CodeArtifact downloads, the read timeout applies to each read rather than the whole body"""
+    return config.get_float("HTTP_CONNECT_TIMEOUT", 10), config.get_float("HTTP_READ_TIMEOUT", 10)
+
+def is_ranged_download(url: str, authentication_header: requests.auth.HTTPBasicAuth, size: int = None) -> bool:
+    """Whether an asset is large enough to download in ranges, and CodeArtifact accepts range requests for it"""
+    if not config.get_bool("RANGED_DOWNLOADS", True) or size is None:
+        return False
+    if size < config.get_int("RANGED_DOWNLOAD_THRESHOLD", 64 * 1024 * 1024):
+        return False
+    # A window of one range would hold a whole part in memory for no gain over streaming
+    if get_ranged_download_concurrency(get_part_size(size)) < 2:
+        return False
+
+    head_archive_response = head_archive(url, authentication_header)
+    return head_archive_response.status_code == 200 and head_archive_response.headers.get("Accept-Ranges") == "bytes"
+
+def get_ranged_download_concurrency(part_size: int) -> int:
+    """Ranges of one asset downloaded at once, at most RANGED_DOWNLOAD_CONCURRENCY and no more than its download memory holds"""
+    return min(config.get_int("RANGED_DOWNLOAD_CONCURRENCY", 4), get_transfer_memory() // part_size)
+
+def get_archive_range(code_artifact_notification: CodeArtifactChangeNotification, url: str, start: int, end: int) -> bytes:
+    """Download one inclusive byte range of an asset, evicting the cached auth token when it is rejected"""
+    authentication_header = get_user_authentication_header(code_artifact_notification.domain_name, code_artifact_notification.domain_owner)
+    get_archive_response = get_archive(url, authentication_header, {"Range": "bytes=" + str(start) + "-" + str(end)})
+    try:
+        if get_archive_response.status_code == 401:
+            # The range is retried, and the retry requests a fresh token
+            evict_user_authentication_header(code_artifact_notification.domain_name, code_artifact_notification.domain_owner)
+        if get_archive_response.status_code != 206:
+            raise ValueError("Message Failed with " + str(get_archive_response.status_code) + " status code:", url)
+        return get_archive_response.content
+    finally:
+        get_archive_response.close()
+
+def get_user_authentication_header(domain_name: str, domain_owner: str = None) -> requests.auth.HTTPBasicAuth:
+    """Build the user header from a cached CodeArtifact auth token, requesting a new token shortly before it expires"""
+    auth_token = authorization_tokens.get_or_fetch(
+        (domain_name, domain_owner),
+        lambda: request_authorization_token(domain_name, domain_owner),
+    )
+    return requests.auth.HTTPBasicAuth("aws", auth_token)
+
+def evict_user_authentication_header(domain_name: str, domain_owner: str = None) -> None:
+    """Forget the cached auth token so the next user header requests a new one"""
+    authorization_tokens.evict((domain_name, domain_owner))
+
+def request_authorization_token(domain_name: str, domain_owner: str = None) -> Tuple[str, float]:
+    """Request a auth token from CodeArtifact, returning the token and the epoch time it expires"""
+    duration_seconds = config.get_int("AUTH_TOKEN_DURATION_SECONDS", 43200)
+    auth_token_response = get_authorization_token(domain_name, domain_owner, duration_seconds)
+
+    status_code = auth_token_response["ResponseMetadata"]["HTTPStatusCode"]
+    if status_code != 200:
+        raise ValueError("Message Failed with " + str(status_code) + " status code:", auth_token_response)
+
+    expiration = auth_token_response.get("expiration")
+    expires_at = expiration.timestamp() if expiration else time.time() + duration_seconds
+    return auth_token_response["authorizationToken"], expires_at
+
+
+def list_package_version_assets(code_artifact_notification: CodeArtifactChangeNotification, next_token: str = None) -> dict:
+    """Get one page of the artifact file names for this version of the package"""
+    kwargs = {}
+    if next_token:
+        kwargs["nextToken"] = next_token
+    return get_ca_client().list_package_version_assets(
         domain=code_artifact_notification.domain_name,
         repository=code_artifact_notification.repository_name,
         format=code_artifact_notification.package_format,
         package=code_artifact_notification.package_name,
         packageVersion=code_artifact_notification.package_version,
         namespace=code_artifact_notification.package_namespace,
+        maxResults=config.get_int("LIST_ASSETS_MAX_RESULTS", 1000),
+        **kwargs,
     )
 
 
-def get_package_locations(code_artifact_notification: CodeArtifactChangeNotification) -> List[str]:
+def get_package_locations(code_artifact_notification: CodeArtifactChangeNotification) -> Iterator[str]:
     """Use details from CodeArtifact to construct the package's location in CodeArtifact"""
+    for package_asset in get_package_assets(code_artifact_notification):
+        yield package_asset["location"]
+
+
+def get_package_assets(code_artifact_notification: CodeArtifactChangeNotification) -> Iterator[dict]:
+    """Describe each asset of the package version with its location in CodeArtifact, size and hashes
+
+    Assets are yielded page by page as the listing is paginated, so callers can start on the first page
+    while the next one is requested.
+    """
     package_name = code_artifact_notification.package_name
-    repository_name = code_artifact_notification.repository_name
     package_version = code_artifact_notification.package_version
-    package_version_response = list_package_version_assets(code_artifact_notification)
+    package_path = get_package_path(code_artifact_notification)
+    next_token = None
+    found_assets = False
 
-    # Get the name of the whl file
-    status_code = package_version_response["ResponseMetadata"]["HTTPStatusCode"]
-    if status_code != 200:
-        raise ValueError("Message Failed with " + str(status_code) + " status code:", package_version_response)
+    while True:
+        package_version_response = list_package_version_assets(code_artifact_notification, next_token)
 
-    converted_package_namespace = "/".join(code_artifact_notification.package_namespace.split("."))
-    package_locations = list(
-        map(
-            lambda asset: "/".join(
-                ("maven", repository_name, converted_package_namespace, package_name, package_version, asset["name"])
-            ),
-            package_version_response["assets"],
-        )
-    )
+        status_code = package_version_response["ResponseMetadata"]["HTTPStatusCode"]
+        if status_code != 200:
+            raise ValueError("Message Failed with " + str(status_code) + " status code:", package_version_response)
+
+        for asset in package_version_response["assets"]:
+            found_assets = True
+            yield {
+                "location": "/".join((package_path, package_version, asset["name"])),
+                "size": asset.get("size"),
+                "hashes": asset.get("hashes", {}),
+            }
+
+        next_token = package_version_response.get("nextToken")
+        if not next_token:
+            break
 
-    if not package_locations:
+    if not found_assets:
         raise ValueError("No assets found for " + package_name + " " + package_version)
 
-    return package_locations
+
+def get_package_path(code_artifact_notification: CodeArtifactChangeNotification) -> str:
+    """The package's path in the CodeArtifact maven repository, shared by all of its versions"""
+    converted_package_namespace = "/".join(code_artifact_notification.package_namespace.split("."))
+    return "/".join(("maven", code_artifact_notification.repository_name, converted_package_namespace, code_artifact_notification.package_name))
 
 
 def get_full_url(code_artifact_notification: CodeArtifactChangeNotification, aws_event: AWSEvent, package_location: str) -> str:
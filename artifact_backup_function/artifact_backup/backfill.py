@@ -0,0 +1,310 @@
+import argparse
+import datetime
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Set
+
+import botocore.exceptions
+
+# import local modules
+from artifact_backup import app
+from artifact_backup import clients
+from artifact_backup import config
+from artifact_backup import rate_limit
+from artifact_backup import routing
+from model.aws.code_artifact import AWSEvent
+from model.aws.code_artifact import CodeArtifactChangeNotification
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Packages that are fully reconciled, stored in the backup bucket so an interrupted backfill can resume
+
+    The reconciled versions of packages that were only partly done are kept as well, so a package with more
+    versions than one invocation can reconcile still makes progress.
+    """
+
+    def __init__(self, bucket: str, key: str):
+        self.bucket = bucket
+        self.key = key
+        self.versions = {}
+
+    def load(self) -> Set[str]:
+        """Read the reconciled packages and versions, a finished run starts the next reconciliation from scratch"""
+        self.versions = {}
+        try:
+            get_object_response = app.get_s3_client().get_object(Bucket=self.bucket, Key=self.key)
+        except botocore.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return set()
+            raise
+
+        state = json.loads(get_object_response["Body"].read())
+        if state.get("complete"):
+            return set()
+        self.versions = {package_id: set(versions) for package_id, versions in state.get("versions", {}).items()}
+        return set(state["packages"])
+
+    def save(self, packages: Set[str], complete: bool = False, versions: Dict[str, Set[str]] = None) -> None:
+        """Persist the reconciled packages, and the reconciled versions of packages that are not done yet"""
+        state = {"complete": complete, "packages": sorted(packages)}
+        if versions:
+            state["versions"] = {package_id: sorted(package_versions) for package_id, package_versions in sorted(versions.items())}
+        app.put_object(json.dumps(state).encode("utf-8"), self.bucket, self.key)
+
+
+class Backfill:
+    """Copies every asset of a repository that is missing from the backup bucket
+
+    Versions are reconciled concurrently. A package is only recorded in the checkpoint once all of its versions
+    succeeded, so packages with failures are retried when the backfill is resumed.
+    """
+
+    def __init__(
+        self,
+        domain_name: str,
+        domain_owner: str,
+        repository_name: str,
+        bucket: str,
+        region: str,
+        workers: int,
+        rate_limiter: rate_limit.RateLimiter,
+        checkpoint: Checkpoint,
+        version_status: str = "Published",
+        checkpoint_interval: int = 100,
+    ):
+        self.domain_name = domain_name
+        self.domain_owner = domain_owner
+        self.repository_name = repository_name
+        self.bucket = bucket
+        self.region = region
+        self.workers = workers
+        self.rate_limiter = rate_limiter
+        self.checkpoint = checkpoint
+        self.version_status = version_status
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._completed_packages = set()
+        self._completed_versions = {}
+        self._unsaved_progress = 0
+        self._summary = {}
+        self._metadata_locks = {}
+
+    def run(self, deadline: float = None) -> dict:
+        """Reconcile the repository, stopping before new packages or versions are started once the monotonic deadline has passed"""
+        self._completed_packages = self.checkpoint.load()
+        self._completed_versions = {package_id: set(versions) for package_id, versions in self.checkpoint.versions.items()}
+        self._unsaved_progress = 0
+        self._summary = {"packages": 0, "versions": 0, "assetsCopied": 0, "versionsFailed": 0, "complete": True}
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for package in list_packages(self.domain_name, self.domain_owner, self.repository_name, self.rate_limiter):
+                if deadline is not None and time.monotonic() > deadline:
+                    self._summary["complete"] = False
+                if not self._summary["complete"]:
+                    break
+
+                package_id = package["namespace"] + "/" + package["package"]
+                if package_id in self._completed_packages:
+                    continue
+
+                self._summary["packages"] += 1
+                template = self._get_notification(package, None, None)
+                backed_up_keys = list_backed_up_keys(self.bucket, app.get_backup_key(template, app.get_package_path(template)) + "/")
+                progress = {"pending": 1, "failed": False}
+                with self._lock:
+                    completed_versions = set(self._completed_versions.get(package_id, ()))
+
+                for version in list_package_versions(
+                    self.domain_name, self.domain_owner, self.repository_name, package, self.version_status, self.rate_limiter
+                ):
+                    # A package with many versions is left unfinished at the deadline, its reconciled versions are kept
+                    if deadline is not None and time.monotonic() > deadline:
+                        self._summary["complete"] = False
+                        progress["failed"] = True
+                        break
+                    if version["version"] in completed_versions:
+                        continue
+
+                    in_flight.acquire()
+                    with self._lock:
+                        progress["pending"] += 1
+                    future = executor.submit(self.reconcile_version, package, version, backed_up_keys)
+                    future.add_done_callback(
+                        lambda done, package_id=package_id, version=version["version"], progress=progress: self._version_done(
+                            done, package_id, version, progress, in_flight
+                        )
+                    )
+
+                # Release the hold that kept the package open while its versions were being listed
+                self._package_step_done(package_id, progress)
+
+        self.checkpoint.save(
+            self._completed_packages,
+            complete=self._summary["complete"] and not self._summary["versionsFailed"],
+            versions=self._completed_versions,
+        )
+        return self._summary
+
+    def reconcile_version(self, package: dict, version: dict, backed_up_keys: Set[str]) -> int:
+        """Copy the assets of one version that are not in the backup bucket, returning how many were copied"""
+        code_artifact_notification = self._get_notification(package, version["version"], version.get("revision"))
+        aws_event = AWSEvent(
+            detail=code_artifact_notification,
+            detail_type="CodeArtifact Package Version State Change",
+            resources=[],
+            id="backfill",
+            source="aws.codeartifact",
+            time=datetime.datetime.now(datetime.timezone.utc),
+            region=self.region,
+            version="0",
+            account=self.domain_owner,
+        )
+
+        self.rate_limiter.acquire()
+        package_assets = app.get_package_assets(code_artifact_notification)
+        missing_assets = [
+            package_asset for package_asset in package_assets
+            if app.get_backup_key(code_artifact_notification, package_asset["location"]) not in backed_up_keys
+        ]
+
+        if missing_assets:
+            authentication_header = app.get_user_authentication_header(self.domain_name, self.domain_owner)
+            for package_asset in missing_assets:
+                self.rate_limiter.acquire()
+                app.backup_asset(code_artifact_notification, aws_event, package_asset, authentication_header, self.bucket, check_existing=False)
+
+        if config.get_bool("BACKUP_PACKAGE_METADATA", True):
+            # Versions of one package would otherwise keep failing each other's conditional writes
+            with self._get_metadata_lock(package["namespace"] + "/" + package["package"]):
+                # The backfill doesn't know when the version was published, so it doesn't move latest or release
+                app.backup_package_metadata(aws_event, self.bucket, list_only=True)
+
+        return len(missing_assets)
+
+    def _get_metadata_lock(self, package_id: str) -> threading.Lock:
+        with self._lock:
+            return self._metadata_locks.setdefault(package_id, threading.Lock())
+
+    def _get_notification(self, package: dict, package_version: str, revision: str) -> CodeArtifactChangeNotification:
+        return CodeArtifactChangeNotification(
+            repository_name=self.repository_name,
+            package_name=package["package"],
+            package_version=package_version,
+            package_format="maven",
+            domain_owner=self.domain_owner,
+            package_version_state=self.version_status,
+            domain_name=self.domain_name,
+            package_namespace=package["namespace"],
+            package_version_revision=revision,
+        )
+
+    def _version_done(self, future, package_id: str, version: str, progress: dict, in_flight: threading.BoundedSemaphore) -> None:
+        in_flight.release()
+        error = future.exception()
+        with self._lock:
+            self._summary["versions"] += 1
+            if error is None:
+                self._summary["assetsCopied"] += future.result()
+                self._completed_versions.setdefault(package_id, set()).add(version)
+                self._unsaved_progress += 1
+            else:
+                logger.error("Failed to reconcile a version of %s: %r", package_id, error)
+                self._summary["versionsFailed"] += 1
+                progress["failed"] = True
+        self._package_step_done(package_id, progress)
+
+    def _package_step_done(self, package_id: str, progress: dict) -> None:
+        with self._lock:
+            progress["pending"] -= 1
+            if not progress["pending"] and not progress["failed"]:
+                # The package is recorded as a whole, its versions no longer need to be kept
+                self._completed_packages.add(package_id)
+                self._completed_versions.pop(package_id, None)
+                self._unsaved_progress += 1
+
+            # Finished versions count towards the interval too, so a large package is saved while it is in progress
+            if self._unsaved_progress < self.checkpoint_interval:
+                return
+
+            self._unsaved_progress = 0
+            completed_packages = set(self._completed_packages)
+            completed_versions = {package_id: set(versions) for package_id, versions in self._completed_versions.items()}
+
+        self.checkpoint.save(completed_packages, versions=completed_versions)
+
+
+def list_packages(domain_name: str, domain_owner: str, repository_name: str, rate_limiter: rate_limit.RateLimiter) -> Iterator[dict]:
+    """Page through the maven packages of the repository"""
+    paginator = app.get_ca_client().get_paginator("list_packages")
+    for page in paginator.paginate(domain=domain_name, domainOwner=domain_owner, repository=repository_name, format="maven"):
+        yield from page["packages"]
+        rate_limiter.acquire()
+
+
+def list_package_versions(
+    domain_name: str, domain_owner: str, repository_name: str, package: dict, status: str, rate_limiter: rate_limit.RateLimiter
+) -> Iterator[dict]:
+    """Page through the versions of a package that have the given status"""
+    paginator = app.get_ca_client().get_paginator("list_package_versions")
+    pages = paginator.paginate(
+        domain=domain_name,
+        domainOwner=domain_owner,
+        repository=repository_name,
+        format="maven",
+        namespace=package["namespace"],
+        package=package["package"],
+        status=status,
+    )
+    for page in pages:
+        yield from page["versions"]
+        rate_limiter.acquire()
+
+
+def list_backed_up_keys(bucket: str, prefix: str) -> Set[str]:
+    """Inventory of the backup keys under a prefix"""
+    paginator = app.get_s3_client().get_paginator("list_objects_v2")
+    return {item["Key"] for page in paginator.paginate(Bucket=bucket, Prefix=prefix) for item in page.get("Contents", [])}
+
+
+def run_backfill(domain_name: str, domain_owner: str, repository_name: str, deadline: float = None) -> dict:
+    """Build a backfill from the function configuration and run it"""
+    target = routing.get_target(domain_name, repository_name)
+    bucket = target.bucket
+    if not domain_owner:
+        domain_owner = clients.create_client("sts").get_caller_identity()["Account"]
+
+    backfill = Backfill(
+        domain_name=domain_name,
+        domain_owner=domain_owner,
+        repository_name=repository_name,
+        bucket=bucket,
+        region=app.get_ca_client().meta.region_name,
+        workers=config.get_int("BACKFILL_WORKERS", 8),
+        rate_limiter=rate_limit.RateLimiter(config.get_float("BACKFILL_REQUESTS_PER_SECOND", 20)),
+        checkpoint=Checkpoint(bucket, target.prefix + domain_name + "/.backfill/" + repository_name + ".json"),
+        checkpoint_interval=config.get_int("BACKFILL_CHECKPOINT_INTERVAL", 100),
+    )
+    return backfill.run(deadline)
+
+
+def lambda_handler(event, context):
+    """Entrypoint for a backfill, stopping before the function times out so it can be invoked again to resume"""
+    deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - config.get_int("BACKFILL_STOP_MARGIN_SECONDS", 120)
+    return run_backfill(event["domainName"], event.get("domainOwner"), event["repositoryName"], deadline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the assets of a CodeArtifact repository that are missing from the backup bucket")
+    parser.add_argument("--domain", required=True)
+    parser.add_argument("--domain-owner")
+    parser.add_argument("--repository", required=True)
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_backfill(arguments.domain, arguments.domain_owner, arguments.repository)))
@@ -0,0 +1,69 @@
+import logging
+import threading
+import time
+
+from artifact_backup import config
+from artifact_backup import counters
+
+logger = logging.getLogger(__name__)
+
+# One botocore session for every client, created with the first client
+_session = None
+_session_lock = threading.Lock()
+
+# Construction time per service, retries are counted in the counting scope of the asset that made them
+construction_seconds = {}
+
+
+def get_client_config():
+    """Client configuration sized for the worker pools, each option can be overridden from the environment"""
+    import botocore.config
+
+    # Every asset in flight may have as many parts uploading at once, a full pool discards connections rather than blocking
+    parts_per_asset = config.get_int("MULTIPART_CONCURRENCY", None) or config.get_int("MULTIPART_MAX_CONCURRENCY", 8)
+    concurrent_requests = config.get_concurrent_assets() * parts_per_asset
+    return botocore.config.Config(
+        max_pool_connections=config.get_int("CLIENT_MAX_POOL_CONNECTIONS", max(10, concurrent_requests)),
+        retries={
+            "mode": config.get_str("AWS_RETRY_MODE", "adaptive"),
+            "max_attempts": config.get_int("AWS_MAX_ATTEMPTS", 5),
+        },
+        tcp_keepalive=config.get_bool("CLIENT_TCP_KEEPALIVE", True),
+        connect_timeout=config.get_float("CLIENT_CONNECT_TIMEOUT", 5),
+        read_timeout=config.get_float("CLIENT_READ_TIMEOUT", 30),
+    )
+
+
+def get_session():
+    """The shared botocore session, credentials and endpoint data are resolved once for all clients"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import botocore.session
+            _session = botocore.session.get_session()
+        return _session
+
+
+def create_client(service_name: str, region_name: str = None):
+    """Create a client from the shared session, recording how long construction took and counting its retries"""
+    start = time.perf_counter()
+    session = get_session()
+    # Sessions aren't safe to create clients from concurrently
+    with _session_lock:
+        client = session.create_client(service_name, region_name=region_name, config=get_client_config())
+    construction_seconds[service_name] = time.perf_counter() - start
+    logger.info("Created %s client in %.1f ms", service_name, construction_seconds[service_name] * 1000)
+
+    client.meta.events.register("after-call", _count_retries)
+    return client
+
+
+def retry_attempts() -> int:
+    """Number of AWS API retries made in the current counting scope"""
+    return counters.current().retry_attempts
+
+
+def _count_retries(http_response=None, parsed=None, **kwargs):
+    # Error responses are parsed too, so calls that exhaust their retries are counted as well
+    if parsed:
+        counters.current().add_retry_attempts(parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
@@ -0,0 +1,35 @@
+from os import environ
+
+
+def get_str(name: str, default: str = None) -> str:
+    """Read a string setting from the environment, falling back to default when unset or empty"""
+    value = environ.get(name)
+    return value if value else default
+
+
+def get_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default when unset or empty"""
+    value = environ.get(name)
+    return int(value) if value else default
+
+
+def get_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back to default when unset or empty"""
+    value = environ.get(name)
+    return float(value) if value else default
+
+
+def get_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment, accepting true/false, yes/no and 1/0"""
+    value = environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_concurrent_assets() -> int:
+    """Assets backed up at once by the container, ASSET_WORKERS for each of the EVENT_WORKERS events in flight"""
+    concurrent_assets = get_int("CONCURRENT_ASSETS", None)
+    if concurrent_assets is None:
+        concurrent_assets = get_int("ASSET_WORKERS", 4) * get_int("EVENT_WORKERS", 4)
+    return max(1, concurrent_assets)
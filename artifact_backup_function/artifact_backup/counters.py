@@ -0,0 +1,56 @@
+import contextlib
+import contextvars
+import threading
+from concurrent.futures import Executor, Future
+from typing import Callable, Iterator
+
+# The counters of the asset being backed up, carried into the pools that upload its parts or download its ranges
+_current = contextvars.ContextVar("counters", default=None)
+# Work done outside a counting scope is counted per thread
+_thread_counters = threading.local()
+
+
+class Counters:
+    """Retries and new connections made on behalf of one asset, by whichever threads work on it"""
+
+    def __init__(self):
+        self.retry_attempts = 0
+        self.handshake_seconds = 0.0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def add_retry_attempts(self, retry_attempts: int) -> None:
+        with self._lock:
+            self.retry_attempts += retry_attempts
+
+    def add_connection(self, handshake_seconds: float) -> None:
+        with self._lock:
+            self.handshake_seconds += handshake_seconds
+            self.connections_opened += 1
+
+
+def current() -> Counters:
+    """The counters of the enclosing counting scope, or of the current thread outside of one"""
+    counters = _current.get()
+    if counters is None:
+        counters = getattr(_thread_counters, "counters", None)
+        if counters is None:
+            counters = _thread_counters.counters = Counters()
+    return counters
+
+
+@contextlib.contextmanager
+def counting() -> Iterator[Counters]:
+    """Count into new counters until the block exits, including work submitted to pools with submit"""
+    counters = Counters()
+    token = _current.set(counters)
+    try:
+        yield counters
+    finally:
+        _current.reset(token)
+
+
+def submit(executor: Executor, fn: Callable, *args) -> Future:
+    """Submit fn to executor so that it counts into the submitting thread's scope"""
+    # Each submission gets its own copy, a context can't be entered by two threads at once
+    return executor.submit(contextvars.copy_context().run, fn, *args)
@@ -0,0 +1,64 @@
+import collections
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+from artifact_backup import counters
+
+logger = logging.getLogger(__name__)
+
+
+def get_ranges(size: int, range_size: int) -> list:
+    """Inclusive (start, end) byte ranges covering an object of size"""
+    return [(start, min(start + range_size, size) - 1) for start in range(0, size, range_size)]
+
+
+def ranged_chunks(
+    fetch_range: Callable[[int, int], bytes],
+    size: int,
+    range_size: int,
+    concurrency: int,
+    max_attempts: int = 3,
+    backoff_seconds: float = 0.5,
+    sleep=time.sleep,
+) -> Iterator[bytes]:
+    """Download an object as byte ranges fetched concurrently, yielding the ranges in order
+
+    At most concurrency ranges are downloaded or waiting to be consumed at a time, which bounds the memory to
+    concurrency ranges. Each range is retried on its own, so a stalled or truncated range doesn't restart the
+    whole download.
+    """
+
+    def fetch_with_retries(start: int, end: int) -> bytes:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                content = fetch_range(start, end)
+                if len(content) != end - start + 1:
+                    raise ValueError("Received " + str(len(content)) + " bytes for range " + str(start) + "-" + str(end))
+                return content
+            except Exception as error:  # pylint: disable=broad-except
+                if attempt == max_attempts:
+                    raise
+                logger.warning("Retrying range %d-%d after attempt %d failed: %r", start, end, attempt, error)
+                sleep(backoff_seconds * 2 ** (attempt - 1))
+
+    ranges = iter(get_ranges(size, range_size))
+    futures = collections.deque()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        try:
+            for start, end in ranges:
+                futures.append(counters.submit(executor, fetch_with_retries, start, end))
+                if len(futures) == concurrency:
+                    break
+
+            while futures:
+                content = futures.popleft().result()
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    futures.append(counters.submit(executor, fetch_with_retries, *next_range))
+                yield content
+        finally:
+            # Ranges that haven't started are dropped when the consumer stops early or a range failed
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,48 @@
+import base64
+import hashlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+# CodeArtifact hash names and their hashlib algorithms in order of preference. SHA-256 comes first because it is
+# also the checksum S3 verifies, so one pass over the bytes serves both checks.
+HASH_ALGORITHMS = (
+    ("SHA-256", "sha256"),
+    ("SHA-512", "sha512"),
+    ("SHA-1", "sha1"),
+    ("MD5", "md5"),
+)
+
+
+def select_hash(hashes: dict) -> Optional[Tuple[str, str]]:
+    """The CodeArtifact hash name and hashlib algorithm an asset is verified with, None when no hash is known"""
+    for name, algorithm in HASH_ALGORITHMS:
+        if hashes.get(name):
+            return name, algorithm
+    return None
+
+
+def verify_chunks(chunks: Iterable[bytes], hashes: dict) -> Iterator[bytes]:
+    """Pass chunks through while hashing them, raising once the stream ends if the bytes don't match the expected hash"""
+    selected_hash = select_hash(hashes)
+    if selected_hash is None:
+        yield from chunks
+        return
+
+    name, algorithm = selected_hash
+    digest = hashlib.new(algorithm)
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+    expected = hashes[name].lower()
+    if digest.hexdigest() != expected:
+        raise ValueError("Checksum mismatch, expected " + name + " " + expected + " but received " + digest.hexdigest())
+
+
+def checksum_sha256(content: bytes) -> str:
+    """The base64 encoded SHA-256 of the content, as S3 expects it in ChecksumSHA256"""
+    return base64.b64encode(hashlib.sha256(content).digest()).decode("ascii")
+
+
+def hex_to_base64(hex_digest: str) -> str:
+    """Convert a hex digest such as the ones CodeArtifact reports to the base64 form S3 uses"""
+    return base64.b64encode(bytes.fromhex(hex_digest)).decode("ascii")
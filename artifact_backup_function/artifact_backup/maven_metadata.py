@@ -0,0 +1,127 @@
+import collections
+import datetime
+import threading
+import xml.etree.ElementTree as ElementTree
+from typing import Optional, Tuple
+
+# Versions in these states are no longer resolvable, so they are taken out of the package metadata
+REMOVED_STATES = ("Unlisted", "Archived", "Disposed", "Deleted")
+LAST_UPDATED_FORMAT = "%Y%m%d%H%M%S"
+
+
+def merge(
+    content: Optional[bytes], group_id: str, artifact_id: str, version: str, state: str, published_at: Optional[datetime.datetime]
+) -> bytes:
+    """Merge one version change into package level maven-metadata.xml content, None starting a new document
+
+    Published versions are added to the versions list and become latest, and release unless they are snapshots.
+    Changes older than the document's lastUpdated still add or remove their version but don't move latest or
+    release, so events merged out of order converge on the same document. A change without a time, such as a
+    backfilled version, only adds or removes its version. A document in the Maven metadata namespace keeps it.
+    """
+    root = ElementTree.fromstring(content) if content else new_document(group_id, artifact_id)
+    namespace = strip_namespace(root)
+    versioning = child(root, "versioning")
+    versions = child(versioning, "versions")
+    listed = [element.text for element in versions.findall("version")]
+
+    last_updated = versioning.findtext("lastUpdated")
+    timestamp = published_at.astimezone(datetime.timezone.utc).strftime(LAST_UPDATED_FORMAT) if published_at else None
+    is_newest = timestamp is not None and (last_updated is None or timestamp >= last_updated)
+
+    if state == "Published":
+        if version not in listed:
+            ElementTree.SubElement(versions, "version").text = version
+        if is_newest:
+            child(versioning, "latest").text = version
+            if not version.endswith("-SNAPSHOT"):
+                child(versioning, "release").text = version
+    elif state in REMOVED_STATES and version in listed:
+        versions.remove(versions.findall("version")[listed.index(version)])
+        listed.remove(version)
+        # latest and release fall back to the most recently added versions still listed
+        if versioning.findtext("latest") == version:
+            set_or_remove(versioning, "latest", listed[-1] if listed else None)
+        if versioning.findtext("release") == version:
+            releases = [listed_version for listed_version in listed if not listed_version.endswith("-SNAPSHOT")]
+            set_or_remove(versioning, "release", releases[-1] if releases else None)
+
+    if is_newest:
+        child(versioning, "lastUpdated").text = timestamp
+
+    order_versioning(versioning)
+    if namespace:
+        # Written back as the default namespace rather than under a generated prefix
+        root.attrib = {"xmlns": namespace, **root.attrib}
+    ElementTree.indent(root, space="    ")
+    return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def new_document(group_id: str, artifact_id: str) -> ElementTree.Element:
+    root = ElementTree.Element("metadata", modelVersion="1.1.0")
+    ElementTree.SubElement(root, "groupId").text = group_id
+    ElementTree.SubElement(root, "artifactId").text = artifact_id
+    return root
+
+
+def strip_namespace(root: ElementTree.Element) -> Optional[str]:
+    """Take the document's default namespace, such as http://maven.apache.org/METADATA/1.1.0, off its elements and return it"""
+    if not root.tag.startswith("{"):
+        return None
+
+    namespace = root.tag[1:].partition("}")[0]
+    prefix = "{" + namespace + "}"
+    for element in root.iter():
+        if element.tag.startswith(prefix):
+            element.tag = element.tag[len(prefix):]
+    return namespace
+
+
+def child(parent: ElementTree.Element, tag: str) -> ElementTree.Element:
+    element = parent.find(tag)
+    return element if element is not None else ElementTree.SubElement(parent, tag)
+
+
+def set_or_remove(parent: ElementTree.Element, tag: str, text: str) -> None:
+    element = parent.find(tag)
+    if text is not None:
+        child(parent, tag).text = text
+    elif element is not None:
+        parent.remove(element)
+
+
+def order_versioning(versioning: ElementTree.Element) -> None:
+    # Maven writes latest, release, versions and lastUpdated in this order, unknown elements keep their place after them
+    order = {"latest": 0, "release": 1, "versions": 2, "lastUpdated": 3}
+    versioning[:] = sorted(versioning, key=lambda element: order.get(element.tag, len(order)))
+
+
+class MetadataCache:
+    """The last known ETag and content of package metadata documents, least recently used ones are dropped"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, etag: str, content: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (etag, content)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
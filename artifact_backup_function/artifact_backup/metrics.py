@@ -0,0 +1,65 @@
+import json
+import sys
+import time
+from typing import Callable, Iterable, Iterator
+
+from artifact_backup import config
+
+MILLISECONDS = "Milliseconds"
+BYTES = "Bytes"
+MEGABYTES_PER_SECOND = "Megabytes/Second"
+COUNT = "Count"
+
+
+def stdout_sink(record: dict) -> None:
+    """Write a record as one line to stdout, where Lambda forwards it to CloudWatch Logs to be extracted as metrics"""
+    sys.stdout.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+# Records go to stdout unless a test or another runtime installs its own sink
+_sink = stdout_sink
+
+
+def set_sink(sink: Callable[[dict], None]) -> Callable[[dict], None]:
+    """Send records to another sink, returning the previous one so it can be restored"""
+    global _sink
+    previous_sink = _sink
+    _sink = sink
+    return previous_sink
+
+
+def emit(dimensions: dict, values: dict, properties: dict = None) -> None:
+    """Emit metric values, given as name to (value, unit), as a CloudWatch Embedded Metric Format record"""
+    if not config.get_bool("METRICS_ENABLED", True):
+        return
+
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": config.get_str("METRICS_NAMESPACE", "ArtifactBackup"),
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (value, unit) in values.items()],
+            }],
+        },
+    }
+    record.update(properties or {})
+    record.update(dimensions)
+    record.update((name, value) for name, (value, unit) in values.items())
+    _sink(record)
+
+
+def timed_iter(items: Iterable, stats: dict, seconds_name: str, bytes_name: str = None) -> Iterator:
+    """Pass items through, adding the seconds spent waiting for each one, and optionally their length, to stats"""
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stats[seconds_name] += time.perf_counter() - start
+        if bytes_name is not None:
+            stats[bytes_name] += len(item)
+        yield item
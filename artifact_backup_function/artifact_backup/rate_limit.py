@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Paces work so that all threads sharing the limiter together stay under a rate per second
+
+    The rate is counted in whatever unit the callers acquire, requests for the backfill's API calls and bytes
+    for the bandwidth of a routing target.
+    """
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_start = clock()
+
+    def acquire(self, cost: float = 1) -> None:
+        """Block until the caller may spend cost units of the rate, a rate of zero disables the limit"""
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            now = self._clock()
+            start = max(self._next_start, now)
+            self._next_start = start + cost / self.rate
+
+        if start > now:
+            self._sleep(start - now)
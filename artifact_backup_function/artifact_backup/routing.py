@@ -0,0 +1,181 @@
+import collections
+import fnmatch
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import environ
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from artifact_backup import clients
+from artifact_backup import config
+from artifact_backup import rate_limit
+
+# The routing table of this container, loaded on first use
+routing_table = None
+_routing_table_lock = threading.Lock()
+
+
+class Replica:
+    """A bucket in another region that receives a copy of every backup of a target"""
+
+    def __init__(self, bucket: str, region: str):
+        self.bucket = bucket
+        self.region = region
+
+    def __eq__(self, other):
+        return isinstance(other, Replica) and (self.bucket, self.region) == (other.bucket, other.region)
+
+    def __repr__(self):
+        return "Replica(" + self.bucket + "@" + self.region + ")"
+
+
+class Target:
+    """Where the backups of a set of repositories go, and how much of the function they may use at once"""
+
+    def __init__(
+        self, bucket: str = None, prefix: str = "", max_concurrency: int = None, bytes_per_second: float = 0, replicas: List[Replica] = None
+    ):
+        self._bucket = bucket
+        self.prefix = prefix
+        self.max_concurrency = max_concurrency
+        # Shared by every transfer of the target in the container, in bytes
+        self.bandwidth = rate_limit.RateLimiter(bytes_per_second)
+        self.replicas = replicas or []
+
+    @property
+    def bucket(self) -> str:
+        """The bucket of the target, the function's DESTINATION_BUCKET when the route names none"""
+        return self._bucket or environ["DESTINATION_BUCKET"]
+
+    def throttle(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass chunks through at the bandwidth of the target"""
+        for chunk in chunks:
+            self.bandwidth.acquire(len(chunk))
+            yield chunk
+
+
+class RoutingTable:
+    """Maps a domain and repository to the first matching route's target, or the default target when none match"""
+
+    def __init__(self, routes: List[Tuple[str, str, Target]], default: Target):
+        self.routes = routes
+        self.default = default
+
+    def get_target(self, domain_name: str, repository_name: str) -> Target:
+        for domain_pattern, repository_pattern, target in self.routes:
+            if fnmatch.fnmatchcase(domain_name, domain_pattern) and fnmatch.fnmatchcase(repository_name, repository_pattern):
+                return target
+        return self.default
+
+
+def parse_routing_table(document: dict) -> RoutingTable:
+    """Build a routing table from its JSON document, {"routes": [{"domain", "repository", "bucket", "prefix", ...}]}"""
+    routes = []
+    for route in document.get("routes", []):
+        if "domain" not in route:
+            raise ValueError("Every route of the routing table needs a domain:", route)
+        routes.append((route["domain"], route.get("repository", "*"), parse_target(route)))
+
+    return RoutingTable(routes, parse_target(document.get("default", {})))
+
+
+def parse_target(route: dict) -> Target:
+    """The target of a route, replicas default to REPLICA_DESTINATIONS for routes that don't list their own"""
+    if "replicas" in route:
+        replicas = [Replica(replica["bucket"], replica["region"]) for replica in route["replicas"]]
+    else:
+        replicas = parse_replicas(config.get_str("REPLICA_DESTINATIONS", ""))
+
+    # A route that can never start a transfer would leave its versions waiting forever
+    if route.get("maxConcurrency") is not None and route["maxConcurrency"] < 1:
+        raise ValueError("The maxConcurrency of a route must be at least 1:", route)
+    if route.get("maxBytesPerSecond", 0) < 0:
+        raise ValueError("The maxBytesPerSecond of a route can't be negative, 0 disables the limit:", route)
+
+    return Target(
+        bucket=route.get("bucket"),
+        prefix=route.get("prefix", ""),
+        max_concurrency=route.get("maxConcurrency"),
+        bytes_per_second=route.get("maxBytesPerSecond", 0),
+        replicas=replicas,
+    )
+
+
+def parse_replicas(destinations: str) -> List[Replica]:
+    """Replicas from a comma separated list of bucket@region"""
+    replicas = []
+    for destination in filter(None, (destination.strip() for destination in destinations.split(","))):
+        bucket, _, region = destination.partition("@")
+        if not bucket or not region:
+            raise ValueError("Replica destinations are written as bucket@region:", destination)
+        replicas.append(Replica(bucket, region))
+    return replicas
+
+
+def read_routing_table(source: str, s3_client=None) -> dict:
+    """The routing table document, given inline as JSON or as the s3://bucket/key of a JSON object"""
+    if not source.startswith("s3://"):
+        return json.loads(source)
+
+    # The table is read once per container, so it gets its own client rather than one shared with the transfers
+    s3_client = s3_client or clients.create_client("s3")
+    bucket, _, key = source[len("s3://"):].partition("/")
+    return json.loads(s3_client.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def get_routing_table() -> RoutingTable:
+    """The routing table from ROUTING_TABLE, read once per container, every repository goes to DESTINATION_BUCKET without one"""
+    global routing_table
+    if routing_table is None:
+        with _routing_table_lock:
+            if routing_table is None:
+                source = config.get_str("ROUTING_TABLE")
+                routing_table = parse_routing_table(read_routing_table(source) if source else {})
+    return routing_table
+
+
+def get_target(domain_name: str, repository_name: str) -> Target:
+    """The target a repository is backed up to"""
+    return get_routing_table().get_target(domain_name, repository_name)
+
+
+def run_fairly(jobs: List[Tuple[Target, Callable[[], object]]], max_workers: int) -> List[Future]:
+    """Run jobs on a pool, taking turns between their targets and keeping each target within its concurrency
+
+    A target with many jobs therefore can't take every worker while others wait. The futures are returned in the
+    order of the jobs.
+    """
+    queues = collections.OrderedDict()
+    for position, (target, job) in enumerate(jobs):
+        queues.setdefault(target, collections.deque()).append((position, job))
+
+    futures = [None] * len(jobs)
+    running = collections.Counter()
+    condition = threading.Condition()
+
+    def job_done(target):
+        with condition:
+            running[target] -= 1
+            condition.notify()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, condition:
+        while queues:
+            target = next(
+                (target for target in queues if target.max_concurrency is None or running[target] < target.max_concurrency), None
+            )
+            if target is None:
+                condition.wait()
+                continue
+
+            position, job = queues[target].popleft()
+            # The target goes to the back of the line once it has started a job
+            if queues[target]:
+                queues.move_to_end(target)
+            else:
+                del queues[target]
+
+            running[target] += 1
+            futures[position] = executor.submit(job)
+            futures[position].add_done_callback(lambda _, target=target: job_done(target))
+
+    return futures
@@ -0,0 +1,70 @@
+import socket
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from artifact_backup import counters
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection that records the time spent on the TCP and TLS handshake"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        counters.current().add_connection(time.perf_counter() - start)
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """Transport adapter that enables TCP keepalive, times new HTTPS connections and counts retried requests"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme, https=TimedHTTPSConnectionPool)
+
+    def send(self, request, *args, **kwargs):
+        response = super().send(request, *args, **kwargs)
+        # urllib3 records the throttled and failed attempts it retried on the response
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            counters.current().add_retry_attempts(len(retries.history))
+        return response
+
+
+def create_session(pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+    """Create a connection pooled session that retries throttled and failed requests with exponential backoff"""
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(("GET", "HEAD")),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = KeepAliveAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def handshake_seconds() -> float:
+    """Total time spent opening new connections in the current counting scope"""
+    return counters.current().handshake_seconds
+
+
+def connections_opened() -> int:
+    """Number of new connections opened in the current counting scope"""
+    return counters.current().connections_opened
@@ -0,0 +1,77 @@
+import argparse
+import json
+import logging
+import shutil
+
+from artifact_backup import config
+
+# With the content addressed layout each distinct asset is stored once under its SHA-256, and the Maven path of
+# every copy holds a small pointer object naming the blob
+PATH_LAYOUT = "path"
+CONTENT_LAYOUT = "content"
+BLOB_PREFIX = ".blobs/sha256/"
+BLOB_KEY_METADATA = "blob-key"
+# Index of the backups by SHA-256, so an asset already stored under another key is copied within S3
+INDEX_PREFIX = ".index/sha256/"
+INDEXED_KEY_METADATA = "backup-key"
+
+
+def is_content_addressed() -> bool:
+    """Whether assets are stored once per SHA-256 rather than once per Maven path"""
+    return config.get_str("STORAGE_LAYOUT", PATH_LAYOUT) == CONTENT_LAYOUT
+
+
+def get_blob_key(sha256: str) -> str:
+    """The key an asset's content is stored under in the content addressed layout"""
+    return BLOB_PREFIX + sha256.lower()
+
+
+def get_index_key(sha256: str) -> str:
+    """The key of the index entry naming a backup with the given SHA-256"""
+    return INDEX_PREFIX + sha256.lower()
+
+
+def get_pointer(blob_key: str, sha256: str, size: int = None) -> bytes:
+    """The body of the pointer object written at an asset's Maven path"""
+    pointer = {"blob": blob_key, "sha256": sha256.lower()}
+    if size is not None:
+        pointer["size"] = size
+    return json.dumps(pointer).encode("utf-8")
+
+
+def get_pointer_metadata(metadata: dict, blob_key: str) -> dict:
+    """The backup metadata of a pointer, naming its blob so it can be resolved without reading the body"""
+    pointer_metadata = dict(metadata)
+    pointer_metadata[BLOB_KEY_METADATA] = blob_key
+    return pointer_metadata
+
+
+def resolve_backup_key(s3_client, bucket: str, key: str) -> str:
+    """The key holding the content of a backup, following the pointer when the backup is content addressed"""
+    head_object_response = s3_client.head_object(Bucket=bucket, Key=key)
+    return head_object_response.get("Metadata", {}).get(BLOB_KEY_METADATA, key)
+
+
+def get_backup_object(s3_client, bucket: str, key: str) -> dict:
+    """Get the content of a backup by its Maven path, whichever layout it was stored with"""
+    return s3_client.get_object(Bucket=bucket, Key=resolve_backup_key(s3_client, bucket, key))
+
+
+def restore_backup(s3_client, bucket: str, key: str, path: str) -> None:
+    """Download the content of a backup to a local file"""
+    get_object_response = get_backup_object(s3_client, bucket, key)
+    with open(path, "wb") as output:
+        shutil.copyfileobj(get_object_response["Body"], output)
+
+
+if __name__ == "__main__":
+    from artifact_backup import clients
+
+    parser = argparse.ArgumentParser(description="Download a backed up asset by its Maven path, resolving content addressed pointers")
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--key", required=True, help="The backup key, for example my-domain/maven/my-repository/com/example/app/1.0/app-1.0.jar")
+    parser.add_argument("--output", required=True)
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    restore_backup(clients.create_client("s3"), arguments.bucket, arguments.key, arguments.output)
@@ -0,0 +1,38 @@
+import threading
+import time
+from typing import Callable, Hashable, Tuple
+
+
+class TokenCache:
+    """Thread safe cache of authorization tokens that are refreshed ahead of their expiry
+
+    Tokens live at module scope in the function, so they are kept across warm invocations of the same container.
+    """
+
+    def __init__(self, refresh_margin_seconds: float, clock: Callable[[], float] = time.time):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._clock = clock
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Tuple[str, float]]) -> str:
+        """Return the cached token for key, calling fetch for a new (token, expires_at) pair when it is missing or about to expire"""
+        with self._lock:
+            cached = self._tokens.get(key)
+            if cached is not None and cached[1] - self.refresh_margin_seconds > self._clock():
+                return cached[0]
+
+            # Fetch while holding the lock so concurrent workers don't all request a token for the same domain
+            token, expires_at = fetch()
+            self._tokens[key] = (token, expires_at)
+            return token
+
+    def evict(self, key: Hashable) -> None:
+        """Drop the token for key, for example after CodeArtifact rejected it"""
+        with self._lock:
+            self._tokens.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every cached token"""
+        with self._lock:
+            self._tokens.clear()
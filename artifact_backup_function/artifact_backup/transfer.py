@@ -0,0 +1,227 @@
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List
+
+from artifact_backup import counters
+from artifact_backup import integrity
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# S3 accepts at most 10,000 parts per multipart upload
+MAX_PARTS = 10000
+# CopyObject handles objects up to 5 GiB, larger ones are copied in ranges with UploadPartCopy
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * 1024 * 1024
+DEFAULT_COPY_PART_SIZE = 512 * 1024 * 1024
+
+
+def read_parts(chunks: Iterable[bytes], part_size: int) -> Iterator[bytes]:
+    """Re-slice arbitrarily sized chunks into part_size blocks, buffering at most one part in memory"""
+    buffer = bytearray()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        # Chunks that already are whole parts, such as ranged downloads, are passed through without copying
+        if not buffer and len(chunk) == part_size:
+            yield chunk
+            continue
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+
+    if buffer:
+        yield bytes(buffer)
+
+
+def choose_part_size(size: int, min_part_size: int = DEFAULT_PART_SIZE) -> int:
+    """The smallest part size of at least min_part_size, in whole MiB, that fits an object of size into MAX_PARTS parts"""
+    if size is None:
+        return min_part_size
+    mebibyte = 1024 * 1024
+    part_size = max(min_part_size, -(-size // MAX_PARTS))
+    return -(-part_size // mebibyte) * mebibyte
+
+
+def choose_concurrency(part_size: int, memory_bytes: int, cpu_count: int, max_concurrency: int) -> int:
+    """Parts uploaded at once, bounded by the memory the buffered parts may take and by the available CPUs"""
+    return max(1, min(max_concurrency, memory_bytes // part_size, cpu_count * 4))
+
+
+def multipart_upload(
+    s3_client,
+    parts: Iterable[bytes],
+    bucket: str,
+    key: str,
+    metadata: dict = None,
+    checksums: bool = False,
+    concurrency: int = 1,
+    tagging: str = None,
+) -> dict:
+    """Upload parts as an S3 multipart upload, aborting the upload if any part fails
+
+    Parts are read in order from the iterable and up to concurrency of them are uploaded at once, so at most
+    concurrency + 1 parts are held in memory. With checksums, each part carries its SHA-256 so S3 rejects parts
+    that were corrupted on the way. The URL encoded tagging is set on the object when the upload is created.
+    """
+    create_kwargs = {"ChecksumAlgorithm": "SHA256"} if checksums else {}
+    if tagging:
+        create_kwargs["Tagging"] = tagging
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, Metadata=metadata or {}, **create_kwargs)["UploadId"]
+
+    def upload_part(part_number: int, body: bytes) -> dict:
+        part_kwargs = {"ChecksumSHA256": integrity.checksum_sha256(body)} if checksums else {}
+        upload_part_response = s3_client.upload_part(
+            Body=body,
+            Bucket=bucket,
+            Key=key,
+            PartNumber=part_number,
+            UploadId=upload_id,
+            **part_kwargs,
+        )
+        completed_part = {"ETag": upload_part_response["ETag"], "PartNumber": part_number}
+        completed_part.update(part_kwargs)
+        return completed_part
+
+    try:
+        if concurrency > 1:
+            completed_parts = _upload_parts_concurrently(upload_part, parts, concurrency)
+        else:
+            completed_parts = [upload_part(part_number, body) for part_number, body in enumerate(parts, start=1)]
+
+        return s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            MultipartUpload={"Parts": completed_parts},
+            UploadId=upload_id,
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def _upload_parts_concurrently(upload_part, parts: Iterable[bytes], concurrency: int) -> list:
+    in_flight = threading.BoundedSemaphore(concurrency)
+    failed = threading.Event()
+
+    def part_done(future):
+        if future.exception() is not None:
+            failed.set()
+        in_flight.release()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for part_number, body in enumerate(parts, start=1):
+            in_flight.acquire()
+            # Stop reading the source once a part has failed, the upload is going to be aborted
+            if failed.is_set():
+                in_flight.release()
+                break
+            future = counters.submit(executor, upload_part, part_number, body)
+            future.add_done_callback(part_done)
+            futures.append(future)
+
+    return [future.result() for future in futures]
+
+
+def multipart_copy(
+    s3_client,
+    source_bucket: str,
+    source_key: str,
+    bucket: str,
+    key: str,
+    size: int,
+    part_size: int,
+    metadata: dict = None,
+    tagging: str = None,
+) -> dict:
+    """Copy an object within S3 in byte ranges as a multipart upload, aborting the upload if any part fails"""
+    create_kwargs = {"Tagging": tagging} if tagging else {}
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, Metadata=metadata or {}, **create_kwargs)["UploadId"]
+
+    try:
+        completed_parts = []
+        for part_number, offset in enumerate(range(0, size, part_size), start=1):
+            upload_part_copy_response = s3_client.upload_part_copy(
+                Bucket=bucket,
+                Key=key,
+                CopySource={"Bucket": source_bucket, "Key": source_key},
+                CopySourceRange="bytes=" + str(offset) + "-" + str(min(offset + part_size, size) - 1),
+                PartNumber=part_number,
+                UploadId=upload_id,
+            )
+            completed_parts.append({"ETag": upload_part_copy_response["CopyPartResult"]["ETag"], "PartNumber": part_number})
+
+        return s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            MultipartUpload={"Parts": completed_parts},
+            UploadId=upload_id,
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+class _SourceFailed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def tee(chunks: Iterable[bytes], consumers: List[Callable[[Iterator[bytes]], object]], max_buffered_chunks: int = 4) -> List[Future]:
+    """Read chunks once and hand every chunk to each consumer, running the consumers concurrently
+
+    Each consumer gets its own iterator and buffers at most max_buffered_chunks, so the source is read at the pace
+    of the slowest consumer still running. A consumer that fails or stops early is dropped without holding up the
+    others. When the source fails, its error is raised from every consumer's iterator and then from tee. The
+    futures hold each consumer's result or error, in the order of the consumers.
+    """
+    queues = [queue.Queue(max_buffered_chunks) for _ in consumers]
+    stopped = [threading.Event() for _ in consumers]
+
+    def drain(chunk_queue: queue.Queue) -> Iterator[bytes]:
+        while True:
+            item = chunk_queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _SourceFailed):
+                raise item.error
+            yield item
+
+    def run(consumer, chunk_queue: queue.Queue, consumer_stopped: threading.Event):
+        try:
+            return consumer(drain(chunk_queue))
+        finally:
+            consumer_stopped.set()
+
+    def put(item) -> None:
+        for chunk_queue, consumer_stopped in zip(queues, stopped):
+            # Polling lets a consumer that stopped reading be skipped instead of blocking the source forever
+            while not consumer_stopped.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    with ThreadPoolExecutor(max_workers=max(1, len(consumers))) as executor:
+        futures = [
+            counters.submit(executor, run, consumer, chunk_queue, consumer_stopped)
+            for consumer, chunk_queue, consumer_stopped in zip(consumers, queues, stopped)
+        ]
+        try:
+            for chunk in chunks:
+                if all(consumer_stopped.is_set() for consumer_stopped in stopped):
+                    break
+                put(chunk)
+        except BaseException as error:
+            put(_SourceFailed(error))
+            raise
+        put(_END)
+
+    return futures
@@ -4,4 +4,5 @@ from __future__ import absolute_import
 
 from model.aws.code_artifact.marshaller import Marshaller
 from model.aws.code_artifact.aws_event import AWSEvent
-from model.aws.code_artifact.code_artifact_state_change_notification import CodeArtifactChangeNotification
\ No newline at end of file
+from model.aws.code_artifact.code_artifact_state_change_notification import CodeArtifactChangeNotification
+from model.aws.code_artifact.code_artifact_changes import CodeArtifactChanges
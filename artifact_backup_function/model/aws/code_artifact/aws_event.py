@@ -1,10 +1,20 @@
 # coding: utf-8
 
-import pprint
-
-import six
 
 class AWSEvent(object):
+    # Slots instead of a per-instance __dict__ keep the event small when thousands are held in memory
+    __slots__ = (
+        'detail',
+        'detail_type',
+        'resources',
+        'id',
+        'source',
+        'time',
+        'region',
+        'version',
+        'account'
+    )
+
     _types = {
         'detail': 'CodeArtifactChangeNotification',
         'detail_type': 'str',
@@ -30,16 +40,6 @@ class AWSEvent(object):
     }
 
     def __init__(self, detail=None, detail_type=None, resources=None, id=None, source=None, time=None, region=None, version=None, account=None):  # noqa: E501
-        self._detail = None
-        self._detail_type = None
-        self._resources = None
-        self._id = None
-        self._source = None
-        self._time = None
-        self._region = None
-        self._version = None
-        self._account = None
-        self.discriminator = None
         self.detail = detail
         self.detail_type = detail_type
         self.resources = resources
@@ -50,127 +50,15 @@ class AWSEvent(object):
         self.version = version
         self.account = account
 
-    @property
-    def detail(self):
-
-        return self._detail
-
-    @detail.setter
-    def detail(self, detail):
-
-        if detail is None:
-            raise ValueError("Invalid value for `detail`, must not be `None`")  # noqa: E501
-
-        self._detail = detail
-
-    @property
-    def detail_type(self):
-
-        return self._detail_type
-
-    @detail_type.setter
-    def detail_type(self, detail_type):
-
-        if detail_type is None:
-            raise ValueError("Invalid value for `detail_type`, must not be `None`")  # noqa: E501
-
-        self._detail_type = detail_type
-
-    @property
-    def resources(self):
-
-        return self._resources
-
-    @resources.setter
-    def resources(self, resources):
-
-        if resources is None:
-            raise ValueError("Invalid value for `resources`, must not be `None`")  # noqa: E501
-
-        self._resources = resources
-
-    @property
-    def id(self):
-
-        return self._id
-
-    @id.setter
-    def id(self, id):
-
-        if id is None:
-            raise ValueError("Invalid value for `id`, must not be `None`")  # noqa: E501
-
-        self._id = id
-
-    @property
-    def source(self):
-
-        return self._source
-
-    @source.setter
-    def source(self, source):
-
-        if source is None:
-            raise ValueError("Invalid value for `source`, must not be `None`")  # noqa: E501
-
-        self._source = source
-
-    @property
-    def time(self):
-
-        return self._time
-
-    @time.setter
-    def time(self, time):
-
-        if time is None:
-            raise ValueError("Invalid value for `time`, must not be `None`")  # noqa: E501
-
-        self._time = time
-
-    @property
-    def region(self):
-
-        return self._region
-
-    @region.setter
-    def region(self, region):
-
-        if region is None:
-            raise ValueError("Invalid value for `region`, must not be `None`")  # noqa: E501
-
-        self._region = region
-
-    @property
-    def version(self):
-
-        return self._version
-
-    @version.setter
-    def version(self, version):
-
-        if version is None:
-            raise ValueError("Invalid value for `version`, must not be `None`")  # noqa: E501
-
-        self._version = version
-
-    @property
-    def account(self):
-
-        return self._account
-
-    @account.setter
-    def account(self, account):
-
-        if account is None:
-            raise ValueError("Invalid value for `account`, must not be `None`")  # noqa: E501
-
-        self._account = account
+        # Every attribute of an EventBridge event is required
+        for attr in self.__slots__:
+            if getattr(self, attr) is None:
+                raise ValueError("Invalid value for `" + attr + "`, must not be `None`")  # noqa: E501
 
     def to_dict(self):
         result = {}
 
-        for attr, _ in six.iteritems(self._types):
+        for attr in self._types:
             value = getattr(self, attr)
             if isinstance(value, list):
                 result[attr] = list(map(
@@ -187,13 +75,11 @@ class AWSEvent(object):
                 ))
             else:
                 result[attr] = value
-        if issubclass(AWSEvent, dict):
-            for key, value in self.items():
-                result[key] = value
 
         return result
 
     def to_str(self):
+        import pprint
         return pprint.pformat(self.to_dict())
 
     def __repr__(self):
@@ -203,7 +89,7 @@ class AWSEvent(object):
         if not isinstance(other, AWSEvent):
             return False
 
-        return self.__dict__ == other.__dict__
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
 
     def __ne__(self, other):
         return not self == other
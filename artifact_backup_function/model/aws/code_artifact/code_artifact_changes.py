@@ -0,0 +1,62 @@
+# coding: utf-8
+
+class CodeArtifactChanges(object):
+    __slots__ = (
+        'assets_added',
+        'assets_removed',
+        'assets_updated',
+        'metadata_updated',
+        'status_changed'
+    )
+
+    _types = {
+        'assets_added': 'int',
+        'assets_removed': 'int',
+        'assets_updated': 'int',
+        'metadata_updated': 'bool',
+        'status_changed': 'bool'
+    }
+
+    _attribute_map = {
+        'assets_added': 'assetsAdded',
+        'assets_removed': 'assetsRemoved',
+        'assets_updated': 'assetsUpdated',
+        'metadata_updated': 'metadataUpdated',
+        'status_changed': 'statusChanged'
+    }
+
+    def __init__(self,
+                assets_added=None,
+                assets_removed=None,
+                assets_updated=None,
+                metadata_updated=None,
+                status_changed=None):  # noqa: E501
+        self.assets_added = assets_added
+        self.assets_removed = assets_removed
+        self.assets_updated = assets_updated
+        self.metadata_updated = metadata_updated
+        self.status_changed = status_changed
+
+    def to_dict(self):
+        result = {}
+
+        for attr in self._types:
+            result[attr] = getattr(self, attr)
+
+        return result
+
+    def to_str(self):
+        import pprint
+        return pprint.pformat(self.to_dict())
+
+    def __repr__(self):
+        return self.to_str()
+
+    def __eq__(self, other):
+        if not isinstance(other, CodeArtifactChanges):
+            return False
+
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
@@ -1,10 +1,22 @@
 # coding: utf-8
-import pprint
-
-import six
 
 class CodeArtifactChangeNotification(object):
-
+    __slots__ = (
+        'repository_name',
+        'package_name',
+        'package_version',
+        'package_format',
+        'domain_owner',
+        'package_version_state',
+        'domain_name',
+        'package_namespace',
+        'package_version_revision',
+        'event_deduplication_id',
+        'sequence_number',
+        'operation_type',
+        'repository_administrator',
+        'changes'
+    )
 
     _types = {
         'repository_name': 'str',
@@ -14,7 +26,13 @@ class CodeArtifactChangeNotification(object):
         'domain_owner': 'str',
         'package_version_state': 'str',
         'domain_name': 'str',
-        'package_namespace': 'str'
+        'package_namespace': 'str',
+        'package_version_revision': 'str',
+        'event_deduplication_id': 'str',
+        'sequence_number': 'int',
+        'operation_type': 'str',
+        'repository_administrator': 'str',
+        'changes': 'CodeArtifactChanges'
     }
 
     _attribute_map = {
@@ -25,22 +43,30 @@ class CodeArtifactChangeNotification(object):
         'domain_owner': 'domainOwner',
         'package_version_state': 'packageVersionState',
         'domain_name': 'domainName',
-        'package_namespace': 'packageNamespace'
+        'package_namespace': 'packageNamespace',
+        'package_version_revision': 'packageVersionRevision',
+        'event_deduplication_id': 'eventDeduplicationId',
+        'sequence_number': 'sequenceNumber',
+        'operation_type': 'operationType',
+        'repository_administrator': 'repositoryAdministrator',
+        'changes': 'changes'
     }
 
-    def __init__(self, 
-                repository_name=None, 
-                package_name=None, 
+    def __init__(self,
+                repository_name=None,
+                package_name=None,
                 package_version=None,
                 package_format=None,
                 domain_owner=None,
                 package_version_state=None,
                 domain_name=None,
-                package_namespace=None):  # noqa: E501
-        self._repository_name = None
-        self._package_name = None
-        self._package_version = None
-        self.discriminator = None
+                package_namespace=None,
+                package_version_revision=None,
+                event_deduplication_id=None,
+                sequence_number=None,
+                operation_type=None,
+                repository_administrator=None,
+                changes=None):  # noqa: E501
         self.repository_name = repository_name
         self.package_name = package_name
         self.package_version = package_version
@@ -49,92 +75,17 @@ class CodeArtifactChangeNotification(object):
         self.domain_name = domain_name
         self.package_format = package_format
         self.package_namespace = package_namespace
-
-    @property
-    def repository_name(self):
-        return self._repository_name
-
-    @repository_name.setter
-    def repository_name(self, repository_name):
-        self._repository_name = repository_name
-
-    @property
-    def package_name(self):
-
-        return self._package_name
-
-    @package_name.setter
-    def package_name(self, package_name):
-
-
-        self._package_name = package_name
-
-    @property
-    def package_version(self):
-        return self._package_version
-
-    @package_version.setter
-    def package_version(self, package_version):
-
-
-        self._package_version = package_version
-
-
-    @property
-    def domain_owner(self):
-        return self._domain_owner
-    
-    @domain_owner.setter
-    def domain_owner(self, domain_owner):
-
-
-        self._domain_owner = domain_owner
-
-    @property
-    def package_version_state(self):
-        return self._package_version_state
-    
-    @package_version_state.setter
-    def package_version_state(self, package_version_state):
-
-
-        self._package_version_state = package_version_state
-
-    @property
-    def domain_name(self):
-        return self._domain_name
-    
-    @domain_name.setter
-    def domain_name(self, domain_name):
-
-
-        self._domain_name = domain_name
-
-
-    @property
-    def package_format(self):
-        return self._package_format
-
-    @package_format.setter
-    def package_format(self, package_format):
-
-
-        self._package_format = package_format
-
-    @property
-    def package_namespace(self):
-        return self._package_namespace
-
-    @package_namespace.setter
-    def package_namespace(self, package_namespace):
-
-
-        self._package_namespace = package_namespace
+        self.package_version_revision = package_version_revision
+        self.event_deduplication_id = event_deduplication_id
+        self.sequence_number = sequence_number
+        self.operation_type = operation_type
+        self.repository_administrator = repository_administrator
+        self.changes = changes
 
     def to_dict(self):
         result = {}
 
-        for attr, _ in six.iteritems(self._types):
+        for attr in self._types:
             value = getattr(self, attr)
             if isinstance(value, list):
                 result[attr] = list(map(
@@ -151,13 +102,11 @@ class CodeArtifactChangeNotification(object):
                 ))
             else:
                 result[attr] = value
-        if issubclass(CodeArtifactChangeNotification, dict):
-            for key, value in self.items():
-                result[key] = value
 
         return result
 
     def to_str(self):
+        import pprint
         return pprint.pformat(self.to_dict())
 
     def __repr__(self):
@@ -167,7 +116,7 @@ class CodeArtifactChangeNotification(object):
         if not isinstance(other, CodeArtifactChangeNotification):
             return False
 
-        return self.__dict__ == other.__dict__
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
 
     def __ne__(self, other):
-        return not self == other
\ No newline at end of file
+        return not self == other
@@ -1,11 +1,21 @@
 import datetime
+import functools
 import re
-import six
+import threading
 
 import model.aws.code_artifact
 
+@functools.lru_cache(maxsize=None)
+def dateutil_parser():
+    """dateutil is only needed for timestamps that aren't ISO 8601, so it is imported once on first use"""
+    try:
+        from dateutil.parser import parse
+        return parse
+    except ImportError:
+        return None
+
 class Marshaller:
-    PRIMITIVE_TYPES = (float, bool, bytes, six.text_type) + six.integer_types
+    PRIMITIVE_TYPES = (float, bool, bytes, str, int)
 
     NATIVE_TYPES_MAPPING = {
         'int': int,
@@ -17,6 +27,15 @@ class Marshaller:
         'object': object,
     }
 
+    LIST_TYPE_PATTERN = re.compile(r'list\[(.*)\]')
+    DICT_TYPE_PATTERN = re.compile(r'dict\(([^,]*), (.*)\)')
+
+    # Decode plans by type name or class, and attribute plans by model class. Both are built on first use.
+    _decoders = {}
+    _encoders = {}
+    # Decode plans are compiled by one thread at a time and only published once they are complete
+    _compile_lock = threading.RLock()
+
     @classmethod
     def marshall(cls, obj):
         if obj is None:
@@ -33,14 +52,15 @@ class Marshaller:
             return obj.isoformat()
 
         if isinstance(obj, dict):
-            obj_dict = obj
-        else:
-            obj_dict = {obj._attribute_map[attr]: getattr(obj, attr)
-                        for attr, _ in six.iteritems(obj._types)
-                        if getattr(obj, attr) is not None}
+            return {key: cls.marshall(val)
+                    for key, val in obj.items()}
 
-        return {key: cls.marshall(val)
-                for key, val in six.iteritems(obj_dict)}
+        result = {}
+        for attr, key in cls.__encoder(type(obj)):
+            value = getattr(obj, attr)
+            if value is not None:
+                result[key] = cls.marshall(value)
+        return result
 
     @classmethod
     def unmarshall(cls, data, typeName):
@@ -48,42 +68,109 @@ class Marshaller:
         if data is None:
             return None
 
+        return cls.__decoder(typeName)(data)
+
+    @classmethod
+    def __encoder(cls, kls):
+        encoder = cls._encoders.get(kls)
+        if encoder is None:
+            encoder = tuple((attr, kls._attribute_map[attr])
+                            for attr in kls._types)
+            cls._encoders[kls] = encoder
+        return encoder
+
+    @classmethod
+    def __decoder(cls, typeName, pending=None):
+        decoder = cls._decoders.get(typeName)
+        if decoder is not None:
+            return decoder
+        if pending is not None and typeName in pending:
+            return pending[typeName]
+
+        with cls._compile_lock:
+            decoder = cls._decoders.get(typeName)
+            if decoder is not None:
+                return decoder
+
+            # Plans compiled along the way stay private to this call until every one of them is complete
+            compiling = {} if pending is None else pending
+            decoder = cls.__compile(typeName, compiling)
+            compiling[typeName] = decoder
+            if pending is None:
+                cls._decoders.update(compiling)
+        return decoder
+
+    @classmethod
+    def __compile(cls, typeName, pending):
         if type(typeName) == str:
             if typeName.startswith('list['):
-                sub_kls = re.match(r'list\[(.*)\]', typeName).group(1)
-                return [cls.unmarshall(sub_data, sub_kls)
-                        for sub_data in data]
+                sub_decoder = cls.__decoder(cls.LIST_TYPE_PATTERN.match(typeName).group(1), pending)
+                return lambda data: [None if sub_data is None else sub_decoder(sub_data)
+                                     for sub_data in data]
 
             if typeName.startswith('dict('):
-                sub_kls = re.match(r'dict\(([^,]*), (.*)\)', typeName).group(2)
-                return {k: cls.unmarshall(v, sub_kls)
-                        for k, v in six.iteritems(data)}
+                sub_decoder = cls.__decoder(cls.DICT_TYPE_PATTERN.match(typeName).group(2), pending)
+                return lambda data: {k: None if v is None else sub_decoder(v)
+                                     for k, v in data.items()}
 
             if typeName in cls.NATIVE_TYPES_MAPPING:
                 typeName = cls.NATIVE_TYPES_MAPPING[typeName]
             else:
                 typeName = getattr(model.aws.code_artifact, typeName)
 
-        if typeName in cls.PRIMITIVE_TYPES:
-            return cls.__unmarshall_primitive(data, typeName)
+        if typeName == bool:
+            return cls.__unmarshall_bool
+        elif typeName in cls.PRIMITIVE_TYPES:
+            return lambda data: cls.__unmarshall_primitive(data, typeName)
         elif typeName == object:
-            return cls.__unmarshall_object(data)
+            return cls.__unmarshall_object
         elif typeName == datetime.date:
-            return cls.__unmarshall_date(data)
+            return cls.__unmarshall_date
         elif typeName == datetime.datetime:
-            return cls.__unmarshall_datatime(data)
+            return cls.__unmarshall_datatime
+        elif issubclass(typeName, dict) or 'get_real_child_model' in typeName.__dict__:
+            # Dict models and polymorphic models keep the general purpose path
+            return lambda data: cls.__unmarshall_model(data, typeName)
         else:
-            return cls.__unmarshall_model(data, typeName)
+            return cls.__compile_model(typeName, pending)
+
+    @classmethod
+    def __compile_model(cls, typeName, pending):
+        if not typeName._types:
+            return cls.__unmarshall_object
+
+        # Register the plan with the pending ones before resolving attribute types so self referencing models terminate
+        fields = []
+        def decode(data):
+            kwargs = {}
+            if isinstance(data, (list, dict)):
+                for attr, key, sub_decoder in fields:
+                    if key in data:
+                        value = data[key]
+                        kwargs[attr] = None if value is None else sub_decoder(value)
+            return typeName(**kwargs)
+
+        pending[typeName] = decode
+        fields.extend((attr, typeName._attribute_map[attr], cls.__decoder(attr_type, pending))
+                      for attr, attr_type in typeName._types.items())
+        return decode
 
     @classmethod
     def __unmarshall_primitive(cls, data, typeName):
         try:
             return typeName(data)
         except UnicodeEncodeError:
-            return six.text_type(data)
+            return str(data)
         except TypeError:
             return data
 
+    @classmethod
+    def __unmarshall_bool(cls, value):
+        # CodeArtifact sends some flags as the strings "true" and "false"
+        if isinstance(value, str):
+            return value.strip().lower() == 'true'
+        return bool(value)
+
     @classmethod
     def __unmarshall_object(cls, value):
         return value
@@ -91,18 +178,25 @@ class Marshaller:
     @classmethod
     def __unmarshall_date(cls, string):
         try:
-            from dateutil.parser import parse
+            return datetime.date.fromisoformat(string)
+        except (TypeError, ValueError):
+            parse = dateutil_parser()
+            if parse is None:
+                return string
             return parse(string).date()
-        except ImportError:
-            return string
 
     @classmethod
     def __unmarshall_datatime(cls, string):
+        # EventBridge always sends RFC 3339 UTC timestamps such as 2024-07-23T11:55:55Z
         try:
-            from dateutil.parser import parse
+            if string.endswith('Z'):
+                string = string[:-1] + '+00:00'
+            return datetime.datetime.fromisoformat(string)
+        except (AttributeError, ValueError):
+            parse = dateutil_parser()
+            if parse is None:
+                return string
             return parse(string)
-        except ImportError:
-            return string
 
     @classmethod
     def __unmarshall_model(cls, data, typeName):
@@ -112,7 +206,7 @@ class Marshaller:
 
         kwargs = {}
         if typeName._types is not None:
-            for attr, attr_type in six.iteritems(typeName._types):
+            for attr, attr_type in typeName._types.items():
                 if (data is not None and
                         typeName._attribute_map[attr] in data and
                         isinstance(data, (list, dict))):
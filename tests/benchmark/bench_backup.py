@@ -0,0 +1,234 @@
+"""End to end throughput benchmark of the backup function without an AWS account
+
+CodeArtifact downloads are served by a local HTTP server holding synthetic Maven assets, and S3 is replaced by
+moto's in-memory implementation. The asset listing and auth token calls, which moto doesn't implement for
+CodeArtifact, are answered by the benchmark itself.
+
+Run from the repository root:
+
+    python tests/benchmark/bench_backup.py [--scenario handler|batch|backfill] [--events N] [--assets N] [--asset-size BYTES]
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "artifact_backup_function"))
+
+import moto  # noqa: E402
+
+BUCKET = "artifact-backup-benchmark"
+DOMAIN = "benchmark-domain"
+OWNER = "111122223333"
+REPOSITORY = "benchmark-repository"
+NAMESPACE = "com.example.benchmark"
+STAGES = ("AuthTokenTime", "ListAssetsTime", "BackupTime", "DownloadTime", "UploadTime")
+
+
+class AssetServer(http.server.ThreadingHTTPServer):
+    """Serves the same synthetic asset body at every path, standing in for the CodeArtifact Maven endpoint"""
+
+    daemon_threads = True
+
+    def __init__(self, body: bytes):
+        super().__init__(("127.0.0.1", 0), AssetRequestHandler)
+        self.body = body
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:" + str(self.server_address[1]) + "/"
+
+
+class AssetRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+
+    def do_GET(self):
+        # Packages have no maven-metadata.xml in CodeArtifact yet, the backup starts a new one
+        if self.path.endswith("/maven-metadata.xml"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        view = memoryview(self.server.body)
+        byte_range = self.headers.get("Range")
+        if byte_range:
+            start, end = (int(offset) for offset in byte_range[len("bytes="):].split("-"))
+            view = view[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes " + str(start) + "-" + str(end) + "/" + str(len(self.server.body)))
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/java-archive")
+        self.send_header("Content-Length", str(len(view)))
+        self.end_headers()
+        for offset in range(0, len(view), 1024 * 1024):
+            self.wfile.write(view[offset:offset + 1024 * 1024])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_event(index: int) -> dict:
+    """A publish event for its own version of the benchmark package, so every event copies new keys"""
+    return {
+        "account": OWNER,
+        "detail": {
+            "domainName": DOMAIN,
+            "domainOwner": OWNER,
+            "eventDeduplicationId": "benchmark-" + str(index),
+            "operationType": "Created",
+            "packageFormat": "maven",
+            "packageName": "library",
+            "packageNamespace": NAMESPACE,
+            "packageVersion": "1." + str(index),
+            "packageVersionRevision": "revision-" + str(index),
+            "packageVersionState": "Published",
+            "repositoryAdministrator": OWNER,
+            "repositoryName": REPOSITORY,
+            "sequenceNumber": 1,
+        },
+        "detail-type": "CodeArtifact Package Version State Change",
+        "id": "benchmark-" + str(index),
+        "region": "us-east-1",
+        "resources": [],
+        "source": "aws.codeartifact",
+        "time": "2024-07-23T11:55:55Z",
+        "version": "0",
+    }
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss_megabytes() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("handler", "batch", "backfill"), default="handler")
+    parser.add_argument("--events", type=int, default=20, help="Package versions to back up")
+    parser.add_argument("--assets", type=int, default=4, help="Assets per package version")
+    parser.add_argument("--asset-size", type=int, default=1024 * 1024, help="Size of each asset in bytes")
+    parser.add_argument("--batch-size", type=int, default=10, help="Events per SQS batch in the batch scenario")
+    arguments = parser.parse_args()
+
+    os.environ.update({
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "DESTINATION_BUCKET": BUCKET,
+        # Every event is a new version, measure full copies rather than the shortcuts for repeated assets
+        "SKIP_EXISTING_ASSETS": "false",
+        "COPY_EXISTING_ASSETS": "false",
+    })
+
+    body = hashlib.sha256(b"benchmark").digest() * (arguments.asset_size // 32 + 1)
+    body = body[:arguments.asset_size]
+    hashes = {"SHA-256": hashlib.sha256(body).hexdigest()}
+    names = ["library-asset-" + str(index) + ".jar" for index in range(arguments.assets)]
+
+    server = AssetServer(body)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with moto.mock_aws():
+        from artifact_backup import app
+        from artifact_backup import backfill
+        from artifact_backup import metrics
+        from artifact_backup import rate_limit
+
+        app.get_s3_client().create_bucket(Bucket=BUCKET)
+        records = []
+        metrics.set_sink(records.append)
+
+        def list_package_version_assets(code_artifact_notification, next_token=None):
+            assets = [{"name": name, "size": len(body), "hashes": hashes} for name in names]
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}, "assets": assets}
+
+        def get_authorization_token(domain_name, domain_owner=None, duration_seconds=None):
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}, "authorizationToken": "benchmark-token"}
+
+        def get_full_url(code_artifact_notification, aws_event, package_location):
+            return server.url + package_location
+
+        def list_packages(domain_name, domain_owner, repository_name, rate_limiter):
+            return iter([{"namespace": NAMESPACE, "package": "library"}])
+
+        def list_package_versions(domain_name, domain_owner, repository_name, package, status, rate_limiter):
+            return iter([{"version": "1." + str(index), "revision": "revision-" + str(index)} for index in range(arguments.events)])
+
+        patches = [
+            mock.patch("artifact_backup.app.list_package_version_assets", side_effect=list_package_version_assets),
+            mock.patch("artifact_backup.app.get_authorization_token", side_effect=get_authorization_token),
+            mock.patch("artifact_backup.app.get_full_url", side_effect=get_full_url),
+            mock.patch("artifact_backup.backfill.list_packages", side_effect=list_packages),
+            mock.patch("artifact_backup.backfill.list_package_versions", side_effect=list_package_versions),
+        ]
+        for patch in patches:
+            patch.start()
+
+        events = [create_event(index) for index in range(arguments.events)]
+        start = time.perf_counter()
+        if arguments.scenario == "handler":
+            for event in events:
+                app.lambda_handler(event, None)
+        elif arguments.scenario == "batch":
+            for offset in range(0, len(events), arguments.batch_size):
+                batch = events[offset:offset + arguments.batch_size]
+                response = app.sqs_batch_handler(
+                    {"Records": [{"messageId": event["id"], "body": json.dumps(event)} for event in batch]}, None
+                )
+                if response["batchItemFailures"]:
+                    raise RuntimeError("Batch failures: " + repr(response["batchItemFailures"]))
+        else:
+            summary = backfill.Backfill(
+                domain_name=DOMAIN,
+                domain_owner=OWNER,
+                repository_name=REPOSITORY,
+                bucket=BUCKET,
+                region="us-east-1",
+                workers=int(os.environ.get("BACKFILL_WORKERS", "8")),
+                rate_limiter=rate_limit.RateLimiter(0),
+                checkpoint=backfill.Checkpoint(BUCKET, DOMAIN + "/.backfill/" + REPOSITORY + ".json"),
+            ).run()
+            if summary["versionsFailed"]:
+                raise RuntimeError("Backfill failures: " + repr(summary))
+        elapsed = time.perf_counter() - start
+
+        for patch in patches:
+            patch.stop()
+
+    server.shutdown()
+
+    transferred = arguments.events * arguments.assets * len(body)
+    print("%-20s %s, %d events x %d assets x %d bytes" % ("scenario", arguments.scenario, arguments.events, arguments.assets, len(body)))
+    print("%-20s %10.2f events/s" % ("event rate", arguments.events / elapsed))
+    print("%-20s %10.2f MB/s" % ("throughput", transferred / 1000000 / elapsed))
+    print("%-20s %10.1f MB" % ("peak RSS", peak_rss_megabytes()))
+
+    # The backfill copies assets directly, so stage latencies are only reported by the event handlers
+    for stage in STAGES:
+        values = [record[stage] for record in records if stage in record]
+        if values:
+            print("%-20s p50 %8.2f ms  p95 %8.2f ms  max %8.2f ms" % (stage, percentile(values, 0.5), percentile(values, 0.95), max(values)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Microbenchmark of Marshaller against the reflective implementation it replaced
+
+Run from the repository root:
+
+    python tests/benchmark/bench_marshaller.py [--events N]
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "artifact_backup_function"))
+
+import model.aws.code_artifact  # noqa: E402
+from model.aws.code_artifact import AWSEvent  # noqa: E402
+from model.aws.code_artifact import Marshaller  # noqa: E402
+
+EVENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "events", "event.json")
+
+
+class LegacyMarshaller:
+    """The reflective Marshaller that re-parses type names on every call, kept as the benchmark baseline"""
+
+    PRIMITIVE_TYPES = (float, bool, bytes, str, int)
+
+    NATIVE_TYPES_MAPPING = {
+        'int': int,
+        'float': float,
+        'str': str,
+        'bool': bool,
+        'date': datetime.date,
+        'datetime': datetime.datetime,
+        'object': object,
+    }
+
+    @classmethod
+    def marshall(cls, obj):
+        if obj is None:
+            return None
+        elif isinstance(obj, cls.PRIMITIVE_TYPES):
+            return obj
+        elif isinstance(obj, list):
+            return [cls.marshall(sub_obj)
+                    for sub_obj in obj]
+        elif isinstance(obj, tuple):
+            return tuple(cls.marshall(sub_obj)
+                    for sub_obj in obj)
+        elif isinstance(obj, (datetime.datetime, datetime.date)):
+            return obj.isoformat()
+
+        if isinstance(obj, dict):
+            obj_dict = obj
+        else:
+            obj_dict = {obj._attribute_map[attr]: getattr(obj, attr)
+                        for attr, _ in obj._types.items()
+                        if getattr(obj, attr) is not None}
+
+        return {key: cls.marshall(val)
+                for key, val in obj_dict.items()}
+
+    @classmethod
+    def unmarshall(cls, data, typeName):
+
+        if data is None:
+            return None
+
+        if type(typeName) == str:
+            if typeName.startswith('list['):
+                sub_kls = re.match(r'list\[(.*)\]', typeName).group(1)
+                return [cls.unmarshall(sub_data, sub_kls)
+                        for sub_data in data]
+
+            if typeName.startswith('dict('):
+                sub_kls = re.match(r'dict\(([^,]*), (.*)\)', typeName).group(2)
+                return {k: cls.unmarshall(v, sub_kls)
+                        for k, v in data.items()}
+
+            if typeName in cls.NATIVE_TYPES_MAPPING:
+                typeName = cls.NATIVE_TYPES_MAPPING[typeName]
+            else:
+                typeName = getattr(model.aws.code_artifact, typeName)
+
+        if typeName in cls.PRIMITIVE_TYPES:
+            return cls.__unmarshall_primitive(data, typeName)
+        elif typeName == object:
+            return cls.__unmarshall_object(data)
+        elif typeName == datetime.date:
+            return cls.__unmarshall_date(data)
+        elif typeName == datetime.datetime:
+            return cls.__unmarshall_datatime(data)
+        else:
+            return cls.__unmarshall_model(data, typeName)
+
+    @classmethod
+    def __unmarshall_primitive(cls, data, typeName):
+        try:
+            return typeName(data)
+        except UnicodeEncodeError:
+            return str(data)
+        except TypeError:
+            return data
+
+    @classmethod
+    def __unmarshall_object(cls, value):
+        return value
+
+    @classmethod
+    def __unmarshall_date(cls, string):
+        try:
+            from dateutil.parser import parse
+            return parse(string).date()
+        except ImportError:
+            return string
+
+    @classmethod
+    def __unmarshall_datatime(cls, string):
+        try:
+            from dateutil.parser import parse
+            return parse(string)
+        except ImportError:
+            return string
+
+    @classmethod
+    def __unmarshall_model(cls, data, typeName):
+        if (not typeName._types and
+                not cls.__hasattr(typeName, 'get_real_child_model')):
+            return data
+
+        kwargs = {}
+        if typeName._types is not None:
+            for attr, attr_type in typeName._types.items():
+                if (data is not None and
+                        typeName._attribute_map[attr] in data and
+                        isinstance(data, (list, dict))):
+                    value = data[typeName._attribute_map[attr]]
+                    kwargs[attr] = cls.unmarshall(value, attr_type)
+
+        instance = typeName(**kwargs)
+
+        if (isinstance(instance, dict) and
+                typeName._types is not None and
+                isinstance(data, dict)):
+            for key, value in data.items():
+                if key not in typeName._types:
+                    instance[key] = value
+        if cls.__hasattr(instance, 'get_real_child_model'):
+            type_name = instance.get_real_child_model(data)
+            if type_name:
+                instance = cls.unmarshall(data, type_name)
+        return instance
+
+    @classmethod
+    def __hasattr(cls, object, name):
+        return name in object.__class__.__dict__
+
+
+def measure(label: str, function, events: int, repeat: int) -> float:
+    """Best of repeat runs, reported in microseconds per event"""
+    best = min(timeit.repeat(function, number=1, repeat=repeat))
+    per_event = best / events * 1e6
+    print("%-28s %10.2f us/event" % (label, per_event))
+    return per_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    with open(EVENT_PATH) as f:
+        event = json.load(f)
+    events = [dict(event, id=str(number)) for number in range(arguments.events)]
+    parsed = [Marshaller.unmarshall(item, AWSEvent) for item in events]
+
+    legacy_unmarshall = measure("legacy unmarshall", lambda: [LegacyMarshaller.unmarshall(item, AWSEvent) for item in events], arguments.events, arguments.repeat)
+    unmarshall = measure("unmarshall", lambda: [Marshaller.unmarshall(item, AWSEvent) for item in events], arguments.events, arguments.repeat)
+    legacy_marshall = measure("legacy marshall", lambda: [LegacyMarshaller.marshall(item) for item in parsed], arguments.events, arguments.repeat)
+    marshall = measure("marshall", lambda: [Marshaller.marshall(item) for item in parsed], arguments.events, arguments.repeat)
+
+    print("unmarshall speedup %.2fx, marshall speedup %.2fx" % (legacy_unmarshall / unmarshall, legacy_marshall / marshall))
+
+    # The event time on its own, which dominated the legacy unmarshall
+    timestamps = [item["time"] for item in events]
+    legacy_time = measure("legacy time parse", lambda: [LegacyMarshaller.unmarshall(item, "datetime") for item in timestamps], arguments.events, arguments.repeat)
+    time = measure("time parse", lambda: [Marshaller.unmarshall(item, "datetime") for item in timestamps], arguments.events, arguments.repeat)
+    print("time parse speedup %.2fx" % (legacy_time / time))
+
+    # Memory held by the parsed events, measured after the benchmarks so plans and imports are already in place
+    del parsed
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    parsed = [Marshaller.unmarshall(item, AWSEvent) for item in events]
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    print("%-28s %10.0f bytes/event" % ("parsed event memory", held / len(parsed)))
+
+
+if __name__ == "__main__":
+    main()
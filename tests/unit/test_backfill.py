@@ -0,0 +1,186 @@
+import io
+import itertools
+import json
+import unittest
+from unittest import mock
+
+import botocore.exceptions
+
+from artifact_backup import backfill
+from artifact_backup import rate_limit
+
+PACKAGES = [
+    {"namespace": "com.amazonaws.app", "package": "internal-library"},
+    {"namespace": "com.amazonaws.app", "package": "other-library"},
+]
+
+VERSIONS = {
+    "internal-library": [{"version": "1.0", "revision": "r1"}, {"version": "1.1", "revision": "r2"}],
+    "other-library": [{"version": "2.0", "revision": "r3"}],
+}
+
+
+def mocked_list_packages(domain_name, domain_owner, repository_name, rate_limiter):
+    return iter(PACKAGES)
+
+
+def mocked_list_package_versions(domain_name, domain_owner, repository_name, package, status, rate_limiter):
+    return iter(VERSIONS[package["package"]])
+
+
+def mocked_list_backed_up_keys(bucket, prefix):
+    # Version 1.0 of internal-library is already backed up
+    return {
+        "domain/maven/repository/com/amazonaws/app/internal-library/1.0/internal-library-1.0.jar",
+        "domain/maven/repository/com/amazonaws/app/internal-library/1.0/internal-library-1.0.pom",
+    }
+
+
+def mocked_get_package_assets(code_artifact_notification):
+    prefix = "/".join(("maven/repository/com/amazonaws/app", code_artifact_notification.package_name, code_artifact_notification.package_version))
+    name = code_artifact_notification.package_name + "-" + code_artifact_notification.package_version
+    return [
+        {"location": prefix + "/" + name + ".jar", "hashes": {}},
+        {"location": prefix + "/" + name + ".pom", "hashes": {}},
+    ]
+
+
+class FakeCheckpoint:
+    def __init__(self, packages=(), versions=None):
+        self.packages = set(packages)
+        self.versions = versions or {}
+        self.saves = []
+        self.saved_versions = []
+
+    def load(self):
+        return set(self.packages)
+
+    def save(self, packages, complete=False, versions=None):
+        self.saves.append((set(packages), complete))
+        self.saved_versions.append({package_id: set(package_versions) for package_id, package_versions in (versions or {}).items()})
+
+
+@mock.patch("artifact_backup.backfill.list_packages", side_effect=mocked_list_packages)
+@mock.patch("artifact_backup.backfill.list_package_versions", side_effect=mocked_list_package_versions)
+@mock.patch("artifact_backup.backfill.list_backed_up_keys", side_effect=mocked_list_backed_up_keys)
+@mock.patch("artifact_backup.app.get_package_assets", side_effect=mocked_get_package_assets)
+@mock.patch("artifact_backup.app.get_user_authentication_header", return_value=None)
+@mock.patch("artifact_backup.app.backup_package_metadata")
+class BackfillTest(unittest.TestCase):
+
+    def create_backfill(self, checkpoint):
+        return backfill.Backfill(
+            domain_name="domain",
+            domain_owner="owner",
+            repository_name="repository",
+            bucket="FOO",
+            region="us-east-1",
+            workers=2,
+            rate_limiter=rate_limit.RateLimiter(0),
+            checkpoint=checkpoint,
+        )
+
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_copies_missing_assets(self, backup_asset_mock, *mocks):
+        checkpoint = FakeCheckpoint()
+        summary = self.create_backfill(checkpoint).run()
+
+        copied = sorted(call.args[2]["location"].rsplit("/", 1)[1] for call in backup_asset_mock.call_args_list)
+        assert copied == ["internal-library-1.1.jar", "internal-library-1.1.pom", "other-library-2.0.jar", "other-library-2.0.pom"]
+        assert all(call.kwargs["check_existing"] is False for call in backup_asset_mock.call_args_list)
+        assert summary == {"packages": 2, "versions": 3, "assetsCopied": 4, "versionsFailed": 0, "complete": True}
+        assert checkpoint.saves[-1] == ({"com.amazonaws.app/internal-library", "com.amazonaws.app/other-library"}, True)
+
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_merges_package_metadata_per_version(self, backup_asset_mock, backup_package_metadata_mock, *mocks):
+        self.create_backfill(FakeCheckpoint()).run()
+
+        # Versions whose assets were all backed up already are still listed in the package metadata
+        merged = sorted(
+            (call.args[0].detail.package_name, call.args[0].detail.package_version) for call in backup_package_metadata_mock.call_args_list
+        )
+        assert merged == [("internal-library", "1.0"), ("internal-library", "1.1"), ("other-library", "2.0")]
+        assert all(call.args[1:] == ("FOO",) and call.kwargs == {"list_only": True} for call in backup_package_metadata_mock.call_args_list)
+
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_resumes_from_checkpoint(self, backup_asset_mock, *mocks):
+        checkpoint = FakeCheckpoint(["com.amazonaws.app/internal-library"])
+        summary = self.create_backfill(checkpoint).run()
+
+        assert summary["packages"] == 1
+        assert backup_asset_mock.call_count == 2
+
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_does_not_checkpoint_failed_packages(self, backup_asset_mock, *mocks):
+        def mocked_backup_asset(code_artifact_notification, *args, **kwargs):
+            if code_artifact_notification.package_name == "other-library":
+                raise ValueError("copy failed")
+            return {}
+
+        backup_asset_mock.side_effect = mocked_backup_asset
+        checkpoint = FakeCheckpoint()
+        summary = self.create_backfill(checkpoint).run()
+
+        assert summary["versionsFailed"] == 1
+        assert checkpoint.saves[-1] == ({"com.amazonaws.app/internal-library"}, False)
+
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_stops_at_deadline(self, backup_asset_mock, *mocks):
+        checkpoint = FakeCheckpoint()
+        summary = self.create_backfill(checkpoint).run(deadline=0)
+
+        assert summary["complete"] is False
+        backup_asset_mock.assert_not_called()
+        assert checkpoint.saves[-1] == (set(), False)
+
+    @mock.patch("artifact_backup.backfill.time.monotonic")
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_stops_within_package_at_deadline(self, backup_asset_mock, monotonic_mock, *mocks):
+        # The deadline passes after the first version of internal-library has been submitted
+        monotonic_mock.side_effect = itertools.chain([0, 0], itertools.repeat(10))
+        checkpoint = FakeCheckpoint()
+        summary = self.create_backfill(checkpoint).run(deadline=5)
+
+        assert summary["complete"] is False
+        assert summary["versions"] == 1
+        # The unfinished package isn't recorded, but its reconciled version is kept for the next run
+        assert checkpoint.saves[-1] == (set(), False)
+        assert checkpoint.saved_versions[-1] == {"com.amazonaws.app/internal-library": {"1.0"}}
+
+    @mock.patch("artifact_backup.app.backup_asset")
+    def test_run_resumes_package_from_checkpointed_versions(self, backup_asset_mock, *mocks):
+        checkpoint = FakeCheckpoint(versions={"com.amazonaws.app/internal-library": {"1.1"}})
+        summary = self.create_backfill(checkpoint).run()
+
+        # 1.0 is backed up already and 1.1 was reconciled by the previous run, so only other-library is copied
+        assert summary["versions"] == 2
+        copied = sorted(call.args[2]["location"].rsplit("/", 1)[1] for call in backup_asset_mock.call_args_list)
+        assert copied == ["other-library-2.0.jar", "other-library-2.0.pom"]
+        assert checkpoint.saved_versions[-1] == {}
+
+
+class CheckpointTest(unittest.TestCase):
+
+    @mock.patch("artifact_backup.app.s3_client")
+    def test_load(self, s3_client_mock):
+        s3_client_mock.get_object.return_value = {"Body": io.BytesIO(json.dumps({"complete": False, "packages": ["a/b"]}).encode())}
+        assert backfill.Checkpoint("FOO", "key").load() == {"a/b"}
+
+        s3_client_mock.get_object.return_value = {"Body": io.BytesIO(json.dumps({"complete": True, "packages": ["a/b"]}).encode())}
+        assert backfill.Checkpoint("FOO", "key").load() == set()
+
+        state = {"complete": False, "packages": ["a/b"], "versions": {"a/c": ["1.0", "1.1"]}}
+        s3_client_mock.get_object.return_value = {"Body": io.BytesIO(json.dumps(state).encode())}
+        checkpoint = backfill.Checkpoint("FOO", "key")
+        assert checkpoint.load() == {"a/b"}
+        assert checkpoint.versions == {"a/c": {"1.0", "1.1"}}
+
+    @mock.patch("artifact_backup.app.s3_client")
+    def test_load_missing(self, s3_client_mock):
+        s3_client_mock.get_object.side_effect = botocore.exceptions.ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        assert backfill.Checkpoint("FOO", "key").load() == set()
+
+    @mock.patch("artifact_backup.app.put_object")
+    def test_save(self, put_object_mock):
+        backfill.Checkpoint("FOO", "key").save({"b/c", "a/b"}, complete=True)
+        put_object_mock.assert_called_once_with(b'{"complete": true, "packages": ["a/b", "b/c"]}', "FOO", "key")
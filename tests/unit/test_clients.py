@@ -0,0 +1,62 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from artifact_backup import clients
+
+
+class ClientsTest(unittest.TestCase):
+
+    def test_get_client_config_defaults(self):
+        with mock.patch.dict(os.environ, {"ASSET_WORKERS": "8", "EVENT_WORKERS": "4", "MULTIPART_MAX_CONCURRENCY": "4"}):
+            client_config = clients.get_client_config()
+
+        # Room for the parts of every asset in flight
+        assert client_config.max_pool_connections == 128
+        assert client_config.retries == {"mode": "adaptive", "max_attempts": 5}
+        assert client_config.tcp_keepalive is True
+
+    def test_get_client_config_from_environment(self):
+        environment = {
+            "CLIENT_MAX_POOL_CONNECTIONS": "64",
+            "AWS_RETRY_MODE": "standard",
+            "AWS_MAX_ATTEMPTS": "3",
+            "CLIENT_TCP_KEEPALIVE": "false",
+            "CLIENT_CONNECT_TIMEOUT": "2",
+            "CLIENT_READ_TIMEOUT": "10",
+        }
+        with mock.patch.dict(os.environ, environment):
+            client_config = clients.get_client_config()
+
+        assert client_config.max_pool_connections == 64
+        assert client_config.retries == {"mode": "standard", "max_attempts": 3}
+        assert client_config.tcp_keepalive is False
+        assert client_config.connect_timeout == 2
+        assert client_config.read_timeout == 10
+
+    def test_create_client_shares_session_and_counts_retries(self):
+        with mock.patch.dict(os.environ, {"AWS_DEFAULT_REGION": "us-east-1"}):
+            s3_client = clients.create_client("s3")
+            codeartifact_client = clients.create_client("codeartifact")
+
+        assert clients.get_session() is clients.get_session()
+        assert {"s3", "codeartifact"} <= set(clients.construction_seconds)
+        assert codeartifact_client.meta.config.retries["mode"] == "adaptive"
+
+        def call_with_retries():
+            s3_client.meta.events.emit(
+                "after-call.s3.PutObject",
+                http_response=None,
+                parsed={"ResponseMetadata": {"RetryAttempts": 2}},
+                model=None,
+                context={},
+            )
+            results.append(clients.retry_attempts())
+
+        results = []
+        thread = threading.Thread(target=call_with_retries)
+        thread.start()
+        thread.join()
+
+        assert results == [2]
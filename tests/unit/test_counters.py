@@ -0,0 +1,48 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from artifact_backup import counters
+
+
+class CountersTest(unittest.TestCase):
+
+    def test_counting_includes_submitted_work(self):
+        def upload_part():
+            counters.current().add_retry_attempts(1)
+            counters.current().add_connection(0.5)
+
+        with counters.counting() as asset_counters:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [counters.submit(executor, upload_part) for _ in range(8)]
+            assert all(future.exception() is None for future in futures)
+
+        # Work submitted to the pool counts for the asset that submitted it
+        assert asset_counters.retry_attempts == 8
+        assert asset_counters.connections_opened == 8
+        assert asset_counters.handshake_seconds == 4.0
+
+    def test_counting_scopes_are_separate(self):
+        results = []
+
+        def backup_asset(retry_attempts):
+            with counters.counting() as asset_counters:
+                counters.current().add_retry_attempts(retry_attempts)
+            results.append(asset_counters.retry_attempts)
+
+        threads = [threading.Thread(target=backup_asset, args=(retry_attempts,)) for retry_attempts in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [1, 2]
+
+    def test_current_outside_scope_is_per_thread(self):
+        counters.current().add_retry_attempts(3)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(counters.current().retry_attempts))
+        thread.start()
+        thread.join()
+
+        assert results == [0]
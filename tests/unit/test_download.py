@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+import pytest
+
+from artifact_backup import download
+
+CONTENT = bytes(range(256)) * 4
+
+
+class DownloadTest(unittest.TestCase):
+
+    def test_get_ranges(self):
+        assert download.get_ranges(10, 4) == [(0, 3), (4, 7), (8, 9)]
+        assert download.get_ranges(8, 4) == [(0, 3), (4, 7)]
+
+    def test_ranged_chunks_in_order(self):
+        requested = []
+        lock = threading.Lock()
+
+        def fetch_range(start, end):
+            with lock:
+                requested.append((start, end))
+            return CONTENT[start:end + 1]
+
+        chunks = list(download.ranged_chunks(fetch_range, len(CONTENT), 100, 3))
+
+        assert b"".join(chunks) == CONTENT
+        assert [len(chunk) for chunk in chunks] == [100] * 10 + [24]
+        assert sorted(requested) == download.get_ranges(len(CONTENT), 100)
+
+    def test_ranged_chunks_retries_a_range(self):
+        attempts = {}
+        sleeps = []
+
+        def fetch_range(start, end):
+            attempts[start] = attempts.get(start, 0) + 1
+            # The second range stalls once and is truncated once before it succeeds
+            if start == 100 and attempts[start] == 1:
+                raise TimeoutError("stalled")
+            if start == 100 and attempts[start] == 2:
+                return CONTENT[start:end]
+            return CONTENT[start:end + 1]
+
+        chunks = list(download.ranged_chunks(fetch_range, 300, 100, 2, max_attempts=3, sleep=sleeps.append))
+
+        assert b"".join(chunks) == CONTENT[:300]
+        assert attempts == {0: 1, 100: 3, 200: 1}
+        assert sleeps == [0.5, 1.0]
+
+    def test_ranged_chunks_gives_up(self):
+        def fetch_range(start, end):
+            if start == 100:
+                raise TimeoutError("stalled")
+            return CONTENT[start:end + 1]
+
+        chunks = download.ranged_chunks(fetch_range, 300, 100, 2, max_attempts=2, sleep=lambda seconds: None)
+        assert next(chunks) == CONTENT[:100]
+        with pytest.raises(TimeoutError):
+            next(chunks)
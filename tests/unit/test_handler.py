@@ -1,10 +1,14 @@
+import json
 import os
 import unittest
 
+import botocore.exceptions
 import pytest
 import requests
 
 from artifact_backup import app
+from artifact_backup import metrics
+from artifact_backup import routing
 from model.aws.code_artifact import AWSEvent
 from model.aws.code_artifact import CodeArtifactChangeNotification
 from model.aws.code_artifact import Marshaller
@@ -50,40 +54,90 @@ def eventBridgeCodeArtifactEvent():
     }
 
 
-def mocked_get_auth_token(domain):
+def mocked_get_auth_token(domain, domain_owner=None, duration_seconds=None):
     return {
         "authorizationToken": "auth-token",
         "ResponseMetadata": {"HTTPStatusCode": 200},
     }
 
 
-def mocked_get_auth_token_failure(domain):
+def mocked_get_auth_token_failure(domain, domain_owner=None, duration_seconds=None):
     return {"ResponseMetadata": {"HTTPStatusCode": 401}}
 
 
-def mocked_list_package_version_assets(code_artifact_notification):
+def mocked_list_package_version_assets(code_artifact_notification, next_token=None):
     return {
         "ResponseMetadata": {"HTTPStatusCode": 200},
         "assets": [{"name": "internal-library-1.0.jar"}],
     }
 
 
-def mocked_list_package_version_assets_failure(code_artifact_notification):
+EMPTY_SHA256 = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+
+
+def mocked_list_package_version_assets_hashed(code_artifact_notification, next_token=None):
+    return {
+        "ResponseMetadata": {"HTTPStatusCode": 200},
+        "assets": [{"name": "internal-library-1.0.jar", "size": 0, "hashes": {"SHA-256": EMPTY_SHA256}}],
+    }
+
+
+def mocked_list_package_version_assets_multiple(code_artifact_notification, next_token=None):
+    return {
+        "ResponseMetadata": {"HTTPStatusCode": 200},
+        "assets": [
+            {"name": "internal-library-1.0.jar"},
+            {"name": "internal-library-1.0.pom"},
+            {"name": "internal-library-1.0-sources.jar"},
+        ],
+    }
+
+
+def mocked_list_package_version_assets_paginated(code_artifact_notification, next_token=None):
+    if next_token is None:
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "assets": [{"name": "internal-library-1.0.jar"}, {"name": "internal-library-1.0.pom"}],
+            "nextToken": "page-2",
+        }
+    return {
+        "ResponseMetadata": {"HTTPStatusCode": 200},
+        "assets": [{"name": "internal-library-1.0-sources.jar"}],
+    }
+
+
+def mocked_list_package_version_assets_empty(code_artifact_notification, next_token=None):
+    return {"ResponseMetadata": {"HTTPStatusCode": 200}, "assets": []}
+
+
+def mocked_list_package_version_assets_failure(code_artifact_notification, next_token=None):
     return {"ResponseMetadata": {"HTTPStatusCode": 401}}
 
 
-def mocked_put_object(content, bucket, key):
+def mocked_put_object(content, bucket, key, metadata=None, checksum_sha256=None, region=None, tags=None):
     return {"ResponseMetadata": {"HTTPStatusCode": 200}}
 
 
-def mocked_put_object_failure(content, bucket, key):
+def mocked_put_object_failure(content, bucket, key, metadata=None, checksum_sha256=None, region=None, tags=None):
     return {"ResponseMetadata": {"HTTPStatusCode": 401}}
 
 
+def mocked_put_object_pom_failure(content, bucket, key, metadata=None, checksum_sha256=None, region=None, tags=None):
+    if key.endswith(".pom"):
+        return {"ResponseMetadata": {"HTTPStatusCode": 401}}
+    return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
 def mocked_get_archive(URL, authentication_header):
     class RequestObject:
         status_code = 200
-        content = ""
+        content = b""
+
+        def iter_content(self, chunk_size=1):
+            return iter(())
+
+        def close(self):
+            pass
 
     return RequestObject()
 
@@ -91,19 +145,50 @@ def mocked_get_archive(URL, authentication_header):
 def mocked_get_archive_failure(URL, authentication_header):
     class RequestObject:
         status_code = 401
-        content = ""
+        content = b""
+
+        def iter_content(self, chunk_size=1):
+            return iter(())
+
+        def raise_for_status(self):
+            raise requests.HTTPError("401 Client Error: Unauthorized")
+
+        def close(self):
+            pass
 
     return RequestObject()
 
 
 class MyTest(unittest.TestCase):
 
-    
+    def setUp(self):
+        app.authorization_tokens.clear()
+        app.backed_up_copies.clear()
+        app.package_metadata.clear()
+        # Metric records are captured rather than written to stdout
+        self.metric_records = []
+        previous_sink = metrics.set_sink(self.metric_records.append)
+        self.addCleanup(metrics.set_sink, previous_sink)
+        # No backup exists yet unless a test says otherwise
+        head_object_patcher = mock.patch("artifact_backup.app.head_object", return_value=None)
+        self.head_object_mock = head_object_patcher.start()
+        self.addCleanup(head_object_patcher.stop)
+        # Neither the bucket nor CodeArtifact hold a maven-metadata.xml yet unless a test says otherwise
+        read_package_metadata_patcher = mock.patch("artifact_backup.app.read_package_metadata", return_value=(None, None))
+        self.read_package_metadata_mock = read_package_metadata_patcher.start()
+        self.addCleanup(read_package_metadata_patcher.stop)
+        put_object_if_unchanged_patcher = mock.patch("artifact_backup.app.put_object_if_unchanged", return_value={"ETag": "etag-1"})
+        self.put_object_if_unchanged_mock = put_object_if_unchanged_patcher.start()
+        self.addCleanup(put_object_if_unchanged_patcher.stop)
 
     def test_marshall(self):
         aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
         detail: CodeArtifactChangeNotification = aws_event.detail
         assert detail.package_version == "1.0"
+        assert detail.package_version_revision == "nQjAwhAz3hVCmCKLlcrxOsvCxBq844wgT+ZZjiXjFZo="
+        assert detail.event_deduplication_id == "zh7q1uOww9K1skLhjA6A9PWD17IhEkLEM7zNtuDn2EY="
+        assert detail.sequence_number == 2
+        assert Marshaller.marshall(aws_event)["detail"]["sequenceNumber"] == 2
 
     @mock.patch(
         "artifact_backup.app.get_authorization_token",
@@ -121,6 +206,36 @@ class MyTest(unittest.TestCase):
         with pytest.raises(Exception):
             app.get_user_authentication_header("domain")
 
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    def test_get_user_authentication_header_cached(self, get_auth_mock):
+        app.get_user_authentication_header("domain", "owner")
+        app.get_user_authentication_header("domain", "owner")
+        app.get_user_authentication_header("other-domain", "owner")
+
+        assert get_auth_mock.call_count == 2
+        get_auth_mock.assert_any_call("domain", "owner", 43200)
+
+    def test_get_auth_token_refresh_seconds(self):
+        with mock.patch.dict(os.environ, {"AUTH_TOKEN_REFRESH_SECONDS": "900", "AUTH_TOKEN_DURATION_SECONDS": "43200"}):
+            assert app.get_auth_token_refresh_seconds() == 900
+        # The shortest tokens would otherwise be due for a refresh as soon as they are fetched
+        with mock.patch.dict(os.environ, {"AUTH_TOKEN_REFRESH_SECONDS": "900", "AUTH_TOKEN_DURATION_SECONDS": "900"}):
+            assert app.get_auth_token_refresh_seconds() == 450
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    def test_evict_user_authentication_header(self, get_auth_mock):
+        app.get_user_authentication_header("domain", "owner")
+        app.evict_user_authentication_header("domain", "owner")
+        app.get_user_authentication_header("domain", "owner")
+
+        assert get_auth_mock.call_count == 2
+
 
     @mock.patch(
         "artifact_backup.app.list_package_version_assets",
@@ -130,7 +245,33 @@ class MyTest(unittest.TestCase):
         aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
         code_artifact_notification: CodeArtifactChangeNotification = aws_event.detail
         ret = app.get_package_locations(code_artifact_notification)
-        assert ret == ["maven/codeartifact-backup-repository/com/amazonaws/app/internal-library/1.0/internal-library-1.0.jar"]
+        assert list(ret) == ["maven/codeartifact-backup-repository/com/amazonaws/app/internal-library/1.0/internal-library-1.0.jar"]
+
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_paginated,
+    )
+    def test_get_package_locations_paginated(self, describe_package_mock):
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        ret = app.get_package_locations(aws_event.detail)
+
+        # Nothing is requested until the first location is needed, and the second page only once the first is used up
+        describe_package_mock.assert_not_called()
+        assert next(ret).endswith("internal-library-1.0.jar")
+        assert next(ret).endswith("internal-library-1.0.pom")
+        assert describe_package_mock.call_count == 1
+        assert next(ret).endswith("internal-library-1.0-sources.jar")
+        describe_package_mock.assert_called_with(aws_event.detail, "page-2")
+        assert list(ret) == []
+
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_empty,
+    )
+    def test_get_package_locations_no_assets(self, describe_package_mock):
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        with pytest.raises(ValueError):
+            list(app.get_package_locations(aws_event.detail))
 
     @mock.patch(
         "artifact_backup.app.list_package_version_assets",
@@ -140,7 +281,7 @@ class MyTest(unittest.TestCase):
         with pytest.raises(Exception):
             aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
             code_artifact_notification: CodeArtifactChangeNotification = aws_event.detail
-            app.get_package_locations(code_artifact_notification)
+            list(app.get_package_locations(code_artifact_notification))
 
     def test_get_full_url(self):
         aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
@@ -189,6 +330,74 @@ class MyTest(unittest.TestCase):
 
         assert detailRet.package_name == "internal-library"
 
+    @mock.patch("artifact_backup.app.list_package_version_assets")
+    def test_lambda_handler_deleted_version(self, list_package_version_assets_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        self.read_package_metadata_mock.return_value = (
+            "etag-0",
+            b"<metadata><versioning><latest>1.0</latest><versions><version>1.0</version></versions></versioning></metadata>",
+        )
+        event = eventBridgeCodeArtifactEvent()
+        event["detail"]["packageVersionState"] = "Deleted"
+
+        ret = app.lambda_handler(event, "")
+
+        # CodeArtifact has no assets left to list, the backups are kept and the version leaves the package metadata
+        list_package_version_assets_mock.assert_not_called()
+        assert ret["assets"] == []
+        assert ret["packageMetadata"]["status"] == "SUCCEEDED"
+        assert b"<version>1.0</version>" not in self.put_object_if_unchanged_mock.call_args.args[0]
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.get_archive")
+    def test_lambda_handler_archived_version_without_backup(self, get_archive_mock, list_package_version_assets_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        self.read_package_metadata_mock.return_value = (
+            "etag-0",
+            b"<metadata><versioning><latest>1.0</latest><versions><version>1.0</version></versions></versioning></metadata>",
+        )
+        event = eventBridgeCodeArtifactEvent()
+        event["detail"]["packageVersionState"] = "Archived"
+
+        ret = app.lambda_handler(event, "")
+
+        # CodeArtifact doesn't serve archived assets, the missing backup is reported rather than downloaded
+        get_archive_mock.assert_not_called()
+        assert [asset["status"] for asset in ret["assets"]] == ["UNAVAILABLE"]
+        assert ret["packageMetadata"]["status"] == "SUCCEEDED"
+        assert b"<version>1.0</version>" not in self.put_object_if_unchanged_mock.call_args.args[0]
+
+    @mock.patch("artifact_backup.app.put_object_tagging")
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    def test_lambda_handler_removed_version_merges_metadata_when_tagging_fails(
+        self, list_package_version_assets_mock, get_auth_mock, put_object_tagging_mock
+    ):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        self.head_object_mock.return_value = {"ContentLength": 3, "Metadata": {}}
+        put_object_tagging_mock.side_effect = botocore.exceptions.ClientError({"Error": {"Code": "AccessDenied"}}, "PutObjectTagging")
+        event = eventBridgeCodeArtifactEvent()
+        event["detail"]["packageVersionState"] = "Archived"
+
+        with pytest.raises(ValueError):
+            app.lambda_handler(event, "")
+
+        # The event is retried for the failed asset, but the version has already left the package metadata
+        self.put_object_if_unchanged_mock.assert_called_once()
+
     @mock.patch(
         "artifact_backup.app.get_authorization_token",
         side_effect=mocked_get_auth_token,
@@ -206,6 +415,27 @@ class MyTest(unittest.TestCase):
             os.environ["DESTINATION_BUCKET"] = "FOO"
             app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
 
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=[mocked_get_archive_failure(None, None), mocked_get_archive(None, None)])
+    def test_lambda_handler_get_archive_unauthorized_refreshes_token(
+        self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock
+    ):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        # The rejected token is evicted and the download retried with a new one
+        assert get_auth_mock.call_count == 2
+        assert get_archive_mock.call_count == 2
+        put_object_mock.assert_called_once()
+
     @mock.patch(
         "artifact_backup.app.get_authorization_token",
         side_effect=mocked_get_auth_token,
@@ -222,3 +452,724 @@ class MyTest(unittest.TestCase):
         with pytest.raises(Exception):
             os.environ["DESTINATION_BUCKET"] = "FOO"
             app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    def test_put_object_stream_single_part(self, put_object_mock):
+        app.put_object_stream(iter([b"abc", b"def"]), "FOO", "key")
+        put_object_mock.assert_called_once_with(b"abcdef", "FOO", "key", None, "vvV+x/U6bUC+tkCngKY5yDvCmsipgW8fxsXG3Nk8RyE=", None, None)
+
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    def test_put_object_stream_verifies_hashes(self, put_object_mock):
+        sha256 = "bef57ec7f53a6d40beb640a780a639c83bc29ac8a9816f1fc6c5c6dcd93c4721"
+        app.put_object_stream(iter([b"abc", b"def"]), "FOO", "key", None, {"SHA-256": sha256})
+        put_object_mock.assert_called_once_with(b"abcdef", "FOO", "key", None, "vvV+x/U6bUC+tkCngKY5yDvCmsipgW8fxsXG3Nk8RyE=", None, None)
+
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    def test_put_object_stream_hash_mismatch(self, put_object_mock):
+        with pytest.raises(ValueError):
+            app.put_object_stream(iter([b"abc", b"xyz"]), "FOO", "key", None, {"SHA-1": "1f8ac10f23c5b5bc1167bda84b833e5c057a77d2"})
+        put_object_mock.assert_not_called()
+
+    @mock.patch("artifact_backup.app.s3_client")
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    def test_put_object_stream_multipart(self, put_object_mock, s3_client_mock):
+        os.environ["MULTIPART_PART_SIZE"] = str(5 * 1024 * 1024)
+        s3_client_mock.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client_mock.upload_part.return_value = {"ETag": "etag"}
+        try:
+            chunk = b"x" * (1024 * 1024)
+            app.put_object_stream(iter([chunk] * 11), "FOO", "key")
+        finally:
+            del os.environ["MULTIPART_PART_SIZE"]
+
+        put_object_mock.assert_not_called()
+        assert s3_client_mock.upload_part.call_count == 3
+        assert s3_client_mock.create_multipart_upload.call_args.kwargs["ChecksumAlgorithm"] == "SHA256"
+        parts = s3_client_mock.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+        assert [part["PartNumber"] for part in parts] == [1, 2, 3]
+        assert all(part["ChecksumSHA256"] for part in parts)
+
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch.dict(os.environ, {"MULTIPART_THRESHOLD": str(16 * 1024 * 1024)})
+    def test_put_object_stream_small_known_size(self, put_object_mock):
+        chunk = b"x" * (1024 * 1024)
+        # Below the threshold the content goes in one PutObject, even though it is larger than one part
+        app.put_object_stream(iter([chunk] * 10), "FOO", "key", size=10 * 1024 * 1024)
+        put_object_mock.assert_called_once()
+        assert len(put_object_mock.call_args.args[0]) == 10 * 1024 * 1024
+
+    @mock.patch("artifact_backup.transfer.multipart_upload")
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch.dict(os.environ, {"AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024", "ASSET_WORKERS": "2", "EVENT_WORKERS": "1"})
+    def test_put_object_stream_large_known_size(self, put_object_mock, multipart_upload_mock):
+        chunk = b"x" * (1024 * 1024)
+        with mock.patch("artifact_backup.app.cpu_count", return_value=2):
+            app.put_object_stream(iter([chunk] * 20), "FOO", "key", size=20 * 1024 * 1024)
+
+        put_object_mock.assert_not_called()
+        # A quarter of 1 GiB shared by two assets leaves room for 8 parts of 8 MiB in flight
+        assert multipart_upload_mock.call_args.kwargs["concurrency"] == 8
+        assert [len(part) for part in multipart_upload_mock.call_args.args[1]] == [8 * 1024 * 1024, 8 * 1024 * 1024, 4 * 1024 * 1024]
+
+    @mock.patch.dict(os.environ, {"AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024", "ASSET_WORKERS": "2", "EVENT_WORKERS": "4"})
+    def test_get_multipart_concurrency_shares_memory_between_uploads(self):
+        part_size = 8 * 1024 * 1024
+        with mock.patch("artifact_backup.app.cpu_count", return_value=2):
+            # A quarter of 1 GiB shared by the 8 assets of 4 events leaves room for 4 parts per upload
+            assert app.get_multipart_concurrency(part_size) == 4
+            # An asset streamed to its bucket and two replicas holds the parts of three uploads
+            assert app.get_multipart_concurrency(part_size, destinations=3) == 1
+            with mock.patch.dict(os.environ, {"CONCURRENT_ASSETS": "1"}):
+                assert app.get_multipart_concurrency(part_size) == 8
+
+    @mock.patch("artifact_backup.app.s3_client")
+    def test_put_object_stream_multipart_hash_mismatch(self, s3_client_mock):
+        os.environ["MULTIPART_PART_SIZE"] = str(5 * 1024 * 1024)
+        s3_client_mock.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client_mock.upload_part.return_value = {"ETag": "etag"}
+        try:
+            chunk = b"x" * (1024 * 1024)
+            with pytest.raises(ValueError):
+                app.put_object_stream(iter([chunk] * 10), "FOO", "key", None, {"SHA-256": "00" * 32})
+        finally:
+            del os.environ["MULTIPART_PART_SIZE"]
+
+        s3_client_mock.complete_multipart_upload.assert_not_called()
+        s3_client_mock.abort_multipart_upload.assert_called_once_with(Bucket="FOO", Key="key", UploadId="upload-id")
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_multiple,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_multiple_assets(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        assert put_object_mock.call_count == 3
+        assert get_auth_mock.call_count == 1
+        assert [asset["status"] for asset in ret["assets"]] == ["SUCCEEDED"] * 3
+        assert {"connectionsOpened", "handshakeSeconds", "transferSeconds"} <= set(ret["assets"][0])
+        assert ret["assets"][1]["key"] == (
+            "codeartifact-backup-domain/maven/codeartifact-backup-repository/com/amazonaws/app/internal-library/1.0/internal-library-1.0.pom"
+        )
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_multiple,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object_pom_failure)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_multiple_assets_partial_failure(
+        self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock
+    ):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        with pytest.raises(ValueError) as error:
+            app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        # Every asset is attempted even though one of them fails
+        assert put_object_mock.call_count == 3
+        failed_results = error.value.args[1]
+        assert [asset["location"].rsplit("/", 1)[1] for asset in failed_results] == ["internal-library-1.0.pom"]
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_sqs_batch_handler(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        pypi_event = eventBridgeCodeArtifactEvent()
+        pypi_event["detail"]["packageFormat"] = "pypi"
+        other_version_event = eventBridgeCodeArtifactEvent()
+        other_version_event["detail"]["packageVersion"] = "1.1"
+        records = [
+            {"messageId": "message-1", "body": json.dumps(eventBridgeCodeArtifactEvent())},
+            {"messageId": "message-2", "body": json.dumps(pypi_event)},
+            {"messageId": "message-3", "body": "not json"},
+            {"messageId": "message-4", "body": json.dumps(other_version_event)},
+        ]
+
+        ret = app.sqs_batch_handler({"Records": records}, "")
+
+        assert ret == {"batchItemFailures": [{"itemIdentifier": "message-2"}, {"itemIdentifier": "message-3"}]}
+        assert put_object_mock.call_count == 2
+
+    @mock.patch("artifact_backup.app.process_sqs_record")
+    def test_sqs_batch_handler_coalesces_version_updates(self, process_sqs_record_mock):
+        burst = []
+        for sequence_number in (3, 5, 4):
+            event = eventBridgeCodeArtifactEvent()
+            event["detail"]["sequenceNumber"] = sequence_number
+            burst.append({"messageId": "message-" + str(sequence_number), "body": json.dumps(event)})
+        other_version_event = eventBridgeCodeArtifactEvent()
+        other_version_event["detail"]["packageVersion"] = "1.1"
+        records = burst + [{"messageId": "message-other", "body": json.dumps(other_version_event)}]
+        process_sqs_record_mock.side_effect = lambda record: None if record["messageId"] == "message-other" else 1 / 0
+
+        ret = app.sqs_batch_handler({"Records": records}, "")
+
+        # Only the latest change of the burst is backed up, and its failure is reported for every message it covered
+        processed = sorted(call.args[0]["messageId"] for call in process_sqs_record_mock.call_args_list)
+        assert processed == ["message-5", "message-other"]
+        assert sorted(failure["itemIdentifier"] for failure in ret["batchItemFailures"]) == ["message-3", "message-4", "message-5"]
+
+    def test_coalesce_records(self):
+        records = [
+            {"messageId": "a", "body": json.dumps(eventBridgeCodeArtifactEvent())},
+            {"messageId": "b", "body": "not json"},
+            {"messageId": "c", "body": json.dumps(eventBridgeCodeArtifactEvent())},
+            {"messageId": "d", "body": "not json"},
+        ]
+        groups = app.coalesce_records(records)
+
+        # Equal sequence numbers keep the record delivered last, unreadable records are never merged
+        assert [[record["messageId"] for record in group] for group in groups] == [["c", "a"], ["b"], ["d"]]
+
+    @mock.patch("artifact_backup.app.process_sqs_record")
+    @mock.patch.dict(os.environ, {"COALESCE_EVENTS": "false"})
+    def test_sqs_batch_handler_without_coalescing(self, process_sqs_record_mock):
+        records = [{"messageId": message_id, "body": json.dumps(eventBridgeCodeArtifactEvent())} for message_id in ("a", "b")]
+        app.sqs_batch_handler({"Records": records}, "")
+        assert process_sqs_record_mock.call_count == 2
+
+    def test_sqs_batch_handler_empty_batch(self):
+        assert app.sqs_batch_handler({"Records": []}, "") == {"batchItemFailures": []}
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_records_revision(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        metadata = put_object_mock.call_args.args[3]
+        assert metadata == {
+            "package-version-revision": "nQjAwhAz3hVCmCKLlcrxOsvCxBq844wgT+ZZjiXjFZo=",
+            "event-deduplication-id": "zh7q1uOww9K1skLhjA6A9PWD17IhEkLEM7zNtuDn2EY=",
+            "sequence-number": "2",
+        }
+        # The backup is tagged with the state of its version as it is written
+        assert put_object_mock.call_args.args[6] == {
+            "package-version-state": "Published",
+            "package-version-revision": "nQjAwhAz3hVCmCKLlcrxOsvCxBq844wgT+ZZjiXjFZo=",
+        }
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_skips_backed_up_revision(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        self.head_object_mock.return_value = {
+            "Metadata": {"package-version-revision": "nQjAwhAz3hVCmCKLlcrxOsvCxBq844wgT+ZZjiXjFZo="}
+        }
+        event = eventBridgeCodeArtifactEvent()
+        event["detail"]["changes"]["assetsAdded"] = 1
+
+        ret = app.lambda_handler(event, "")
+
+        assert ret["assets"][0]["status"] == "SKIPPED"
+        get_archive_mock.assert_not_called()
+        put_object_mock.assert_not_called()
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object_tagging", return_value={"ResponseMetadata": {"HTTPStatusCode": 200}})
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_status_change_tags_backup(
+        self, get_archive_mock, put_object_mock, put_object_tagging_mock, describe_package_mock, get_auth_mock
+    ):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        self.head_object_mock.return_value = {"Metadata": {"package-version-revision": "older"}}
+
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        # The status changed and no asset did, so the backup is tagged rather than copied again
+        assert ret["assets"][0]["status"] == "TAGGED"
+        get_archive_mock.assert_not_called()
+        put_object_mock.assert_not_called()
+        put_object_tagging_mock.assert_called_once_with(
+            "FOO",
+            "codeartifact-backup-domain/maven/codeartifact-backup-repository/com/amazonaws/app/internal-library/1.0/internal-library-1.0.jar",
+            {"package-version-state": "Published", "package-version-revision": "nQjAwhAz3hVCmCKLlcrxOsvCxBq844wgT+ZZjiXjFZo="},
+        )
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_status_change_without_backup_heads_once(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        # The tag and skip checks share one HEAD request before the missing backup is copied
+        assert ret["assets"][0]["status"] == "SUCCEEDED"
+        put_object_mock.assert_called_once()
+        self.head_object_mock.assert_called_once()
+
+    @mock.patch("artifact_backup.app.put_object_tagging", return_value={"ResponseMetadata": {"HTTPStatusCode": 200}})
+    def test_tag_backup_requires_matching_backup(self, put_object_tagging_mock):
+        detail = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent).detail
+        asset = {"location": "maven/internal-library-1.0.jar", "hashes": {"SHA-256": "abc"}}
+
+        # Without a backup, or with a backup of other content, the asset has to be copied in full
+        assert not app.tag_backup(detail, asset, "FOO", "key", None)
+        assert not app.tag_backup(detail, asset, "FOO", "key", {"Metadata": {"sha256": "def"}})
+        put_object_tagging_mock.assert_not_called()
+
+        assert app.tag_backup(detail, asset, "FOO", "key", {"Metadata": {"sha256": "abc"}})
+
+    def test_is_state_change_only(self):
+        event = eventBridgeCodeArtifactEvent()
+        assert app.is_state_change_only(Marshaller.unmarshall(event, AWSEvent).detail)
+
+        event["detail"]["changes"]["assetsUpdated"] = 2
+        assert not app.is_state_change_only(Marshaller.unmarshall(event, AWSEvent).detail)
+
+        del event["detail"]["changes"]
+        assert not app.is_state_change_only(Marshaller.unmarshall(event, AWSEvent).detail)
+
+    def test_is_asset_backed_up(self):
+        detail = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent).detail
+        asset = {"location": "maven/internal-library-1.0.jar", "hashes": {"SHA-256": "abc"}}
+
+        assert not app.is_asset_backed_up(detail, asset, None)
+
+        # A known checksum takes precedence over the revision
+        assert app.is_asset_backed_up(detail, asset, {"Metadata": {"sha256": "abc", "package-version-revision": "older"}})
+        assert not app.is_asset_backed_up(
+            detail, asset, {"Metadata": {"sha256": "def", "package-version-revision": detail.package_version_revision}}
+        )
+
+        assert not app.is_asset_backed_up(detail, {"hashes": {}}, {"Metadata": {"package-version-revision": "older"}})
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_paginated,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_paginated_assets(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        assert [asset["location"].rsplit("/", 1)[1] for asset in ret["assets"]] == [
+            "internal-library-1.0.jar",
+            "internal-library-1.0.pom",
+            "internal-library-1.0-sources.jar",
+        ]
+        assert put_object_mock.call_count == 3
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_hashed,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    @mock.patch.dict(os.environ, {"DESTINATION_BUCKET": "FOO", "STORAGE_LAYOUT": "content"})
+    def test_lambda_handler_content_addressed(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        blob_key = ".blobs/sha256/" + EMPTY_SHA256
+        assert ret["assets"][0]["blobKey"] == blob_key
+        assert put_object_mock.call_count == 2
+        blob_call, pointer_call = put_object_mock.call_args_list
+        assert blob_call.args[2] == blob_key
+        assert pointer_call.args[2] == "codeartifact-backup-domain/" + ret["assets"][0]["location"]
+        assert json.loads(pointer_call.args[0]) == {"blob": blob_key, "sha256": EMPTY_SHA256, "size": 0}
+        assert pointer_call.args[3]["blob-key"] == blob_key
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_hashed,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    @mock.patch.dict(os.environ, {"DESTINATION_BUCKET": "FOO", "STORAGE_LAYOUT": "content"})
+    def test_lambda_handler_content_addressed_deduplicates(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        # The path has no backup yet but the blob was stored for another repository
+        self.head_object_mock.side_effect = lambda bucket, key: {"Metadata": {"sha256": EMPTY_SHA256}} if key.startswith(".blobs/") else None
+
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        assert ret["assets"][0]["status"] == "DEDUPLICATED"
+        get_archive_mock.assert_not_called()
+        put_object_mock.assert_called_once()
+        assert put_object_mock.call_args.args[3]["blob-key"] == ".blobs/sha256/" + EMPTY_SHA256
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_hashed,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    @mock.patch.dict(os.environ, {"DESTINATION_BUCKET": "FOO"})
+    def test_lambda_handler_records_backed_up_copy(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        key = "codeartifact-backup-domain/" + ret["assets"][0]["location"]
+        index_call = put_object_mock.call_args_list[-1]
+        assert index_call.args[2] == ".index/sha256/" + EMPTY_SHA256
+        assert index_call.args[3] == {"backup-key": key}
+        assert app.backed_up_copies[("FOO", EMPTY_SHA256)] == key
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_hashed,
+    )
+    @mock.patch("artifact_backup.app.s3_client")
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    @mock.patch.dict(os.environ, {"DESTINATION_BUCKET": "FOO"})
+    def test_lambda_handler_copies_promoted_asset(self, get_archive_mock, put_object_mock, s3_client_mock, describe_package_mock, get_auth_mock):
+        staging_key = "codeartifact-backup-domain/maven/staging/com/amazonaws/app/internal-library/1.0/internal-library-1.0.jar"
+        objects = {
+            ".index/sha256/" + EMPTY_SHA256: {"Metadata": {"backup-key": staging_key}},
+            staging_key: {"Metadata": {"sha256": EMPTY_SHA256}, "ContentLength": 0},
+        }
+        self.head_object_mock.side_effect = lambda bucket, key: objects.get(key)
+        s3_client_mock.copy_object.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        assert ret["assets"][0]["status"] == "COPIED"
+        assert ret["assets"][0]["sourceKey"] == staging_key
+        get_archive_mock.assert_not_called()
+        put_object_mock.assert_not_called()
+        copy_kwargs = s3_client_mock.copy_object.call_args.kwargs
+        assert copy_kwargs["CopySource"] == {"Bucket": "FOO", "Key": staging_key}
+        assert copy_kwargs["MetadataDirective"] == "REPLACE"
+        assert copy_kwargs["Metadata"]["sha256"] == EMPTY_SHA256
+        # The copy carries the tags of its own version rather than those of the source
+        assert copy_kwargs["TaggingDirective"] == "REPLACE"
+        assert copy_kwargs["Tagging"] == "package-version-state=Published&package-version-revision=nQjAwhAz3hVCmCKLlcrxOsvCxBq844wgT%2BZZjiXjFZo%3D"
+
+    def test_find_backed_up_copy_overwritten(self):
+        app.backed_up_copies[("FOO", "abc")] = "key"
+        # The indexed backup now holds different content
+        self.head_object_mock.return_value = {"Metadata": {"sha256": "def"}, "ContentLength": 3}
+
+        assert app.find_backed_up_copy("FOO", "abc") is None
+        assert ("FOO", "abc") not in app.backed_up_copies
+
+    def test_find_backed_up_copy_per_bucket(self):
+        objects = {
+            ("FOO", ".index/sha256/abc"): {"Metadata": {"backup-key": "foo-key"}},
+            ("FOO", "foo-key"): {"Metadata": {"sha256": "abc"}, "ContentLength": 3},
+        }
+        self.head_object_mock.side_effect = lambda bucket, key: objects.get((bucket, key))
+        # Another bucket's copy is remembered, and a stale key of this bucket falls back to its index
+        app.backed_up_copies[("BAR", "abc")] = "bar-key"
+        app.backed_up_copies[("FOO", "abc")] = "stale-key"
+
+        assert app.find_backed_up_copy("FOO", "abc") == {"key": "foo-key", "size": 3}
+        assert app.backed_up_copies == {("BAR", "abc"): "bar-key", ("FOO", "abc"): "foo-key"}
+
+    @mock.patch("artifact_backup.app.s3_client")
+    def test_copy_object_multipart(self, s3_client_mock):
+        with mock.patch("artifact_backup.transfer.multipart_copy") as multipart_copy_mock:
+            app.copy_object("FOO", "source", "key", 6 * 1024 * 1024 * 1024, {"sha256": "abc"}, tags={"package-version-state": "Published"})
+
+        s3_client_mock.copy_object.assert_not_called()
+        multipart_copy_mock.assert_called_once_with(
+            s3_client_mock,
+            "FOO",
+            "source",
+            "FOO",
+            "key",
+            6 * 1024 * 1024 * 1024,
+            512 * 1024 * 1024,
+            {"sha256": "abc"},
+            "package-version-state=Published",
+        )
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets_multiple,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object_pom_failure)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_emits_metrics(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        with pytest.raises(ValueError):
+            app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        version_record, *asset_records = self.metric_records
+        assert version_record["Repository"] == "codeartifact-backup-repository"
+        assert version_record["version"] == "1.0"
+        assert version_record["Assets"] == 3
+        assert version_record["AssetsFailed"] == 1
+        assert {"AuthTokenTime", "ListAssetsTime", "BackupTime"} <= set(version_record)
+
+        # The failed pom reports no transfer
+        assert [record["key"].rsplit("/", 1)[1] for record in asset_records] == ["internal-library-1.0.jar", "internal-library-1.0-sources.jar"]
+        metric_names = [metric["Name"] for metric in asset_records[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+        assert metric_names == ["DownloadTime", "UploadTime", "HandshakeTime", "BytesTransferred", "Throughput", "AwsRetryAttempts"]
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch("artifact_backup.app.s3_client")
+    @mock.patch("artifact_backup.app.head_archive")
+    @mock.patch("artifact_backup.app.get_archive")
+    @mock.patch.dict(
+        os.environ,
+        {
+            "RANGED_DOWNLOAD_THRESHOLD": str(8 * 1024 * 1024),
+            "MULTIPART_PART_SIZE": str(5 * 1024 * 1024),
+            "AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024",
+            "CONCURRENT_ASSETS": "4",
+        },
+    )
+    def test_backup_asset_ranged_download(self, get_archive_mock, head_archive_mock, s3_client_mock, get_auth_mock):
+        content = b"0123456789abcdef" * (11 * 1024 * 1024 // 16)
+        head_archive_mock.return_value = mock.Mock(status_code=200, headers={"Accept-Ranges": "bytes"})
+
+        def get_archive(url, authentication_header, headers=None):
+            start, end = (int(offset) for offset in headers["Range"][len("bytes="):].split("-"))
+            return mock.Mock(status_code=206, content=content[start:end + 1])
+
+        get_archive_mock.side_effect = get_archive
+        s3_client_mock.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client_mock.upload_part.return_value = {"ETag": "etag"}
+        s3_client_mock.complete_multipart_upload.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        package_asset = {"location": "maven/internal-library-1.0.jar", "size": len(content), "hashes": {}}
+        ret = app.backup_asset(aws_event.detail, aws_event, package_asset, None, "FOO")
+
+        assert ret["bytes"] == len(content)
+        ranges = sorted(call.args[2]["Range"] for call in get_archive_mock.call_args_list)
+        assert ranges == ["bytes=0-5242879", "bytes=10485760-11534335", "bytes=5242880-10485759"]
+        bodies = [call.kwargs["Body"] for call in sorted(s3_client_mock.upload_part.call_args_list, key=lambda call: call.kwargs["PartNumber"])]
+        assert b"".join(bodies) == content
+
+    @mock.patch("artifact_backup.routing.get_target")
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive")
+    def test_backup_asset_replicated(self, get_archive_mock, put_object_mock, get_target_mock):
+        get_target_mock.return_value = routing.Target(bucket="FOO", replicas=[routing.Replica("DR", "eu-west-1")])
+        get_archive_mock.return_value = mock.Mock(status_code=200, iter_content=lambda chunk_size: iter([b"ab", b"c"]))
+        self.head_object_mock.side_effect = lambda bucket, key, region=None: {"ContentLength": 3, "Metadata": {"sha256": "abc"}}
+
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        package_asset = {"location": "maven/internal-library-1.0.jar", "size": 3, "hashes": {}}
+        ret = app.backup_asset(aws_event.detail, aws_event, package_asset, None, "FOO", check_existing=False)
+
+        # The download is read once and uploaded to both buckets, so the replica only needs checking afterwards
+        get_archive_mock.assert_called_once()
+        uploads = sorted((call.args[1], call.args[5]) for call in put_object_mock.call_args_list if call.args[0] == b"abc")
+        assert uploads == [("DR", "eu-west-1"), ("FOO", None)]
+        assert ret["replicas"] == [{"bucket": "DR", "region": "eu-west-1", "attempts": 1, "status": "SUCCEEDED"}]
+
+    @mock.patch("artifact_backup.app.time.sleep")
+    @mock.patch("artifact_backup.app.copy_object")
+    @mock.patch.dict(os.environ, {"REPLICA_ATTEMPTS": "3"})
+    def test_replicate_backup_retries_by_copying(self, copy_object_mock, sleep_mock):
+        replicas = [routing.Replica("DR", "eu-west-1"), routing.Replica("ARCHIVE", "us-west-2")]
+        primary = {"ContentLength": 3, "ETag": "etag", "Metadata": {"sha256": "abc"}}
+        self.head_object_mock.side_effect = lambda bucket, key, region=None: None if bucket == "DR" else primary
+        copy_object_mock.side_effect = [
+            botocore.exceptions.ClientError({"Error": {"Code": "SlowDown"}}, "CopyObject"),
+            botocore.exceptions.EndpointConnectionError(endpoint_url="https://s3.eu-west-1.amazonaws.com"),
+            {"ResponseMetadata": {"HTTPStatusCode": 200}},
+        ]
+
+        replica_results = app.replicate_backup("FOO", "key", replicas)
+
+        assert replica_results == [
+            {"bucket": "DR", "region": "eu-west-1", "attempts": 3, "status": "COPIED", "error": mock.ANY},
+            {"bucket": "ARCHIVE", "region": "us-west-2", "attempts": 1, "status": "SUCCEEDED"},
+        ]
+        # Connection errors are retried like error responses, with a growing pause between attempts
+        assert [call.args[0] for call in sleep_mock.call_args_list] == [0.5, 1.0]
+        copy_object_mock.assert_called_with(
+            "DR", "key", "key", 3, {"sha256": "abc"}, source_bucket="FOO", region="eu-west-1", tags=None
+        )
+
+        copy_object_mock.side_effect = botocore.exceptions.ClientError({"Error": {"Code": "AccessDenied"}}, "CopyObject")
+        with pytest.raises(ValueError):
+            app.replicate_backup("FOO", "key", replicas)
+
+    @mock.patch("artifact_backup.app.head_archive")
+    @mock.patch("artifact_backup.app.get_archive")
+    @mock.patch.dict(os.environ, {"RANGED_DOWNLOAD_THRESHOLD": "1"})
+    def test_get_archive_range_rejected_token(self, get_archive_mock, head_archive_mock):
+        app.authorization_tokens.get_or_fetch(("codeartifact-backup-domain", "accountnumber"), lambda: ("stale", 2 ** 40))
+        get_archive_mock.return_value = mock.Mock(status_code=401)
+        detail = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent).detail
+
+        with pytest.raises(ValueError):
+            app.get_archive_range(detail, "url", 0, 9)
+
+        # The next attempt of the range requests a new token
+        with mock.patch("artifact_backup.app.request_authorization_token", return_value=("fresh", 2 ** 40)):
+            assert app.get_user_authentication_header("codeartifact-backup-domain", "accountnumber").password == "fresh"
+
+    @mock.patch("artifact_backup.app.head_archive")
+    @mock.patch.dict(os.environ, {"RANGED_DOWNLOAD_THRESHOLD": "100", "AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024", "CONCURRENT_ASSETS": "4"})
+    def test_is_ranged_download(self, head_archive_mock):
+        head_archive_mock.return_value = mock.Mock(status_code=200, headers={"Accept-Ranges": "bytes"})
+        assert app.is_ranged_download("url", None, 100)
+        assert not app.is_ranged_download("url", None, 99)
+        assert not app.is_ranged_download("url", None, None)
+
+        head_archive_mock.return_value = mock.Mock(status_code=200, headers={})
+        assert not app.is_ranged_download("url", None, 100)
+
+    @mock.patch.dict(os.environ, {"AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024", "CONCURRENT_ASSETS": "16"})
+    def test_get_ranged_download_concurrency(self):
+        part_size = 8 * 1024 * 1024
+        # A quarter of 1 GiB shared by 16 assets holds two ranges each
+        assert app.get_ranged_download_concurrency(part_size) == 2
+        with mock.patch.dict(os.environ, {"CONCURRENT_ASSETS": "1"}):
+            assert app.get_ranged_download_concurrency(part_size) == 4
+
+        # Without room for two ranges the asset is streamed, before CodeArtifact is even asked
+        with mock.patch.dict(os.environ, {"CONCURRENT_ASSETS": "32", "RANGED_DOWNLOAD_THRESHOLD": "1"}):
+            with mock.patch("artifact_backup.app.head_archive") as head_archive_mock:
+                assert not app.is_ranged_download("url", None, 64 * 1024 * 1024)
+            head_archive_mock.assert_not_called()
+
+    @mock.patch("artifact_backup.app.replicate_backup")
+    @mock.patch("artifact_backup.routing.get_target")
+    def test_backup_package_metadata_replicated(self, get_target_mock, replicate_backup_mock):
+        replicas = [routing.Replica("DR", "eu-west-1")]
+        get_target_mock.return_value = routing.Target(bucket="FOO", replicas=replicas)
+        replicate_backup_mock.return_value = [{"bucket": "DR", "region": "eu-west-1", "attempts": 1, "status": "COPIED"}]
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+
+        ret = app.backup_package_metadata(aws_event, "FOO")
+
+        # The document is replicated once the conditional write has put it in the bucket
+        replicate_backup_mock.assert_called_once_with("FOO", ret["key"], replicas)
+        assert ret["replicas"] == replicate_backup_mock.return_value
+
+        # A redelivered event finds the document unchanged and still checks the replicas
+        assert app.backup_package_metadata(aws_event, "FOO")["status"] == "UNCHANGED"
+        assert replicate_backup_mock.call_count == 2
+
+    def test_backup_package_metadata(self):
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        ret = app.backup_package_metadata(aws_event, "FOO")
+
+        key = "codeartifact-backup-domain/maven/codeartifact-backup-repository/com/amazonaws/app/internal-library/maven-metadata.xml"
+        assert ret == {"key": key, "status": "SUCCEEDED"}
+        content, bucket, put_key, etag = self.put_object_if_unchanged_mock.call_args.args
+        assert (bucket, put_key, etag) == ("FOO", key, None)
+        assert b"<version>1.0</version>" in content
+
+        # The next version is merged into the document the container wrote, without reading it again
+        event = eventBridgeCodeArtifactEvent()
+        event["detail"]["packageVersion"] = "1.1"
+        event["time"] = "2024-07-24T11:55:55Z"
+        app.backup_package_metadata(Marshaller.unmarshall(event, AWSEvent), "FOO")
+
+        self.read_package_metadata_mock.assert_called_once()
+        content, bucket, put_key, etag = self.put_object_if_unchanged_mock.call_args.args
+        assert etag == "etag-1"
+        assert b"<version>1.0</version>" in content and b"<latest>1.1</latest>" in content
+
+        # A redelivered event leaves the document as it is
+        assert app.backup_package_metadata(Marshaller.unmarshall(event, AWSEvent), "FOO")["status"] == "UNCHANGED"
+        assert self.put_object_if_unchanged_mock.call_count == 2
+
+    def test_backup_package_metadata_concurrent_update(self):
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        other_version = (
+            b"<metadata><groupId>com.amazonaws.app</groupId><artifactId>internal-library</artifactId>"
+            b"<versioning><versions><version>0.9</version></versions><lastUpdated>20240101000000</lastUpdated></versioning></metadata>"
+        )
+        self.read_package_metadata_mock.side_effect = [(None, None), ("etag-other", other_version)]
+        conflict = botocore.exceptions.ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        self.put_object_if_unchanged_mock.side_effect = [conflict, {"ETag": "etag-2"}]
+
+        assert app.backup_package_metadata(aws_event, "FOO")["status"] == "SUCCEEDED"
+
+        content, bucket, key, etag = self.put_object_if_unchanged_mock.call_args.args
+        assert etag == "etag-other"
+        assert b"<version>0.9</version>" in content and b"<version>1.0</version>" in content
+
+    @mock.patch(
+        "artifact_backup.app.get_authorization_token",
+        side_effect=mocked_get_auth_token,
+    )
+    @mock.patch(
+        "artifact_backup.app.list_package_version_assets",
+        side_effect=mocked_list_package_version_assets,
+    )
+    @mock.patch("artifact_backup.app.put_object", side_effect=mocked_put_object)
+    @mock.patch("artifact_backup.app.get_archive", side_effect=mocked_get_archive)
+    def test_lambda_handler_backs_up_package_metadata(self, get_archive_mock, put_object_mock, describe_package_mock, get_auth_mock):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        ret = app.lambda_handler(eventBridgeCodeArtifactEvent(), "")
+
+        assert ret["packageMetadata"]["status"] == "SUCCEEDED"
+        assert ret["packageMetadata"]["key"].endswith("/internal-library/maven-metadata.xml")
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+
+FUNCTION_DIR = os.path.abspath("artifact_backup_function")
+
+# Modules the handler only needs once it handles an event, or not at all
+DEFERRED_MODULES = ("boto3", "s3transfer", "six", "pprint", "dateutil", "botocore.session")
+
+
+def run_python(*args):
+    """Run a fresh interpreter in the function directory without AWS configuration, like a Lambda cold start"""
+    env = {name: value for name, value in os.environ.items() if not name.startswith("AWS_")}
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=FUNCTION_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def cumulative_import_ms(importtime_output: str, module: str) -> float:
+    """The cumulative time of a module from the output of python -X importtime"""
+    for line in importtime_output.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise ValueError("No import time reported for " + module)
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_handler_import_defers_heavy_modules(self):
+        result = run_python("-c", "import sys, artifact_backup.app; print(','.join(m for m in %r if m in sys.modules))" % (DEFERRED_MODULES,))
+        assert result.stdout.strip() == ""
+
+    def test_handler_import_time_budget(self):
+        budget_ms = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "300"))
+        # Warm the bytecode cache so compilation isn't measured
+        run_python("-c", "import artifact_backup.app")
+
+        result = run_python("-X", "importtime", "-c", "import artifact_backup.app")
+        import_ms = cumulative_import_ms(result.stderr, "artifact_backup.app")
+
+        assert import_ms < budget_ms, "Importing the handler took %.1f ms, the budget is %.1f ms" % (import_ms, budget_ms)
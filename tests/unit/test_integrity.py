@@ -0,0 +1,35 @@
+import unittest
+
+import pytest
+
+from artifact_backup import integrity
+
+SHA256_ABCDEF = "bef57ec7f53a6d40beb640a780a639c83bc29ac8a9816f1fc6c5c6dcd93c4721"
+
+
+class IntegrityTest(unittest.TestCase):
+
+    def test_select_hash_prefers_sha256(self):
+        hashes = {"MD5": "m", "SHA-1": "s1", "SHA-256": "s256", "SHA-512": "s512"}
+        assert integrity.select_hash(hashes) == ("SHA-256", "sha256")
+        assert integrity.select_hash({"MD5": "m", "SHA-1": "s1"}) == ("SHA-1", "sha1")
+        assert integrity.select_hash({}) is None
+
+    def test_verify_chunks(self):
+        chunks = list(integrity.verify_chunks(iter([b"abc", b"def"]), {"SHA-256": SHA256_ABCDEF.upper()}))
+        assert chunks == [b"abc", b"def"]
+
+    def test_verify_chunks_mismatch(self):
+        chunks = integrity.verify_chunks(iter([b"abc", b"deg"]), {"SHA-256": SHA256_ABCDEF})
+        # Every chunk is passed through, the mismatch is only known once the stream ends
+        assert next(chunks) == b"abc"
+        assert next(chunks) == b"deg"
+        with pytest.raises(ValueError):
+            next(chunks)
+
+    def test_verify_chunks_without_hashes(self):
+        assert list(integrity.verify_chunks(iter([b"abc"]), {})) == [b"abc"]
+
+    def test_checksums(self):
+        assert integrity.checksum_sha256(b"abcdef") == "vvV+x/U6bUC+tkCngKY5yDvCmsipgW8fxsXG3Nk8RyE="
+        assert integrity.hex_to_base64(SHA256_ABCDEF) == integrity.checksum_sha256(b"abcdef")
@@ -0,0 +1,123 @@
+import datetime
+import json
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from model.aws.code_artifact import AWSEvent
+from model.aws.code_artifact import CodeArtifactChanges
+from model.aws.code_artifact import CodeArtifactChangeNotification
+from model.aws.code_artifact import Marshaller
+
+
+def eventBridgeCodeArtifactEvent():
+    with open("events/event.json") as f:
+        return json.load(f)
+
+
+class MarshallerTest(unittest.TestCase):
+
+    def test_unmarshall_model(self):
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+
+        assert isinstance(aws_event.detail, CodeArtifactChangeNotification)
+        assert aws_event.detail_type == "CodeArtifact Package Version State Change"
+        assert aws_event.time == datetime.datetime(2024, 7, 23, 11, 55, 55, tzinfo=datetime.timezone.utc)
+        assert aws_event.detail.sequence_number == 2
+
+    def test_unmarshall_by_type_name(self):
+        detail = Marshaller.unmarshall(eventBridgeCodeArtifactEvent()["detail"], "CodeArtifactChangeNotification")
+        assert detail.package_name == "internal-library"
+
+    def test_unmarshall_containers(self):
+        assert Marshaller.unmarshall(["1", None, 2], "list[int]") == [1, None, 2]
+        assert Marshaller.unmarshall({"a": "1"}, "dict(str, int)") == {"a": 1}
+        assert Marshaller.unmarshall({"a": [1]}, "object") == {"a": [1]}
+        assert Marshaller.unmarshall(None, AWSEvent) is None
+
+    def test_marshall_round_trip(self):
+        event = eventBridgeCodeArtifactEvent()
+        marshalled = Marshaller.marshall(Marshaller.unmarshall(event, AWSEvent))
+
+        assert marshalled["time"] == "2024-07-23T11:55:55+00:00"
+        del marshalled["time"], event["time"]
+        # The flags of the changes block are sent as strings and come back as booleans
+        event["detail"]["changes"].update({"metadataUpdated": False, "statusChanged": True})
+        assert marshalled == event
+
+    def test_unmarshall_changes(self):
+        changes = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent).detail.changes
+
+        assert isinstance(changes, CodeArtifactChanges)
+        assert changes.assets_added == 0
+        assert changes.metadata_updated is False
+        assert changes.status_changed is True
+        assert Marshaller.unmarshall(True, "bool") is True
+        assert Marshaller.unmarshall("False", "bool") is False
+
+    def test_unmarshall_reuses_plan(self):
+        Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        decoder = Marshaller._decoders[AWSEvent]
+        Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+
+        assert Marshaller._decoders[AWSEvent] is decoder
+
+    def test_unmarshall_concurrently_on_cold_cache(self):
+        event = eventBridgeCodeArtifactEvent()
+        expected = Marshaller.unmarshall(event, AWSEvent)
+
+        # Switch threads as often as possible so lookups land in the middle of a compilation
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+
+        for _ in range(100):
+            # Every thread starts on an empty cache, so plans are compiled while other threads look them up
+            with mock.patch.object(Marshaller, "_decoders", {}):
+                barrier = threading.Barrier(8)
+
+                def unmarshall():
+                    barrier.wait()
+                    return Marshaller.unmarshall(event, AWSEvent)
+
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    futures = [executor.submit(unmarshall) for _ in range(8)]
+                assert [future.result() for future in futures] == [expected] * 8
+
+    def test_models_are_slotted(self):
+        aws_event: AWSEvent = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+
+        assert not hasattr(aws_event, "__dict__")
+        assert not hasattr(aws_event.detail, "__dict__")
+        with pytest.raises(AttributeError):
+            aws_event.unknown = "value"
+
+    def test_models_compare_by_value(self):
+        first = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        second = Marshaller.unmarshall(eventBridgeCodeArtifactEvent(), AWSEvent)
+        assert first == second
+
+        second.detail.package_version = "1.1"
+        assert first != second
+
+    def test_aws_event_requires_every_attribute(self):
+        event = eventBridgeCodeArtifactEvent()
+        del event["region"]
+        with pytest.raises(ValueError):
+            Marshaller.unmarshall(event, AWSEvent)
+
+    def test_unmarshall_datetime(self):
+        utc = datetime.timezone.utc
+        assert Marshaller.unmarshall("2024-07-23T11:55:55Z", "datetime") == datetime.datetime(2024, 7, 23, 11, 55, 55, tzinfo=utc)
+        assert Marshaller.unmarshall("2024-07-23T11:55:55.250Z", "datetime") == datetime.datetime(2024, 7, 23, 11, 55, 55, 250000, tzinfo=utc)
+        assert Marshaller.unmarshall("2024-07-23T13:55:55+02:00", "datetime") == datetime.datetime(2024, 7, 23, 11, 55, 55, tzinfo=utc)
+        # Anything else falls back to dateutil
+        assert Marshaller.unmarshall("Tue, 23 Jul 2024 11:55:55 GMT", "datetime") == datetime.datetime(2024, 7, 23, 11, 55, 55, tzinfo=utc)
+
+    def test_unmarshall_date(self):
+        assert Marshaller.unmarshall("2024-07-23", "date") == datetime.date(2024, 7, 23)
+        assert Marshaller.unmarshall("23 July 2024", "date") == datetime.date(2024, 7, 23)
@@ -0,0 +1,128 @@
+import datetime
+import os
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+from artifact_backup import maven_metadata
+
+ASSET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "assets", "maven-metadata.xml")
+
+
+def at(day):
+    return datetime.datetime(2024, 7, day, 11, 55, 55, tzinfo=datetime.timezone.utc)
+
+
+def versioning(content):
+    element = ElementTree.fromstring(content).find("versioning")
+    return {
+        "latest": element.findtext("latest"),
+        "release": element.findtext("release"),
+        "versions": [version.text for version in element.findall("versions/version")],
+        "lastUpdated": element.findtext("lastUpdated"),
+        "order": [child.tag for child in element],
+    }
+
+
+class MavenMetadataTest(unittest.TestCase):
+
+    def test_merge_new_document(self):
+        content = maven_metadata.merge(None, "com.amazonaws.app", "internal-library", "1.0", "Published", at(23))
+
+        root = ElementTree.fromstring(content)
+        assert root.findtext("groupId") == "com.amazonaws.app"
+        assert root.findtext("artifactId") == "internal-library"
+        assert versioning(content) == {
+            "latest": "1.0",
+            "release": "1.0",
+            "versions": ["1.0"],
+            "lastUpdated": "20240723115555",
+            "order": ["latest", "release", "versions", "lastUpdated"],
+        }
+
+    def test_merge_into_existing_document(self):
+        with open(ASSET_PATH, "rb") as asset:
+            content = asset.read()
+
+        content = maven_metadata.merge(content, "com.amazonaws.app", "internal-library", "1.1-SNAPSHOT", "Published", at(23))
+        assert versioning(content)["versions"] == ["1.0", "1.1-SNAPSHOT"]
+        assert versioning(content)["latest"] == "1.1-SNAPSHOT"
+        # Snapshots never become the release
+        assert versioning(content)["release"] == "1.0"
+
+    def test_merge_out_of_order(self):
+        content = maven_metadata.merge(None, "group", "artifact", "1.1", "Published", at(24))
+        content = maven_metadata.merge(content, "group", "artifact", "1.0", "Published", at(23))
+
+        assert versioning(content)["versions"] == ["1.1", "1.0"]
+        assert versioning(content)["latest"] == "1.1"
+        assert versioning(content)["lastUpdated"] == "20240724115555"
+
+    def test_merge_is_idempotent(self):
+        content = maven_metadata.merge(None, "group", "artifact", "1.0", "Published", at(23))
+        assert maven_metadata.merge(content, "group", "artifact", "1.0", "Published", at(23)) == content
+
+    def test_merge_removed_version(self):
+        content = maven_metadata.merge(None, "group", "artifact", "1.0", "Published", at(22))
+        content = maven_metadata.merge(content, "group", "artifact", "1.1", "Published", at(23))
+        content = maven_metadata.merge(content, "group", "artifact", "1.1", "Deleted", at(24))
+
+        assert versioning(content)["versions"] == ["1.0"]
+        assert versioning(content)["latest"] == "1.0"
+        assert versioning(content)["release"] == "1.0"
+
+        content = maven_metadata.merge(content, "group", "artifact", "1.0", "Archived", at(25))
+        assert versioning(content)["versions"] == []
+        assert versioning(content)["latest"] is None
+        assert versioning(content)["release"] is None
+
+    def test_merge_namespaced_document(self):
+        content = b"""<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://maven.apache.org/METADATA/1.1.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xsi:schemaLocation="http://maven.apache.org/METADATA/1.1.0 https://maven.apache.org/xsd/repository-metadata-1.1.0.xsd"
+    modelVersion="1.1.0">
+  <groupId>group</groupId>
+  <artifactId>artifact</artifactId>
+  <versioning>
+    <latest>1.0</latest>
+    <release>1.0</release>
+    <versions>
+      <version>1.0</version>
+    </versions>
+    <lastUpdated>20240722115555</lastUpdated>
+  </versioning>
+</metadata>"""
+
+        content = maven_metadata.merge(content, "group", "artifact", "1.1", "Published", at(23))
+
+        # The existing elements are updated in place and the document stays in its namespace
+        root = ElementTree.fromstring(content)
+        namespaces = {"m": "http://maven.apache.org/METADATA/1.1.0"}
+        assert len(root.findall("m:versioning", namespaces)) == 1
+        assert [version.text for version in root.findall("m:versioning/m:versions/m:version", namespaces)] == ["1.0", "1.1"]
+        assert root.findtext("m:versioning/m:latest", namespaces=namespaces) == "1.1"
+        assert root.findtext("m:versioning/m:lastUpdated", namespaces=namespaces) == "20240723115555"
+        assert b"ns0:" not in content
+        assert maven_metadata.merge(content, "group", "artifact", "1.1", "Published", at(23)) == content
+
+    def test_merge_without_time(self):
+        content = maven_metadata.merge(None, "group", "artifact", "1.1", "Published", at(23))
+        content = maven_metadata.merge(content, "group", "artifact", "1.0", "Published", None)
+
+        # A backfilled version is listed without becoming latest
+        assert versioning(content)["versions"] == ["1.1", "1.0"]
+        assert versioning(content)["latest"] == "1.1"
+        assert versioning(content)["lastUpdated"] == "20240723115555"
+
+    def test_metadata_cache(self):
+        cache = maven_metadata.MetadataCache(2)
+        cache.put("a", "etag-a", b"a")
+        cache.put("b", "etag-b", b"b")
+        assert cache.get("a") == ("etag-a", b"a")
+
+        # b is the least recently used
+        cache.put("c", "etag-c", b"c")
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+        cache.evict("a")
+        assert cache.get("a") is None
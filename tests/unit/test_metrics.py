@@ -0,0 +1,60 @@
+import io
+import json
+import os
+import unittest
+from unittest import mock
+
+import pytest
+
+from artifact_backup import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        previous_sink = metrics.set_sink(self.records.append)
+        self.addCleanup(metrics.set_sink, previous_sink)
+
+    def test_emit(self):
+        metrics.emit(
+            {"Repository": "repository"},
+            {"DownloadTime": (12.5, metrics.MILLISECONDS), "BytesTransferred": (100, metrics.BYTES)},
+            {"key": "domain/app.jar"},
+        )
+
+        record, = self.records
+        assert record["_aws"]["CloudWatchMetrics"] == [{
+            "Namespace": "ArtifactBackup",
+            "Dimensions": [["Repository"]],
+            "Metrics": [{"Name": "DownloadTime", "Unit": "Milliseconds"}, {"Name": "BytesTransferred", "Unit": "Bytes"}],
+        }]
+        assert record["Repository"] == "repository"
+        assert record["DownloadTime"] == 12.5
+        assert record["BytesTransferred"] == 100
+        assert record["key"] == "domain/app.jar"
+
+    @mock.patch.dict(os.environ, {"METRICS_ENABLED": "false"})
+    def test_emit_disabled(self):
+        metrics.emit({"Repository": "repository"}, {"Assets": (1, metrics.COUNT)})
+        assert self.records == []
+
+    def test_stdout_sink(self):
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            metrics.stdout_sink({"Assets": 1})
+        assert json.loads(stdout.getvalue()) == {"Assets": 1}
+
+    def test_timed_iter(self):
+        stats = {"seconds": 0.0, "bytes": 0}
+        assert list(metrics.timed_iter(iter([b"ab", b"cde"]), stats, "seconds", "bytes")) == [b"ab", b"cde"]
+        assert stats["bytes"] == 5
+        assert stats["seconds"] > 0
+
+    def test_timed_iter_error(self):
+        def failing():
+            yield b"ab"
+            raise ValueError("stalled")
+
+        stats = {"seconds": 0.0}
+        with pytest.raises(ValueError):
+            list(metrics.timed_iter(failing(), stats, "seconds"))
@@ -0,0 +1,35 @@
+import unittest
+
+from artifact_backup import rate_limit
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_acquire_spaces_requests(self):
+        now = [10.0]
+        sleeps = []
+
+        rate_limiter = rate_limit.RateLimiter(4, clock=lambda: now[0], sleep=sleeps.append)
+        for _ in range(3):
+            rate_limiter.acquire()
+
+        assert sleeps == [0.25, 0.5]
+
+    def test_acquire_paces_by_cost(self):
+        now = [10.0]
+        sleeps = []
+
+        # A bandwidth limit acquires the size of each chunk
+        bandwidth = rate_limit.RateLimiter(1000, clock=lambda: now[0], sleep=sleeps.append)
+        for size in (500, 1000, 250):
+            bandwidth.acquire(size)
+
+        assert sleeps == [0.5, 1.5]
+
+    def test_zero_rate_disables_the_limit(self):
+        sleeps = []
+        rate_limiter = rate_limit.RateLimiter(0, sleep=sleeps.append)
+        for _ in range(3):
+            rate_limiter.acquire(100)
+
+        assert sleeps == []
@@ -0,0 +1,132 @@
+import io
+import json
+import os
+import threading
+import unittest
+from unittest import mock
+
+from artifact_backup import app
+from artifact_backup import routing
+
+ROUTING_TABLE = {
+    "routes": [
+        {"domain": "payments", "repository": "releases", "bucket": "payments-releases", "prefix": "releases/", "maxConcurrency": 1},
+        {"domain": "payments", "bucket": "payments-backup", "maxBytesPerSecond": 1048576},
+        {"domain": "team-*", "repository": "*-snapshots", "prefix": "snapshots/"},
+    ],
+}
+
+
+class RoutingTableTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ["DESTINATION_BUCKET"] = "FOO"
+        routing_table_patcher = mock.patch.object(routing, "routing_table", None)
+        routing_table_patcher.start()
+        self.addCleanup(routing_table_patcher.stop)
+
+    def test_get_target(self):
+        routing_table = routing.parse_routing_table(ROUTING_TABLE)
+
+        # The first matching route wins
+        target = routing_table.get_target("payments", "releases")
+        assert (target.bucket, target.prefix, target.max_concurrency) == ("payments-releases", "releases/", 1)
+        target = routing_table.get_target("payments", "staging")
+        assert (target.bucket, target.prefix, target.bandwidth.rate) == ("payments-backup", "", 1048576)
+
+        # Routes without a bucket, and repositories without a route, go to DESTINATION_BUCKET
+        target = routing_table.get_target("team-a", "library-snapshots")
+        assert (target.bucket, target.prefix) == ("FOO", "snapshots/")
+        assert routing_table.get_target("team-a", "library-releases") is routing_table.default
+        assert routing_table.default.bucket == "FOO"
+
+    @mock.patch.dict(os.environ, {"REPLICA_DESTINATIONS": "dr-backup@eu-west-1, dr-archive@us-west-2"})
+    def test_parse_replicas(self):
+        routing_table = routing.parse_routing_table({
+            "routes": [{"domain": "payments", "replicas": [{"bucket": "payments-dr", "region": "eu-central-1"}]}],
+        })
+
+        # Routes listing their own replicas replace REPLICA_DESTINATIONS
+        assert routing_table.get_target("payments", "releases").replicas == [routing.Replica("payments-dr", "eu-central-1")]
+        assert routing_table.default.replicas == [routing.Replica("dr-backup", "eu-west-1"), routing.Replica("dr-archive", "us-west-2")]
+
+        with self.assertRaises(ValueError):
+            routing.parse_replicas("dr-backup")
+
+    def test_parse_routing_table_requires_domain(self):
+        with self.assertRaises(ValueError):
+            routing.parse_routing_table({"routes": [{"bucket": "payments-backup"}]})
+
+    def test_parse_target_requires_usable_limits(self):
+        with self.assertRaises(ValueError):
+            routing.parse_target({"domain": "payments", "maxConcurrency": 0})
+        with self.assertRaises(ValueError):
+            routing.parse_target({"domain": "payments", "maxBytesPerSecond": -1})
+
+        target = routing.parse_target({"domain": "payments", "maxConcurrency": 1, "maxBytesPerSecond": 0})
+        assert target.max_concurrency == 1
+        assert target.bandwidth.rate == 0
+
+    @mock.patch.dict(os.environ, {"ROUTING_TABLE": json.dumps(ROUTING_TABLE)})
+    def test_get_routing_table_is_loaded_once(self):
+        routing_table = routing.get_routing_table()
+
+        assert routing.get_routing_table() is routing_table
+        assert routing.get_target("payments", "releases") is routing_table.routes[0][2]
+
+    @mock.patch.dict(os.environ, {"ROUTING_TABLE": "s3://config-bucket/routing/table.json"})
+    @mock.patch("artifact_backup.clients.create_client")
+    def test_get_routing_table_from_s3(self, create_client_mock):
+        create_client_mock.return_value.get_object.return_value = {"Body": io.BytesIO(json.dumps(ROUTING_TABLE).encode())}
+
+        assert routing.get_target("payments", "staging").bucket == "payments-backup"
+        create_client_mock.assert_called_once_with("s3")
+        create_client_mock.return_value.get_object.assert_called_once_with(Bucket="config-bucket", Key="routing/table.json")
+
+    @mock.patch.dict(os.environ, {"ROUTING_TABLE": json.dumps(ROUTING_TABLE)})
+    def test_get_backup_key_adds_prefix(self):
+        detail = mock.Mock(domain_name="payments", repository_name="releases")
+
+        assert app.get_backup_key(detail, "maven/releases/a.jar") == "releases/payments/maven/releases/a.jar"
+
+
+class TargetTest(unittest.TestCase):
+
+    def test_throttle_passes_chunks_through(self):
+        target = routing.Target(bytes_per_second=0)
+        assert list(target.throttle([b"a", b"bc"])) == [b"a", b"bc"]
+
+
+class RunFairlyTest(unittest.TestCase):
+
+    def test_takes_turns_between_targets(self):
+        busy, quiet = routing.Target(), routing.Target()
+        started = []
+
+        def job(name):
+            return lambda: started.append(name) or name
+
+        jobs = [(busy, job("busy-" + str(index))) for index in range(3)] + [(quiet, job("quiet-0"))]
+        futures = routing.run_fairly(jobs, max_workers=1)
+
+        # The quiet target's event runs second rather than after every event of the busy target
+        assert started == ["busy-0", "quiet-0", "busy-1", "busy-2"]
+        assert [future.result() for future in futures] == ["busy-0", "busy-1", "busy-2", "quiet-0"]
+
+    def test_limits_concurrency_per_target(self):
+        limited, other = routing.Target(max_concurrency=1), routing.Target()
+        lock = threading.Lock()
+        running = {"limited": 0, "peak": 0}
+
+        def limited_job():
+            with lock:
+                running["limited"] += 1
+                running["peak"] = max(running["peak"], running["limited"])
+            threading.Event().wait(0.01)
+            with lock:
+                running["limited"] -= 1
+
+        futures = routing.run_fairly([(limited, limited_job) for _ in range(4)] + [(other, lambda: None)], max_workers=4)
+
+        assert all(future.exception() is None for future in futures)
+        assert running["peak"] == 1
@@ -0,0 +1,65 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from artifact_backup import counters
+from artifact_backup import sessions
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Returns 503 for the first request and the artifact afterwards"""
+
+    requests_served = 0
+
+    def do_GET(self):
+        FlakyHandler.requests_served += 1
+        if FlakyHandler.requests_served == 1:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", "3")
+        self.end_headers()
+        self.wfile.write(b"jar")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SessionsTest(unittest.TestCase):
+
+    def test_create_session_retries_unavailable(self):
+        FlakyHandler.requests_served = 0
+        server = HTTPServer(("127.0.0.1", 0), FlakyHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            session = sessions.create_session(pool_size=2, max_retries=2, backoff_factor=0)
+            with counters.counting() as asset_counters:
+                response = session.get("http://127.0.0.1:%d/artifact.jar" % server.server_port, timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert response.status_code == 200
+        assert response.content == b"jar"
+        assert FlakyHandler.requests_served == 2
+        # The 503 that urllib3 retried is counted for the asset
+        assert asset_counters.retry_attempts == 1
+
+    def test_create_session_times_https_connections(self):
+        session = sessions.create_session(pool_size=4, max_retries=0, backoff_factor=0)
+        adapter = session.get_adapter("https://example.com")
+
+        assert adapter.poolmanager.pool_classes_by_scheme["https"] is sessions.TimedHTTPSConnectionPool
+        assert adapter.max_retries.status_forcelist == sessions.RETRY_STATUS_CODES
+
+    def test_handshake_stats_default_to_zero_per_thread(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append((sessions.handshake_seconds(), sessions.connections_opened())))
+        thread.start()
+        thread.join()
+
+        assert results == [(0.0, 0)]
@@ -0,0 +1,44 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from artifact_backup import storage
+
+
+class StorageTest(unittest.TestCase):
+
+    def test_is_content_addressed(self):
+        assert not storage.is_content_addressed()
+        with mock.patch.dict(os.environ, {"STORAGE_LAYOUT": "content"}):
+            assert storage.is_content_addressed()
+
+    def test_pointer(self):
+        blob_key = storage.get_blob_key("ABC")
+        assert blob_key == ".blobs/sha256/abc"
+        assert json.loads(storage.get_pointer(blob_key, "ABC", 3)) == {"blob": blob_key, "sha256": "abc", "size": 3}
+        assert storage.get_pointer_metadata({"sha256": "abc"}, blob_key) == {"sha256": "abc", "blob-key": blob_key}
+
+    def test_resolve_backup_key(self):
+        s3_client = mock.MagicMock()
+        s3_client.head_object.return_value = {"Metadata": {"blob-key": ".blobs/sha256/abc"}}
+        assert storage.resolve_backup_key(s3_client, "bucket", "domain/app.jar") == ".blobs/sha256/abc"
+
+        # Backups stored with the path layout hold their own content
+        s3_client.head_object.return_value = {"Metadata": {"sha256": "abc"}}
+        assert storage.resolve_backup_key(s3_client, "bucket", "domain/app.jar") == "domain/app.jar"
+
+    def test_restore_backup(self):
+        s3_client = mock.MagicMock()
+        s3_client.head_object.return_value = {"Metadata": {"blob-key": ".blobs/sha256/abc"}}
+        s3_client.get_object.return_value = {"Body": io.BytesIO(b"content")}
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.jar")
+            storage.restore_backup(s3_client, "bucket", "domain/app.jar", path)
+            with open(path, "rb") as restored:
+                assert restored.read() == b"content"
+
+        s3_client.get_object.assert_called_once_with(Bucket="bucket", Key=".blobs/sha256/abc")
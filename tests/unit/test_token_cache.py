@@ -0,0 +1,44 @@
+import unittest
+
+from artifact_backup.token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(refresh_margin_seconds=60, clock=self.clock)
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return "token-" + str(self.fetches), self.clock.now + 900
+
+    def test_get_or_fetch_reuses_token(self):
+        assert self.cache.get_or_fetch("domain", self.fetch) == "token-1"
+        self.clock.now += 600
+        assert self.cache.get_or_fetch("domain", self.fetch) == "token-1"
+        assert self.fetches == 1
+
+    def test_get_or_fetch_refreshes_ahead_of_expiry(self):
+        self.cache.get_or_fetch("domain", self.fetch)
+        self.clock.now += 841
+        assert self.cache.get_or_fetch("domain", self.fetch) == "token-2"
+
+    def test_get_or_fetch_is_keyed(self):
+        self.cache.get_or_fetch(("domain", "owner-a"), self.fetch)
+        assert self.cache.get_or_fetch(("domain", "owner-b"), self.fetch) == "token-2"
+
+    def test_evict(self):
+        self.cache.get_or_fetch("domain", self.fetch)
+        self.cache.evict("domain")
+        self.cache.evict("missing")
+        assert self.cache.get_or_fetch("domain", self.fetch) == "token-2"
@@ -0,0 +1,178 @@
+import unittest
+from unittest import mock
+
+import pytest
+
+from artifact_backup import transfer
+
+
+class TransferTest(unittest.TestCase):
+
+    def test_read_parts(self):
+        parts = list(transfer.read_parts(iter([b"ab", b"", b"cde", b"f"]), 4))
+        assert parts == [b"abcd", b"ef"]
+
+    def test_read_parts_exact_multiple(self):
+        parts = list(transfer.read_parts(iter([b"abcd", b"efgh"]), 4))
+        assert parts == [b"abcd", b"efgh"]
+
+    def test_read_parts_empty(self):
+        assert list(transfer.read_parts(iter(()), 4)) == []
+
+    def test_multipart_upload(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part.side_effect = [{"ETag": "a"}, {"ETag": "b"}]
+        s3_client.complete_multipart_upload.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        ret = transfer.multipart_upload(s3_client, iter([b"1", b"2"]), "bucket", "key")
+
+        assert ret["ResponseMetadata"]["HTTPStatusCode"] == 200
+        s3_client.complete_multipart_upload.assert_called_once_with(
+            Bucket="bucket",
+            Key="key",
+            MultipartUpload={"Parts": [{"ETag": "a", "PartNumber": 1}, {"ETag": "b", "PartNumber": 2}]},
+            UploadId="upload-id",
+        )
+
+    def test_multipart_upload_aborts_on_failure(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part.side_effect = ValueError("part failed")
+
+        with pytest.raises(ValueError):
+            transfer.multipart_upload(s3_client, iter([b"1"]), "bucket", "key")
+
+        s3_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", UploadId="upload-id")
+
+    def test_multipart_upload_with_checksums(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part.return_value = {"ETag": "a"}
+
+        transfer.multipart_upload(s3_client, iter([b"abcdef"]), "bucket", "key", checksums=True)
+
+        s3_client.create_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", Metadata={}, ChecksumAlgorithm="SHA256")
+        assert s3_client.upload_part.call_args.kwargs["ChecksumSHA256"] == "vvV+x/U6bUC+tkCngKY5yDvCmsipgW8fxsXG3Nk8RyE="
+        parts = s3_client.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+        assert parts == [{"ETag": "a", "PartNumber": 1, "ChecksumSHA256": "vvV+x/U6bUC+tkCngKY5yDvCmsipgW8fxsXG3Nk8RyE="}]
+
+    def test_multipart_upload_with_tagging(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part.return_value = {"ETag": "a"}
+
+        transfer.multipart_upload(s3_client, iter([b"abcdef"]), "bucket", "key", tagging="package-version-state=Published")
+
+        s3_client.create_multipart_upload.assert_called_once_with(
+            Bucket="bucket", Key="key", Metadata={}, Tagging="package-version-state=Published"
+        )
+
+    def test_multipart_copy(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part_copy.side_effect = [{"CopyPartResult": {"ETag": "a"}}, {"CopyPartResult": {"ETag": "b"}}]
+
+        transfer.multipart_copy(s3_client, "source-bucket", "source-key", "bucket", "key", 10, 6)
+
+        ranges = [call.kwargs["CopySourceRange"] for call in s3_client.upload_part_copy.call_args_list]
+        assert ranges == ["bytes=0-5", "bytes=6-9"]
+        s3_client.complete_multipart_upload.assert_called_once_with(
+            Bucket="bucket",
+            Key="key",
+            MultipartUpload={"Parts": [{"ETag": "a", "PartNumber": 1}, {"ETag": "b", "PartNumber": 2}]},
+            UploadId="upload-id",
+        )
+
+    def test_multipart_copy_aborts_on_failure(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part_copy.side_effect = ValueError("part failed")
+
+        with pytest.raises(ValueError):
+            transfer.multipart_copy(s3_client, "source-bucket", "source-key", "bucket", "key", 10, 6)
+
+        s3_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", UploadId="upload-id")
+
+    def test_choose_part_size(self):
+        assert transfer.choose_part_size(None) == transfer.DEFAULT_PART_SIZE
+        assert transfer.choose_part_size(100 * 1024 * 1024) == transfer.DEFAULT_PART_SIZE
+        # 200 GiB only fits into 10,000 parts of at least 21 MiB
+        part_size = transfer.choose_part_size(200 * 1024 * 1024 * 1024)
+        assert part_size == 21 * 1024 * 1024
+        assert part_size * transfer.MAX_PARTS >= 200 * 1024 * 1024 * 1024
+
+    def test_choose_concurrency(self):
+        part_size = 8 * 1024 * 1024
+        assert transfer.choose_concurrency(part_size, 256 * 1024 * 1024, 2, 8) == 8
+        assert transfer.choose_concurrency(part_size, 24 * 1024 * 1024, 2, 8) == 3
+        assert transfer.choose_concurrency(part_size, 256 * 1024 * 1024, 1, 8) == 4
+        assert transfer.choose_concurrency(part_size, 1024, 2, 8) == 1
+
+    def test_multipart_upload_concurrent(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+        s3_client.upload_part.side_effect = lambda **kwargs: {"ETag": kwargs["Body"].decode()}
+
+        transfer.multipart_upload(s3_client, iter([b"a", b"b", b"c", b"d", b"e"]), "bucket", "key", concurrency=3)
+
+        parts = s3_client.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+        assert parts == [{"ETag": etag, "PartNumber": number} for number, etag in enumerate("abcde", start=1)]
+
+    def test_multipart_upload_concurrent_aborts_on_failure(self):
+        s3_client = mock.MagicMock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+
+        def upload_part(**kwargs):
+            if kwargs["PartNumber"] == 2:
+                raise ValueError("part failed")
+            return {"ETag": "etag"}
+
+        s3_client.upload_part.side_effect = upload_part
+
+        with pytest.raises(ValueError):
+            transfer.multipart_upload(s3_client, iter([b"a", b"b", b"c"]), "bucket", "key", concurrency=2)
+
+        s3_client.complete_multipart_upload.assert_not_called()
+        s3_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", UploadId="upload-id")
+
+    def test_tee(self):
+        read = []
+
+        def source():
+            for chunk in (b"ab", b"cd", b"ef"):
+                read.append(chunk)
+                yield chunk
+
+        futures = transfer.tee(source(), [b"".join, lambda chunks: len(list(chunks))], max_buffered_chunks=1)
+
+        # Both consumers see every chunk while the source is read once
+        assert read == [b"ab", b"cd", b"ef"]
+        assert [future.result() for future in futures] == [b"abcdef", 3]
+
+    def test_tee_drops_failed_consumer(self):
+        def failing_consumer(chunks):
+            next(chunks)
+            raise ValueError("replica unavailable")
+
+        futures = transfer.tee(iter([b"a"] * 20), [b"".join, failing_consumer], max_buffered_chunks=1)
+
+        assert futures[0].result() == b"a" * 20
+        assert isinstance(futures[1].exception(), ValueError)
+
+    def test_tee_source_failure(self):
+        def source():
+            yield b"a"
+            raise IOError("download failed")
+
+        consumed = []
+
+        def consumer(chunks):
+            for chunk in chunks:
+                consumed.append(chunk)
+
+        with pytest.raises(IOError):
+            transfer.tee(source(), [consumer])
+
+        # The consumers see the error too, so an upload is aborted rather than completed with partial content
+        assert consumed == [b"a"]